@@ -1,25 +1,80 @@
-from typing import List, Dict, Optional
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
+from pydantic import BaseModel
 from schemas import AnalysisReport, RedFlag
 import os
-from google import genai
-from google.genai import types
-from db import VectorStore
+from google.genai import errors, types
+from db import EMBEDDING_MODEL, get_genai_client, get_vector_store
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+from quote_locator import quote_words
+from rate_limit import Coalescer, get_rate_limiter, interactive, is_rate_limited, is_retryable
+from report_cache import get_flag_cache, get_report_cache
+from sessions import ChatSession, DocumentCache, DocumentCacheRegistry, SessionStore
+from telemetry import CHAT_RETRIEVAL, LLM_CALLS, LLM_COALESCED, LLM_RETRIES, record_llm_usage, span
+import hashlib
 import json
 import asyncio
+import random
+import time
+
+# Bump whenever a prompt template changes so cached reports are not reused
+PROMPT_VERSION = "3"
+
+# Hybrid retrieval ranks this many times n_results candidates per side before fusing
+FUSION_CANDIDATES = 2
+
+CHAT_SYSTEM_INSTRUCTION = (
+    "You answer questions about a legal document for its reader. "
+    "Answer the user's question based strictly on the document context."
+)
+
+def _serialize_contents(contents) -> str:
+    if isinstance(contents, list):
+        return "\n".join(_serialize_contents(c) for c in contents)
+    if isinstance(contents, BaseModel):
+        return contents.model_dump_json(exclude_none=True)
+    return str(contents)
+
+
+def _request_key(model: str, contents, config: types.GenerateContentConfig) -> str:
+    """Identity of a generate_content call, for coalescing identical calls in flight."""
+    h = hashlib.sha256()
+    for part in (model, _serialize_contents(contents),
+                 config.model_dump_json(exclude={"response_schema"}, exclude_none=True),
+                 repr(config.response_schema)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+class _FlagOutput(BaseModel):
+    """Shape of one single-pass flag as the model returns it (RedFlag minus server-side fields)."""
+    category: str
+    risk_level: str
+    description: str
+    quote: str
+
+
+def _page_start(meta: dict) -> int:
+    return meta.get("page_start", meta.get("page", 0))
+
 
 class LegalAgent:
     def __init__(self):
-        # Initialize Gemini 3 Client
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
+        # Initialize Gemini 3 Client (shared with the vector store's embedding function)
+        try:
+            self.client = get_genai_client()
+        except ValueError:
             print("WARNING: GOOGLE_API_KEY not found. Agent will fail if called.")
             self.client = None
-        else:
-            self.client = genai.Client(api_key=api_key)
             
         # Using gemini-3-flash-preview as requested
         self.model_name = "gemini-3-flash-preview"
         
+        # Fan-out is bounded by the model's shared limiter (LLM_MAX_CONCURRENCY and quotas, see rate_limit.py)
+        self.call_timeout = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "120"))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
+        self.retry_base_delay = float(os.getenv("LLM_RETRY_BASE_DELAY_SECONDS", "1.0"))
+        self._generating = Coalescer()
+
         self.categories = [
             "Data Privacy & Selling",
             "Hidden Fees & Subscriptions",
@@ -27,32 +82,222 @@ class LegalAgent:
             "Account Termination",
             "IP Rights & Content Ownership"
         ]
+        # "per_category": one LLM call per category (default).
+        # "single_pass": merged, deduplicated context and one structured call for all categories.
+        self.audit_mode = os.getenv("AUDIT_MODE", "per_category")
+        # Section headings each category's clauses usually sit under; a progressive
+        # ingest of a large document indexes those sections first (see progressive.py)
+        self.category_headings = {
+            "Data Privacy & Selling": ["privacy", "data", "personal information", "cookies"],
+            "Hidden Fees & Subscriptions": ["fees", "payment", "billing", "subscription", "pricing", "renewal",
+                                            "refunds", "charges"],
+            "Liability & Arbitration": ["liability", "arbitration", "disputes", "indemnification", "warranties",
+                                        "governing law", "class action"],
+            "Account Termination": ["termination", "suspension", "cancellation"],
+            "IP Rights & Content Ownership": ["intellectual property", "license", "content", "ownership",
+                                              "copyright", "trademarks"],
+        }
+        self.audit_context_token_budget = int(os.getenv("AUDIT_CONTEXT_TOKEN_BUDGET", "4000"))
+        self.audit_results_per_category = int(os.getenv("AUDIT_RESULTS_PER_CATEGORY", "5"))
+        # "hybrid": vector and BM25 keyword rankings fused by reciprocal rank; "vector": vector only
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid")
+        # A chat query of at most this many terms, all found in one chunk (IDF-weighted share of
+        # terms >= the confidence), is answered from the keyword index without an embedding call
+        self.lexical_fast_path_max_terms = int(os.getenv("LEXICAL_FAST_PATH_MAX_TERMS", "4"))
+        self.lexical_fast_path_confidence = float(os.getenv("LEXICAL_FAST_PATH_MIN_CONFIDENCE", "1.0"))
+        # Query vectors for the categories never change; computed once on first use
+        self._category_embeddings: Optional[List[List[float]]] = None
+
+        # Identical analyses running right now, keyed by report cache key
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+        # Chat sessions: server-side turns, retrieval reuse and model-side document caching
+        self.sessions = SessionStore()
+        self.document_caches = DocumentCacheRegistry()
+        # Cleanup of evicted sessions, kept referenced until it finishes
+        self._release_tasks: set = set()
+        self.chat_max_turns = int(os.getenv("CHAT_MAX_TURNS", "20"))
+        self.similar_query_threshold = float(os.getenv("CHAT_SIMILAR_QUERY_THRESHOLD", "0.95"))
+        self.context_cache_min_tokens = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "1024"))
+        self.context_cache_max_tokens = int(os.getenv("CONTEXT_CACHE_MAX_TOKENS", "200000"))
+
+    def prepare_category_embeddings(self) -> List[List[float]]:
+        """
+        Embeds the fixed category queries once per process. The vectors also land
+        in the on-disk embedding cache, so restarts don't pay for them again.
+        """
+        if self._category_embeddings is None:
+            self._category_embeddings = get_vector_store().embed(self.categories)
+        return self._category_embeddings
+
+    async def prime_connections(self):
+        """
+        One model metadata lookup on each client: the sync one (embeddings) and
+        the async one (generation), so the first real call reuses an open
+        HTTPS connection instead of paying DNS and TLS setup.
+        """
+        if self.client is None:
+            return
+        await asyncio.gather(
+            asyncio.to_thread(self.client.models.get, model=EMBEDDING_MODEL),
+            self.client.aio.models.get(model=self.model_name)
+        )
+
+    @staticmethod
+    def _format_context(docs: List[str], metadatas: List[dict], pages: bool = True) -> str:
+        """
+        Chunks separated by blank lines, each preceded by its [Page X] tag. Audit
+        prompts pass pages=False: findings are placed on pages by their quotes
+        (see _place_quotes), so the tags would only cost tokens.
+        """
+        if not pages:
+            return "\n\n".join(docs)
+        context_parts = []
+        for doc, meta in zip(docs, metadatas):
+            page_num = meta.get('page_start', meta.get('page', '?'))
+            page_end = meta.get('page_end', page_num)
+            if meta.get('pages'):
+                # Text repeated across the document, stored once (see dedup.py)
+                context_parts.append(f"[Pages {meta['pages'].replace(',', ', ')}] {doc}")
+            elif page_end != page_num:
+                context_parts.append(f"[Pages {page_num}-{page_end}] {doc}")
+            else:
+                context_parts.append(f"[Page {page_num}] {doc}")
+        return "\n\n".join(context_parts)
+
+    def _retrieve(self, document_id: str, queries: List[str], query_vectors: List[List[float]],
+                  n_results: int) -> List[Tuple[List[str], List[dict]]]:
+        """
+        One (documents, metadatas) ranking per query. In hybrid mode each query's
+        vector ranking is fused with the BM25 ranking of its text.
+        """
+        db = get_vector_store()
+        hybrid = self.retrieval_mode == "hybrid"
+        depth = n_results * FUSION_CANDIDATES if hybrid else n_results
+        with span("vector_query", queries=len(queries)):
+            vector_results = db.query_many(document_id, query_vectors, n_results=depth)
+        if not hybrid:
+            return vector_results
+        with span("lexical_query", queries=len(queries)):
+            index = db.lexical_index(document_id)
+            lexical_results = [index.search(query, depth) for query in queries]
+        return [
+            reciprocal_rank_fusion([vector, lexical], n_results)
+            for vector, lexical in zip(vector_results, lexical_results)
+        ]
 
-    def _query_db(self, category: str) -> str:
+    def _query_db(self, document_id: str, category: str) -> str:
         """Retrieve relevant context for a category with page numbers."""
         # Query DB for context
         try:
-            db = VectorStore()
-            docs, metadatas = db.query(category, n_results=5)
+            db = get_vector_store()
+            docs, metadatas = self._retrieve(document_id, [category], db.embed([category]), n_results=5)[0]
             if not docs:
                 return ""
-            
-            context_parts = []
-            for doc, meta in zip(docs, metadatas):
-                page_num = meta.get('page', '?')
-                context_parts.append(f"[Page {page_num}] {doc}")
-                
-            return "\n\n".join(context_parts)
+            return self._format_context(docs, metadatas)
         except Exception as e:
             print(f"DB Query Error: {e}")
             return ""
 
-    async def _analyze_category_gemini3(self, category: str, context: str) -> List[RedFlag]:
+    def _query_categories(self, document_id: str) -> Dict[str, Tuple[List[str], List[dict]]]:
+        """
+        Retrieves (documents, metadatas) for every category in one vector-store
+        call using the precomputed category vectors, so an audit makes no
+        embedding calls.
+        """
+        results = self._retrieve(document_id, self.categories, self.prepare_category_embeddings(), n_results=5)
+        return dict(zip(self.categories, results))
+
+    def _query_merged_context(self, document_id: str) -> Tuple[List[str], List[dict]]:
+        """
+        Retrieves for every category at once, then merges the results rank by
+        rank (every category's best chunk first), dropping chunks another
+        category already pulled in, until the token budget is spent.
+        """
+        results = self._retrieve(
+            document_id, self.categories, self.prepare_category_embeddings(),
+            n_results=self.audit_results_per_category
+        )
+
+        selected, seen, used_tokens = [], set(), 0
+        for rank in range(self.audit_results_per_category):
+            for docs, metadatas in results:
+                if rank >= len(docs) or docs[rank] in seen:
+                    continue
+                tokens = len(docs[rank]) // 4
+                if used_tokens + tokens > self.audit_context_token_budget:
+                    continue
+                seen.add(docs[rank])
+                selected.append((docs[rank], metadatas[rank]))
+                used_tokens += tokens
+
+        # Document order reads better than retrieval order
+        selected.sort(key=lambda item: (_page_start(item[1]), item[1].get("page_end", 0)))
+        return [doc for doc, _ in selected], [meta for _, meta in selected]
+
+    async def _generate(self, contents, config: types.GenerateContentConfig,
+                        operation: str = "generate", **span_attributes):
+        """
+        Non-blocking generate_content. A call identical to one already in flight
+        (same model, contents and config) waits for that call's response
+        instead of sending its own.
+        """
+        key = _request_key(self.model_name, contents, config)
+        if key in self._generating:
+            LLM_COALESCED.labels(operation=operation).inc()
+        return await self._generating.run(
+            key, lambda: self._generate_uncoalesced(contents, config, operation, **span_attributes)
+        )
+
+    async def _generate_uncoalesced(self, contents, config: types.GenerateContentConfig,
+                                    operation: str, **span_attributes):
+        """
+        generate_content through the model's shared limiter, with a per-call
+        timeout and retries on 429/5xx. A 429 shrinks the limiter's window and
+        sets its cool-down, which paces the retry; other failures back off with
+        jitter. Each call is one "llm.<operation>" span carrying its token
+        counts and retries.
+        """
+        limiter = get_rate_limiter("llm", self.model_name)
+        estimated_tokens = len(_serialize_contents(contents)) // 4
+        with span(f"llm.{operation}", retries=0, **span_attributes) as attributes:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with limiter.slot(estimated_tokens) as slot:
+                        response = await asyncio.wait_for(
+                            self.client.aio.models.generate_content(
+                                model=self.model_name,
+                                contents=contents,
+                                config=config
+                            ),
+                            timeout=self.call_timeout
+                        )
+                        if response.usage_metadata and response.usage_metadata.total_token_count:
+                            slot.used_tokens(response.usage_metadata.total_token_count)
+                    LLM_CALLS.labels(operation=operation, outcome="ok").inc()
+                    record_llm_usage(operation, response.usage_metadata, attributes)
+                    return response
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        LLM_CALLS.labels(operation=operation, outcome="error").inc()
+                        raise
+                    LLM_RETRIES.labels(operation=operation).inc()
+                    attributes["retries"] += 1
+                    if is_rate_limited(e):
+                        print("Gemini call rate limited, retrying after cool-down")
+                        continue
+                    delay = self.retry_base_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+                    print(f"Gemini call failed ({e}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+    async def _request_category_flags(self, category: str, context: str) -> List[RedFlag]:
         """
         Uses Gemini 3 Flash with thinking_level='high' to deeply analyze clauses.
+        Raises when the call fails, so the category is reported as failed
+        rather than as free of red flags.
         """
         prompt = f"""
-        Context Clauses (with Page Numbers):
+        Context Clauses:
         {context}
         
         Task:
@@ -64,79 +309,384 @@ class LegalAgent:
             {{
                 "risk_level": "High" | "Medium" | "Low",
                 "description": "Brief explanation of the risk",
-                "quote": "Direct quote from the text verifying this risk",
-                "page_number": int (Extract the page number from the [Page X] tag preceding the quote. Return null if unclear.)
+                "quote": "Direct quote from the text verifying this risk"
             }}
         ]
         """
         
-        try:
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    thinking_config=types.ThinkingConfig(thinking_level="high")
-                )
-            )
-            
-            # Simple cleanup for JSON parsing just in case
-            text = response.text.strip()
-            if text.startswith("```json"):
-                text = text[7:-3]
-            data = json.loads(text)
-            
-            red_flags = []
-            for item in data:
-                red_flags.append(RedFlag(
-                    category=category,
-                    risk_level=item.get("risk_level", "Low"),
-                    description=item.get("description", "Unknown risk"),
-                    quote=item.get("quote", ""),
-                    page_number=item.get("page_number")
-                ))
-            return red_flags
-        except Exception as e:
-            print(f"Error analyzing {category}: {e}")
-            return []
+        response = await self._generate(
+            prompt,
+            types.GenerateContentConfig(
+                response_mime_type="application/json",
+                thinking_config=types.ThinkingConfig(thinking_level="high")
+            ),
+            operation="category",
+            category=category
+        )
+        
+        # Simple cleanup for JSON parsing just in case
+        text = response.text.strip()
+        if text.startswith("```json"):
+            text = text[7:-3]
+        data = json.loads(text)
+        
+        red_flags = []
+        for item in data:
+            red_flags.append(RedFlag(
+                category=category,
+                risk_level=item.get("risk_level", "Low"),
+                description=item.get("description", "Unknown risk"),
+                quote=item.get("quote", "")
+            ))
+        return red_flags
 
-    async def analyze_document(self, file_path: str) -> AnalysisReport:
+    async def _request_all_flags(self, context: str) -> List[RedFlag]:
         """
-        Main agent loop:
-        1. Query DB for each category.
-        2. Analyze context with Gemini 3.
-        3. Aggregate results.
+        Single-pass audit: flags for every category from one structured call.
+        The response schema is enforced by the SDK, so no JSON clean-up is needed.
         """
-        all_red_flags = []
-        
-        # Parallel execution would be faster, but let's keep it simple for now
-        # Actually, let's use asyncio.gather for speed since LLM calls are I/O bound
-        tasks = []
-        for category in self.categories:
-            context = self._query_db(category)
-            if context:
-                tasks.append(self._analyze_category_gemini3(category, context))
-        
-        results = await asyncio.gather(*tasks)
-        for flags in results:
-            all_red_flags.extend(flags)
-        
+        category_lines = "\n".join(f"- {category}" for category in self.categories)
+        prompt = f"""
+        Context Clauses:
+        {context}
+
+        Task:
+        Identify any "Red Flags" in the above clauses for each of these categories:
+        {category_lines}
+        A "Red Flag" is a clause that is predatory, unfair, or dangerous to the user.
+        A clause may be flagged under more than one category if it is relevant to each.
+
+        For every red flag give:
+        - category: exactly one of the category names listed above
+        - risk_level: "High", "Medium" or "Low"
+        - description: brief explanation of the risk
+        - quote: direct quote from the text verifying this risk
+        """
+
+        response = await self._generate(
+            prompt,
+            types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=list[_FlagOutput],
+                thinking_config=types.ThinkingConfig(thinking_level="high")
+            ),
+            operation="audit"
+        )
+        flags = response.parsed
+        if flags is None:
+            flags = [_FlagOutput.model_validate(item) for item in json.loads(response.text)]
+
+        by_name = {category.lower(): category for category in self.categories}
+        red_flags = []
+        for flag in flags:
+            category = by_name.get(flag.category.strip().lower())
+            if category is None:
+                continue
+            red_flags.append(RedFlag(**flag.model_dump(exclude={"category"}), category=category))
+        return red_flags
+
+    def _flag_cache_key(self, scope: str, docs: List[str]) -> str:
+        h = hashlib.sha256()
+        for part in (self.model_name, PROMPT_VERSION, scope, *docs):
+            h.update(part.encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    @staticmethod
+    def _place_quotes(document_id: str, flags: List[RedFlag], docs: List[str], metadatas: List[dict]):
+        """
+        Sets each flag's page and offsets from where its quote is in the
+        document (quote_match "none" when it is nowhere, likely invented), and
+        is_new from the context chunk it came from. Done on every run, cached
+        flags included, since unchanged text may have moved pages.
+        """
+        locator = get_vector_store().quote_locator(document_id)
+        normalized_docs = [f" {' '.join(quote_words(doc))} " for doc in docs]
+        for flag in flags:
+            words = " ".join(quote_words(flag.quote)[:12])
+            chunk = next((i for i, doc in enumerate(normalized_docs) if words and f" {words} " in doc), None)
+            hint_pages = set()
+            if chunk is not None:
+                meta = metadatas[chunk]
+                hint_pages.update(range(_page_start(meta), meta.get("page_end", _page_start(meta)) + 1))
+                hint_pages.update(int(page) for page in meta.get("pages", "").split(",") if page)
+                flag.is_new = bool(meta.get("is_new"))
+
+            match = locator.locate(flag.quote, hint_pages)
+            if match is None:
+                flag.quote_match = "none"
+                continue
+            flag.page_number, flag.page_end = match["page"], match["page_end"]
+            flag.quote_start, flag.quote_end = match["start"], match["end"]
+            flag.quote_match = match["match"]
+            if chunk is None:
+                # Reworded quote: the context chunk on the matched page
+                chunk = next((i for i, meta in enumerate(metadatas)
+                              if _page_start(meta) <= match["page"] <= meta.get("page_end", _page_start(meta))), None)
+                if chunk is not None:
+                    flag.is_new = bool(metadatas[chunk].get("is_new"))
+
+    async def _cached_flags(self, document_id: str, scope: str, docs: List[str], metadatas: List[dict],
+                            analyze: Callable[[str], Awaitable[List[RedFlag]]]) -> Tuple[List[RedFlag], bool]:
+        """
+        Runs `analyze` on the formatted context unless the same chunks were
+        analyzed before (e.g. in the previous version of the document), in
+        which case the stored flags are reused. Either way the flags are then
+        placed in this document by _place_quotes.
+        Returns (flags, reused). A failed analysis raises and is not cached,
+        so the next run retries it.
+        """
+        cache = get_flag_cache()
+        key = self._flag_cache_key(scope, docs)
+        entries = await asyncio.to_thread(cache.get, key) if cache is not None else None
+        reused = entries is not None
+
+        if entries is None:
+            flags = await analyze(self._format_context(docs, metadatas, pages=False))
+            entries = [{"flag": flag.model_dump(include={"category", "risk_level", "description", "quote"})}
+                       for flag in flags]
+            if cache is not None:
+                await asyncio.to_thread(cache.put, key, entries)
+
+        flags = [RedFlag(**entry["flag"]) for entry in entries]
+        await asyncio.to_thread(self._place_quotes, document_id, flags, docs, metadatas)
+        return flags, reused
+
+    @staticmethod
+    def _score(red_flags: List[RedFlag]) -> int:
         # Calculate score (100 - penalties)
         score = 100
-        for flag in all_red_flags:
+        for flag in red_flags:
             if flag.risk_level == "High": score -= 5
             elif flag.risk_level == "Medium": score -= 2
             elif flag.risk_level == "Low": score -= 1
-        score = max(0, score)
+        return max(0, score)
+
+    def report_cache_key(self, text_hash: str) -> str:
+        h = hashlib.sha256()
+        for part in (text_hash, self.model_name, "\n".join(self.categories), PROMPT_VERSION, self.audit_mode):
+            h.update(part.encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    async def iter_analysis(self, document_id: str, text_hash: Optional[str] = None,
+                            use_cache: bool = True) -> AsyncIterator[dict]:
+        """
+        Cached, coalesced wrapper around _iter_fresh_analysis.
+        With a text_hash, a cached report is returned straight away (unless
+        use_cache is False), and a request identical to one already running
+        waits for that analysis instead of starting its own.
+
+        The text hash comes from ingest, so both checks run after it: a cache
+        hit saves the model calls, not parsing or embedding. The report is
+        not consulted before ingest because /chat needs the document indexed.
+        Identical uploads skip re-ingesting through ingest_document itself.
+        """
+        if not text_hash:
+            async for event in self._iter_fresh_analysis(document_id):
+                yield event
+            return
+
+        key = self.report_cache_key(text_hash)
+        cache = get_report_cache()
+        if use_cache and cache is not None:
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached is not None:
+                yield {"event": "report", "report": cached.model_copy(update={"document_id": document_id, "cached": True})}
+                return
+
+        running = self._in_flight.get(key)
+        if running is not None:
+            try:
+                report = await asyncio.shield(running)
+                yield {"event": "report", "report": report.model_copy(update={"document_id": document_id})}
+                return
+            except asyncio.CancelledError:
+                if not running.cancelled():
+                    raise
+                # The leader went away (e.g. its client disconnected); run our own
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            async for event in self._iter_fresh_analysis(document_id):
+                if event["event"] == "report":
+                    future.set_result(event["report"])
+                    # An incomplete report is returned but not cached, so the next request retries
+                    if cache is not None and not event["report"].failed_categories:
+                        await asyncio.to_thread(cache.put, key, event["report"])
+                yield event
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+                future.exception()  # Mark retrieved; waiters re-raise it themselves
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    async def iter_partial_analysis(self, document_id: str, completeness: float) -> AsyncIterator[dict]:
+        """
+        One round of a progressive analysis (see progressive.py) on a document
+        whose index holds `completeness` of its chunks so far: category events,
+        then a "partial_report" instead of the summary and report. Flags go
+        through the flag cache, so a later round (or the final analysis)
+        re-asks the model only for categories whose context changed.
+        """
+        async for event in self._iter_fresh_analysis(document_id, completeness):
+            yield event
+
+    async def _iter_fresh_analysis(self, document_id: str, completeness: float = 1.0) -> AsyncIterator[dict]:
+        """
+        Streaming form of the agent loop. Yields events as they happen:
+        - {"event": "category", ...} with each category's red flags as soon as its
+          LLM call finishes, plus the running overall_risk_score
+        - {"event": "summary", "summary": ...}
+        - {"event": "report", "report": AnalysisReport} once everything is done
+        """
+        if self.audit_mode == "single_pass":
+            async for event in self._iter_single_pass_analysis(document_id, completeness):
+                yield event
+            return
+
+        # One batched retrieval off the event loop, then fan out all categories
+        # concurrently on the async client
+        contexts = await asyncio.to_thread(self._query_categories, document_id)
+
+        async def run(category: str):
+            docs, metadatas = contexts[category]
+            try:
+                flags, reused = await self._cached_flags(
+                    document_id, category, docs, metadatas,
+                    lambda context: self._request_category_flags(category, context)
+                )
+            except Exception as e:
+                print(f"Error analyzing {category}: {e}")
+                return category, [], False, str(e)
+            return category, flags, reused, None
+
+        tasks = [
+            asyncio.ensure_future(run(category))
+            for category in self.categories
+            if contexts.get(category) and contexts[category][0]
+        ]
+
+        flags_by_category: Dict[str, List[RedFlag]] = {}
+        failed_categories = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                category, flags, reused, error = await next_done
+                flags_by_category[category] = flags
+                if error is not None:
+                    failed_categories.append(category)
+                running_flags = [f for fs in flags_by_category.values() for f in fs]
+                yield {
+                    "event": "category",
+                    "category": category,
+                    "red_flags": flags,
+                    "overall_risk_score": self._score(running_flags),
+                    "completed": len(flags_by_category),
+                    "total": len(tasks),
+                    "reused": reused,
+                    "error": error,
+                    "completeness": completeness
+                }
+        finally:
+            # Client disconnected mid-stream: don't leave LLM calls running
+            for task in tasks:
+                task.cancel()
+
+        # Keep the report in category order regardless of completion order
+        all_red_flags = [f for category in self.categories for f in flags_by_category.get(category, [])]
+        failed_categories = [category for category in self.categories if category in failed_categories]
+        async for event in self._iter_summary_and_report(document_id, all_red_flags, failed_categories, completeness):
+            yield event
+
+    async def _iter_single_pass_analysis(self, document_id: str, completeness: float = 1.0) -> AsyncIterator[dict]:
+        """Same events as the per-category loop, from one merged-context LLM call."""
+        docs, metadatas = await asyncio.to_thread(self._query_merged_context, document_id)
+        flags, reused, error = [], False, None
+        if docs:
+            try:
+                flags, reused = await self._cached_flags(
+                    document_id, "single_pass:" + "\n".join(self.categories), docs, metadatas,
+                    self._request_all_flags
+                )
+            except Exception as e:
+                print(f"Error analyzing all categories: {e}")
+                error = str(e)
+
+        all_red_flags = []
+        for completed, category in enumerate(self.categories, start=1):
+            category_flags = [f for f in flags if f.category == category]
+            all_red_flags.extend(category_flags)
+            yield {
+                "event": "category",
+                "category": category,
+                "red_flags": category_flags,
+                "overall_risk_score": self._score(all_red_flags),
+                "completed": completed,
+                "total": len(self.categories),
+                "reused": reused,
+                "error": error,
+                "completeness": completeness
+            }
+        failed_categories = list(self.categories) if error is not None else []
+        async for event in self._iter_summary_and_report(document_id, all_red_flags, failed_categories, completeness):
+            yield event
+
+    async def _iter_summary_and_report(self, document_id: str, all_red_flags: List[RedFlag],
+                                       failed_categories: List[str], completeness: float = 1.0) -> AsyncIterator[dict]:
+        if completeness < 1.0:
+            # Progressive round: the executive summary is written once, for the final report
+            yield {
+                "event": "partial_report",
+                "report": AnalysisReport(
+                    summary=f"Preliminary results: {completeness:.0%} of the document analyzed so far.",
+                    red_flags=all_red_flags,
+                    overall_risk_score=self._score(all_red_flags),
+                    document_id=document_id,
+                    failed_categories=failed_categories,
+                    completeness=completeness
+                )
+            }
+            return
 
         # Generate Executive Summary
-        summary = await self._generate_executive_summary(all_red_flags)
+        if failed_categories and not all_red_flags:
+            summary = (f"Analysis incomplete: {len(failed_categories)} of {len(self.categories)} categories "
+                       f"could not be checked. Please re-run the analysis.")
+        else:
+            summary = await self._generate_executive_summary(all_red_flags)
+        yield {"event": "summary", "summary": summary}
 
-        return AnalysisReport(
-            summary=summary,
-            red_flags=all_red_flags,
-            overall_risk_score=score
-        )
+        yield {
+            "event": "report",
+            "report": AnalysisReport(
+                summary=summary,
+                red_flags=all_red_flags,
+                overall_risk_score=self._score(all_red_flags),
+                document_id=document_id,
+                failed_categories=failed_categories
+            )
+        }
+
+    async def analyze_document(self, document_id: str, text_hash: Optional[str] = None,
+                               use_cache: bool = True) -> AnalysisReport:
+        """
+        Main agent loop:
+        1. Query the document's collection for all categories in one batch.
+        2. Analyze context with Gemini 3.
+        3. Aggregate results.
+        Repeat uploads with the same text are served from the report cache.
+        """
+        report = None
+        async for event in self.iter_analysis(document_id, text_hash, use_cache):
+            if event["event"] == "report":
+                report = event["report"]
+        return report
 
     async def _generate_executive_summary(self, red_flags: List[RedFlag]) -> str:
         """
@@ -157,49 +707,209 @@ class LegalAgent:
         """
         
         try:
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=prompt,
-                config=types.GenerateContentConfig(
+            response = await self._generate(
+                prompt,
+                types.GenerateContentConfig(
                     thinking_config=types.ThinkingConfig(thinking_level="medium")
-                )
+                ),
+                operation="summary"
             )
             return response.text
         except Exception as e:
             print(f"Summary Generation Error: {e}")
             return f"Analysis complete. Found {len(red_flags)} issues that require your attention."
 
-    async def chat(self, query: str, history: List[dict]) -> str:
-        """
-        Handles chat with "Thought Signature" circulation for reasoning continuity.
+    def get_session(self, session_id: Optional[str], document_id: str,
+                    history: Optional[List[dict]] = None) -> ChatSession:
+        """Returns the caller's session for this document, or starts a new one."""
+        session = self.sessions.get(session_id) if session_id else None
+        if session is not None and session.document_id == document_id:
+            return session
+
+        for expired in self.sessions.evict_idle():
+            task = asyncio.ensure_future(self.release_session(expired))
+            self._release_tasks.add(task)
+            task.add_done_callback(self._release_tasks.discard)
+        session = ChatSession(document_id, history)
+        self.sessions.add(session)
+        return session
+
+    async def release_session(self, session: ChatSession):
+        """Drops the session's reference on the shared document cache, deleting it after the last one."""
+        cache, session.document_cache = session.document_cache, None
+        if cache is None or not self.document_caches.release(cache, session.session_id):
+            return
+        if cache.name and self.client is not None:
+            try:
+                await self.client.aio.caches.delete(name=cache.name)
+            except Exception as e:
+                print(f"Cached content cleanup error: {e}")
+            cache.name = None
+
+    async def close_sessions(self):
+        await asyncio.gather(*self._release_tasks, return_exceptions=True)
+        await asyncio.gather(*[self.release_session(s) for s in self.sessions.drain()])
+
+    async def _ensure_document_cache(self, session: ChatSession):
         """
-        context = self._query_db(query)
-        
-        # Construct history compatible with Gemini 3
-        # Note: In a real app, we'd persist the actual thought signatures from previous turns.
-        # Here, we mock the history structure but ensure we use the client correctly.
-        
-        # For simplicity in this demo, we'll treat each chat as a fresh turn with history context
-        # but in a real persistent session, we'd need to store the `thought_signature`.
-        
-        prompt = f"""
-        Context from document:
-        {context}
-        
-        User Query: {query}
-        
-        Answer the user's question based strictly on the document context.
+        Puts the whole document into the model's cached-content store once per
+        document and model, when it is within the configured size range, and
+        shares it with every session on that document. Later turns then
+        reference it by name and send only the new question. The cache's TTL
+        is extended as any of those conversations goes on (see
+        _extend_document_cache).
         """
-        
+        if session.document_cache is None:
+            session.document_cache = self.document_caches.acquire(
+                session.document_id, self.model_name, session.session_id)
+        cache = session.document_cache
+        async with cache.lock:
+            if cache.attempted:
+                await self._extend_document_cache(cache)
+            else:
+                cache.attempted = True
+                await self._create_document_cache(cache, session.document_id)
+
+    async def _create_document_cache(self, cache: DocumentCache, document_id: str):
+        docs, metadatas = await asyncio.to_thread(get_vector_store().get_all, document_id)
+        document_text = self._format_context(docs, metadatas)
+        approx_tokens = len(document_text) // 4
+        if not (self.context_cache_min_tokens <= approx_tokens <= self.context_cache_max_tokens):
+            return
         try:
-            response = self.client.models.generate_content(
+            created = await self.client.aio.caches.create(
                 model=self.model_name,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    thinking_config=types.ThinkingConfig(thinking_level="medium") # Speed/Quality balance for Chat
+                config=types.CreateCachedContentConfig(
+                    system_instruction=CHAT_SYSTEM_INSTRUCTION,
+                    contents=[types.Content(role="user", parts=[types.Part(text=f"Document:\n{document_text}")])],
+                    ttl=f"{int(self.sessions.ttl_seconds)}s"
                 )
             )
-            return response.text
+            cache.name = created.name
+            cache.expires_at = time.time() + self.sessions.ttl_seconds
         except Exception as e:
-            print(f"Chat Error: {e}")
-            return "I apologize, but I encountered an error while thinking about your question."
+            # Model or document not eligible for caching: fall back to retrieval
+            print(f"Context cache unavailable: {e}")
+
+    async def _extend_document_cache(self, cache: DocumentCache):
+        """
+        Pushes the cached content's expiry out by another session TTL once
+        half of it has passed, so an active conversation never references an
+        expired cache. A cache that can't be extended is dropped; its sessions
+        carry on with retrieval until a later turn creates it again.
+        """
+        if not cache.name:
+            return
+        ttl = self.sessions.ttl_seconds
+        if cache.expires_at - time.time() > ttl / 2:
+            return
+        try:
+            await self.client.aio.caches.update(
+                name=cache.name,
+                config=types.UpdateCachedContentConfig(ttl=f"{int(ttl)}s")
+            )
+            cache.expires_at = time.time() + ttl
+        except Exception as e:
+            print(f"Context cache expired, falling back to retrieval: {e}")
+            cache.invalidate()
+
+    def _keyword_confident(self, index: LexicalIndex, query: str) -> bool:
+        terms = set(tokenize(query))
+        return (0 < len(terms) <= self.lexical_fast_path_max_terms
+                and index.confidence(query) >= self.lexical_fast_path_confidence)
+
+    async def _retrieve_for_query(self, document_id: str, query: str,
+                                  session: Optional[ChatSession] = None) -> Tuple[Tuple[List[str], List[dict]], str]:
+        """
+        Top 5 chunks for a chat query, and the path that produced them:
+        "lexical" when the keyword index alone is confident (no embedding call),
+        "similar" when the session answered a near-identical query before,
+        otherwise the retrieval mode ("hybrid" or "vector").
+        """
+        db = get_vector_store()
+        if self.retrieval_mode == "hybrid":
+            index = await asyncio.to_thread(db.lexical_index, document_id)
+            if self._keyword_confident(index, query):
+                with span("lexical_query", queries=1, fast_path=True):
+                    return index.search(query, 5), "lexical"
+
+        query_vector = (await asyncio.to_thread(db.embed, [query]))[0]
+        if session is not None:
+            results = session.find_similar(query_vector, self.similar_query_threshold)
+            if results is not None:
+                return results, "similar"
+        results = (await asyncio.to_thread(self._retrieve, document_id, [query], [query_vector], 5))[0]
+        if session is not None:
+            session.remember_query(query_vector, results)
+        return results, self.retrieval_mode
+
+    async def _new_context_for_turn(self, session: ChatSession, query: str) -> Tuple[str, List[str]]:
+        """
+        Retrieves context for this turn and returns only chunks the model has not
+        seen yet in this session, as (formatted context, chunk texts). A query
+        close to an earlier one reuses that query's results without touching
+        the vector store.
+        """
+        results, path = await self._retrieve_for_query(session.document_id, query, session)
+        CHAT_RETRIEVAL.labels(path=path).inc()
+
+        docs, metadatas = results
+        fresh = [(doc, meta) for doc, meta in zip(docs, metadatas) if doc not in session.sent_chunks]
+        return self._format_context([d for d, _ in fresh], [m for _, m in fresh]), [d for d, _ in fresh]
+
+    async def chat(self, session: ChatSession, query: str) -> str:
+        """
+        Handles chat with "Thought Signature" circulation for reasoning continuity.
+        Prior turns, including the model's own content parts, live in the session
+        and are replayed as-is, so thought signatures carry over between turns.
+        Chat is interactive: its calls are admitted ahead of queued audits.
+        A failed call raises and leaves the session unchanged.
+        """
+        with interactive():
+            async with session.lock:
+                return await self._chat_turn(session, query)
+
+    async def _chat_turn(self, session: ChatSession, query: str) -> str:
+        if self.client is not None:
+            await self._ensure_document_cache(session)
+        cached_content = session.cached_content
+        try:
+            return await self._chat_turn_with_context(session, query)
+        except errors.APIError as e:
+            # The cache can still vanish between the TTL check and the call (deleted or expired early)
+            if not cached_content or e.code not in (403, 404):
+                raise
+            print(f"Cached content gone, answering from retrieval: {e}")
+            if session.cached_content == cached_content:
+                session.document_cache.invalidate()
+            return await self._chat_turn_with_context(session, query)
+
+    async def _chat_turn_with_context(self, session: ChatSession, query: str) -> str:
+        sent = []
+
+        if session.cached_content:
+            # The whole document is already on the model side
+            message = f"User Query: {query}"
+        else:
+            context, sent = await self._new_context_for_turn(session, query)
+            message = f"User Query: {query}"
+            if context:
+                message = f"Context from document:\n{context}\n\n{message}"
+
+        user_turn = types.Content(role="user", parts=[types.Part(text=message)])
+        config = types.GenerateContentConfig(
+            thinking_config=types.ThinkingConfig(thinking_level="medium") # Speed/Quality balance for Chat
+        )
+        if session.cached_content:
+            config.cached_content = session.cached_content
+        else:
+            config.system_instruction = CHAT_SYSTEM_INSTRUCTION
+
+        response = await self._generate(session.turns + [user_turn], config, operation="chat",
+                                        cached_context=bool(session.cached_content))
+        model_turn = response.candidates[0].content if response.candidates else None
+        if model_turn is None:
+            model_turn = types.Content(role="model", parts=[types.Part(text=response.text or "")])
+        session.add_turn(user_turn, model_turn, self.chat_max_turns)
+        session.sent_chunks.update(sent)
+        return response.text
@@ -0,0 +1,187 @@
+"""
+Bulk analysis of a directory (searched recursively) or list of PDFs.
+
+PDF parsing and chunking run in a process pool across cores; embedding and
+LLM calls from every document share the process-wide concurrency caps and
+rate limiters (EMBED_/LLM_REQUESTS_PER_MINUTE), so throughput is bounded by
+cores and API quota rather than by how many documents are queued. Each
+finished document is written as one JSON line with its timings and a
+status of ok, incomplete (some categories failed) or error; --resume skips
+documents already recorded as "ok" in the output file.
+
+Usage: python batch.py PATH [PATH ...] --out results.jsonl [--resume] [--refresh]
+                       [--parse-workers N] [--concurrency N]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db import get_vector_store
+from ingest import PARSE_WORKERS, file_document_id, ingest_document, parse_document
+from telemetry import trace
+
+# Documents past parsing (ingesting or being analyzed) at once
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+
+def collect_pdfs(paths: Iterable[str]) -> List[str]:
+    """Absolute paths of the given PDFs and of every PDF under the given directories, in stable order."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(".pdf"))
+        elif path.lower().endswith(".pdf"):
+            found.append(path)
+    return list(dict.fromkeys(os.path.abspath(path) for path in found))
+
+
+def completed_paths(output_path: str) -> Set[str]:
+    """Paths recorded as successfully analyzed in an earlier (possibly interrupted) run."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Torn last line from an interrupted run
+            if record.get("status") == "ok":
+                done.add(record["path"])
+    return done
+
+
+class BatchRunner:
+    def __init__(self, agent, parse_workers: Optional[int] = None, concurrency: Optional[int] = None):
+        self.agent = agent
+        self.parse_workers = parse_workers or PARSE_WORKERS
+        self.concurrency = concurrency or BATCH_CONCURRENCY
+
+    async def run(self, paths: List[str], refresh: bool = False,
+                  skip: Set[str] = frozenset()) -> AsyncIterator[dict]:
+        """Yields one result record per document, in completion order."""
+        loop = asyncio.get_running_loop()
+        # spawn, not fork: the parent holds Chroma/HTTP threads that must not be forked
+        pool = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+        analysis_slots = asyncio.Semaphore(self.concurrency)
+        document_locks: Dict[str, asyncio.Lock] = {}
+
+        async def one(path: str) -> dict:
+            timings = {}
+            start = time.perf_counter()
+            record = {"path": path, "source": os.path.basename(path)}
+            try:
+                with trace(f"batch {record['source']}", path=path):
+                    document_id = await asyncio.to_thread(file_document_id, path)
+                    # Byte-identical copies in one batch: the second waits and then reuses the first's work
+                    async with document_locks.setdefault(document_id, asyncio.Lock()):
+                        parsed = None
+                        if not await asyncio.to_thread(get_vector_store().has_document, document_id):
+                            step = time.perf_counter()
+                            parsed = await loop.run_in_executor(pool, parse_document, path)
+                            timings["parse_ms"] = round((time.perf_counter() - step) * 1000, 1)
+
+                        async with analysis_slots:
+                            step = time.perf_counter()
+                            ingest_result = await asyncio.to_thread(
+                                ingest_document, path, None, os.path.abspath(path), parsed
+                            )
+                            timings["ingest_ms"] = round((time.perf_counter() - step) * 1000, 1)
+
+                            step = time.perf_counter()
+                            report = await self.agent.analyze_document(
+                                ingest_result.document_id, ingest_result.text_hash, use_cache=not refresh
+                            )
+                            timings["analyze_ms"] = round((time.perf_counter() - step) * 1000, 1)
+
+                # Categories that failed (e.g. quota exhausted) leave the record incomplete, so --resume retries it
+                record.update(status="incomplete" if report.failed_categories else "ok",
+                              ingest=ingest_result.model_dump(), report=report.model_dump())
+            except Exception as e:
+                record.update(status="error", error=str(e))
+            timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            record["timings"] = timings
+            return record
+
+        # Parsed chunks wait in memory for an analysis slot; cap how many documents are open
+        max_open = self.parse_workers + self.concurrency
+        in_flight = set()
+        try:
+            for path in paths:
+                if path in skip:
+                    continue
+                while len(in_flight) >= max_open:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+                in_flight.add(asyncio.ensure_future(one(path)))
+
+            while in_flight:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_to_file(runner: BatchRunner, paths: List[str], output_path: str,
+                      resume: bool = False, refresh: bool = False) -> AsyncIterator[dict]:
+    """Runs a batch, appending each record to `output_path` as it finishes (and yielding it)."""
+    skip = completed_paths(output_path) if resume else set()
+    with open(output_path, "a" if resume else "w") as out:
+        if resume and out.tell():
+            with open(output_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    out.write("\n")  # Start clear of a torn last line
+        async for record in runner.run(paths, refresh=refresh, skip=skip):
+            out.write(json.dumps(record, default=str) + "\n")
+            out.flush()
+            yield record
+
+
+async def main(args):
+    from agent import LegalAgent
+    from db import close_shared_clients
+
+    paths = collect_pdfs(args.paths)
+    runner = BatchRunner(LegalAgent(), parse_workers=args.parse_workers, concurrency=args.concurrency)
+    start = time.perf_counter()
+    ok = failed = 0
+    try:
+        async for record in run_to_file(runner, paths, args.out, resume=args.resume, refresh=args.refresh):
+            ok += record["status"] == "ok"
+            failed += record["status"] != "ok"
+            print(f"[{ok + failed}/{len(paths)}] {record['status']:<5} {record['source']} "
+                  f"{record['timings']['total_ms']:.0f}ms", file=sys.stderr)
+    finally:
+        await close_shared_clients()
+    elapsed = time.perf_counter() - start
+    print(f"{ok} ok, {failed} failed in {elapsed:.1f}s ({(ok + failed) / max(elapsed, 1e-9):.2f} docs/s)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="PDF files and/or directories")
+    parser.add_argument("--out", default="batch_results.jsonl", help="JSONL output file")
+    parser.add_argument("--resume", action="store_true", help="skip documents already ok in --out")
+    parser.add_argument("--refresh", action="store_true", help="ignore cached reports")
+    parser.add_argument("--parse-workers", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=None, help="documents ingesting/analyzing at once")
+    asyncio.run(main(parser.parse_args()))
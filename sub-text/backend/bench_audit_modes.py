@@ -0,0 +1,116 @@
+"""
+Compares the two audit modes on the bundled docs/ PDFs:
+
+- per_category: one retrieval and one LLM call per category (the default)
+- single_pass:  merged, deduplicated context within AUDIT_CONTEXT_TOKEN_BUDGET
+                and one structured call for all categories
+
+For each document it reports LLM calls, input (prompt) tokens, wall time and
+red flags found, plus how many of the chunks retrieved across categories were
+duplicates. single_pass runs once per token budget in --budgets. The
+executive summary call is included in both modes.
+
+Runs against the offline fake provider (MODEL_PROVIDER=fake) by default; its
+token counts are len(prompt) // 4, so the ratios are what matter. Pass --live
+to hit Gemini with GOOGLE_API_KEY instead.
+
+Usage: python bench_audit_modes.py [--budgets 2000,4000,8000] [--live] [pdf ...]
+"""
+import argparse
+import asyncio
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs")
+
+
+def configure_env(live: bool):
+    workdir = tempfile.mkdtemp(prefix="bench_audit_")
+    if not live:
+        os.environ["MODEL_PROVIDER"] = "fake"
+    os.environ["CHROMA_PATH"] = os.path.join(workdir, "chroma_db")
+    os.environ["NUMPY_INDEX_PATH"] = os.path.join(workdir, "numpy_index")
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.sqlite3")
+    os.environ["REPORT_CACHE_ENABLED"] = "0"
+    return workdir
+
+
+def overlap(agent, document_id: str):
+    """Chunks retrieved across all categories versus distinct chunks among them."""
+    from db import get_vector_store
+
+    results = get_vector_store().query_many(
+        document_id, agent.prepare_category_embeddings(), n_results=agent.audit_results_per_category
+    )
+    retrieved = [doc for docs, _ in results for doc in docs]
+    return len(retrieved), len(set(retrieved))
+
+
+async def run_mode(agent, document_id: str, mode: str):
+    usage = {"calls": 0, "prompt_tokens": 0}
+    generate = agent._generate
+
+    async def counting_generate(contents, config, **kwargs):
+        response = await generate(contents, config, **kwargs)
+        usage["calls"] += 1
+        if response.usage_metadata and response.usage_metadata.prompt_token_count:
+            usage["prompt_tokens"] += response.usage_metadata.prompt_token_count
+        return response
+
+    agent.audit_mode = mode
+    agent._generate = counting_generate
+    try:
+        start = time.perf_counter()
+        report = await agent.analyze_document(document_id, use_cache=False)
+        usage["seconds"] = time.perf_counter() - start
+    finally:
+        agent._generate = generate
+    usage["flags"] = len(report.red_flags)
+    usage["categories_flagged"] = len({f.category for f in report.red_flags})
+    return usage
+
+
+def bench(path: str, agent, budgets):
+    from ingest import ingest_document
+
+    result = ingest_document(path)
+    retrieved, distinct = overlap(agent, result.document_id)
+    print(f"\n{os.path.basename(path)}: {result.num_chunks} chunks; "
+          f"retrieved {retrieved} across categories, {distinct} distinct "
+          f"({1 - distinct / max(retrieved, 1):.0%} duplicates)")
+
+    rows = {"per_category": asyncio.run(run_mode(agent, result.document_id, "per_category"))}
+    for budget in budgets:
+        agent.audit_context_token_budget = budget
+        rows[f"single_pass@{budget}"] = asyncio.run(run_mode(agent, result.document_id, "single_pass"))
+
+    before = rows["per_category"]
+    for label, row in rows.items():
+        print(f"  {label:<18} calls={row['calls']:<3} input tokens={row['prompt_tokens']:<7} "
+              f"(x{before['prompt_tokens'] / max(row['prompt_tokens'], 1):.1f} less)  "
+              f"time={row['seconds'] * 1000:7.0f}ms  flags={row['flags']:<3} "
+              f"categories flagged={row['categories_flagged']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--budgets", default="2000,4000,8000", help="single_pass context token budgets")
+    parser.add_argument("--live", action="store_true", help="use Gemini instead of the fake provider")
+    args = parser.parse_args()
+
+    workdir = configure_env(args.live)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from agent import LegalAgent
+
+    agent = LegalAgent()
+    budgets = [int(budget) for budget in args.budgets.split(",")]
+    print(f"provider={os.environ.get('MODEL_PROVIDER', 'gemini')}  "
+          f"results per category={agent.audit_results_per_category}")
+    for path in args.pdfs or sorted(glob.glob(os.path.join(DOCS_DIR, "*.pdf"))):
+        bench(path, agent, budgets)
+    shutil.rmtree(workdir, ignore_errors=True)
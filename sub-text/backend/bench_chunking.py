@@ -0,0 +1,103 @@
+"""
+Compares the structure-aware chunker against the legacy fixed 1500/150 splitter
+on the bundled docs/ PDFs.
+
+Reported per document and chunker:
+- chunks / embed calls: chunk count and embed_content requests (100 texts each)
+- chars: total characters sent to the embedding API (embedding volume)
+- tiny: chunks under 300 characters (page tails)
+- intact: share of sampled sentences that land whole inside a single chunk
+- hit@5: share of sampled sentences whose full text is in one of the top-5
+  chunks retrieved with a partial-keyword query (offline lexical proxy for
+  retrieval quality, so no API key is needed)
+
+Usage: python bench_chunking.py [pdf ...]
+"""
+import glob
+import math
+import os
+import random
+import re
+import sys
+from collections import Counter
+
+import fitz
+
+from chunking import SENTENCE_SPLIT, chunk_pages
+from ingest import chunk_text, normalize_text
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs")
+SAMPLE_SENTENCES = 200
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def load_pages(path):
+    doc = fitz.open(path)
+    pages = [(i + 1, page.get_text(), doc.page_count) for i, page in enumerate(doc)]
+    doc.close()
+    return pages
+
+
+def fixed_chunks(pages):
+    return [chunk for _, text, _ in pages if text.strip() for chunk in chunk_text(text)]
+
+
+def structure_chunks(pages):
+    return [chunk for chunk, _, _ in chunk_pages(pages)]
+
+
+def sample_sentences(pages, rng):
+    full_text = normalize_text(" ".join(text for _, text, _ in pages))
+    sentences = [s for s in SENTENCE_SPLIT.split(full_text) if 60 <= len(s) <= 400]
+    rng.shuffle(sentences)
+    return sentences[:SAMPLE_SENTENCES]
+
+
+def top_k(query_tokens, chunk_tokens, idf, k=5):
+    scores = []
+    for i, tokens in enumerate(chunk_tokens):
+        counts = Counter(tokens)
+        length_norm = math.sqrt(len(tokens)) or 1.0
+        scores.append((sum(counts[t] * idf.get(t, 0.0) for t in query_tokens) / length_norm, i))
+    scores.sort(reverse=True)
+    return [i for _, i in scores[:k]]
+
+
+def evaluate(chunks, sentences, rng):
+    normalized = [normalize_text(c) for c in chunks]
+    chunk_tokens = [TOKEN.findall(c.lower()) for c in normalized]
+    df = Counter(t for tokens in chunk_tokens for t in set(tokens))
+    idf = {t: math.log(1 + len(chunks) / n) for t, n in df.items()}
+
+    intact = hits = 0
+    for sentence in sentences:
+        containing = {i for i, c in enumerate(normalized) if sentence in c}
+        intact += bool(containing)
+        words = TOKEN.findall(sentence.lower())
+        query = rng.sample(words, max(1, len(words) // 2))
+        hits += bool(containing.intersection(top_k(query, chunk_tokens, idf)))
+
+    return {
+        "chunks": len(chunks),
+        "embed_calls": math.ceil(len(chunks) / 100),
+        "chars": sum(len(c) for c in chunks),
+        "tiny": sum(1 for c in chunks if len(c) < 300),
+        "intact": intact / len(sentences) if sentences else 0.0,
+        "hit@5": hits / len(sentences) if sentences else 0.0,
+    }
+
+
+def main(paths):
+    print(f"{'document':<40} {'chunker':<10} {'chunks':>6} {'calls':>5} {'chars':>8} "
+          f"{'tiny':>5} {'intact':>7} {'hit@5':>6}")
+    for path in paths:
+        pages = load_pages(path)
+        sentences = sample_sentences(pages, random.Random(0))
+        for name, chunker in (("fixed", fixed_chunks), ("structure", structure_chunks)):
+            m = evaluate(chunker(pages), sentences, random.Random(1))
+            print(f"{os.path.basename(path)[:40]:<40} {name:<10} {m['chunks']:>6} {m['embed_calls']:>5} "
+                  f"{m['chars']:>8} {m['tiny']:>5} {m['intact']:>7.1%} {m['hit@5']:>6.1%}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or sorted(glob.glob(os.path.join(DOCS_DIR, "*.pdf"))))
@@ -0,0 +1,178 @@
+"""
+Measures cold start the way a scale-from-zero instance sees it:
+
+- import: `import main` in a fresh interpreter (median of --runs), plus the
+  slowest direct imports from -X importtime with --importtime
+- listen: process spawn until GET / answers
+- ready: process spawn until GET /ready answers 200 (warmup finished)
+- first: latency of an /analyze sent the moment the server listens
+- served: process spawn until that first /analyze has answered
+- after ready: latency of the same /analyze on a second fresh server that
+  is only sent once /ready reports the warmup done
+
+Each run starts uvicorn in an empty working directory, so the vector store,
+embedding cache and report cache are all cold. Runs against the offline fake
+provider; its latencies (including 150ms to open each client's first
+connection) stand in for the Gemini round trips.
+
+--max-import-ms and --max-first-ms exit non-zero when the median exceeds
+them, so the script can gate CI on import-time regressions.
+
+Usage: python bench_cold_start.py [--runs 5] [--importtime] [--max-import-ms N] [--max-first-ms N] [pdf]
+"""
+import argparse
+import glob
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DOCS_DIR = os.path.join(BACKEND_DIR, "..", "..", "docs")
+
+
+def bench_env():
+    env = dict(os.environ)
+    env.update({
+        "MODEL_PROVIDER": "fake",
+        "FAKE_EMBED_LATENCY_MS": "50",
+        "FAKE_LLM_LATENCY_MS": "200",
+        "FAKE_CONNECT_LATENCY_MS": "150",
+        "PYTHONPATH": BACKEND_DIR,
+    })
+    return env
+
+
+def measure_import(env, workdir) -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, capture_output=True, text=True,
+                         check=True)
+    return float(out.stdout.strip().splitlines()[-1]) * 1000
+
+
+def slowest_imports(env, workdir, top: int = 10):
+    """Modules imported directly by main, by cumulative import time (microseconds), from -X importtime."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=workdir, env=env,
+                         capture_output=True, text=True, check=True)
+    children = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # Children are listed before their parent, indented
+        if depth == 0:
+            if name.strip() == "main":
+                break
+            children = []
+        elif depth == 1:
+            children.append((name.strip(), int(cumulative)))
+    return sorted(children, key=lambda item: -item[1])[:top]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def analyze(client, pdf) -> float:
+    start = time.perf_counter()
+    with open(pdf, "rb") as f:
+        response = client.post("/analyze", files={"file": (os.path.basename(pdf), f, "application/pdf")})
+    response.raise_for_status()
+    return (time.perf_counter() - start) * 1000
+
+
+def measure_server(env, workdir, pdf, wait_ready: bool) -> dict:
+    port = free_port()
+    spawned = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    row = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=120) as client:
+            while True:
+                try:
+                    client.get("/")
+                    break
+                except httpx.TransportError:
+                    if server.poll() is not None:
+                        raise RuntimeError("server exited during startup")
+                    time.sleep(0.005)
+            row["listen"] = (time.perf_counter() - spawned) * 1000
+
+            if wait_ready:
+                while True:
+                    status = client.get("/ready").status_code
+                    if status != 503:
+                        break
+                    time.sleep(0.01)
+                # Servers without a readiness endpoint count as ready once they listen
+                row["ready"] = (time.perf_counter() - spawned) * 1000 if status == 200 else row["listen"]
+
+            row["first"] = analyze(client, pdf)
+            row["served"] = (time.perf_counter() - spawned) * 1000
+    finally:
+        server.terminate()
+        server.wait()
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", help="document to analyze (default: the smallest docs/ PDF)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest imports")
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-first-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    pdf = args.pdf or min(glob.glob(os.path.join(DOCS_DIR, "*.pdf")), key=os.path.getsize)
+    env = bench_env()
+
+    samples = {"import": [], "listen": [], "first": [], "served": [], "ready": [], "after ready": []}
+    for _ in range(args.runs):
+        for step in ("import", "at listen", "after ready"):
+            workdir = tempfile.mkdtemp(prefix="bench_cold_start_")
+            try:
+                if step == "import":
+                    samples["import"].append(measure_import(env, workdir))
+                elif step == "at listen":
+                    row = measure_server(env, workdir, pdf, wait_ready=False)
+                    for key in ("listen", "first", "served"):
+                        samples[key].append(row[key])
+                else:
+                    row = measure_server(env, workdir, pdf, wait_ready=True)
+                    samples["ready"].append(row["ready"])
+                    samples["after ready"].append(row["first"])
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    medians = {key: statistics.median(values) for key, values in samples.items()}
+    print(f"runs={args.runs}  document={os.path.basename(pdf)}")
+    for key, value in medians.items():
+        print(f"{key:>11}: {value:8.0f}ms")
+
+    if args.importtime:
+        workdir = tempfile.mkdtemp(prefix="bench_cold_start_")
+        print("\nslowest imports under main (cumulative):")
+        for name, micros in slowest_imports(env, workdir):
+            print(f"  {name:<24} {micros / 1000:7.1f}ms")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = False
+    if args.max_import_ms is not None and medians["import"] > args.max_import_ms:
+        print(f"FAIL: import {medians['import']:.0f}ms > {args.max_import_ms:.0f}ms", file=sys.stderr)
+        failed = True
+    if args.max_first_ms is not None and medians["first"] > args.max_first_ms:
+        print(f"FAIL: first request {medians['first']:.0f}ms > {args.max_first_ms:.0f}ms", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,155 @@
+"""
+Measures what header/footer stripping and near-duplicate chunk removal save
+per document, with both off (DEDUP_THRESHOLD=0, STRIP_HEADERS_FOOTERS=0)
+versus on:
+
+- chunks: chunks written to the index
+- embedded: texts sent to the embedding API during ingest
+- index: bytes of the persisted numpy index
+- context: tokens (chars / 4) of the five category contexts from _query_db
+- dup%: share of chunks folded into an earlier chunk; hf: header/footer lines stripped
+
+Besides the docs/ PDFs, a generated agreement with running headers and
+footers and a governing-law and notices section restated in every schedule
+shows the boilerplate-heavy case (its service clauses differ only in topic
+and fee, so they must all be kept). Runs against the offline fake provider
+with the embedding cache off.
+
+Usage: python bench_dedup.py [--schedules 20] [pdf ...]
+"""
+import argparse
+import asyncio
+import glob
+import os
+import shutil
+import sys
+import tempfile
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs")
+
+TOPICS = [
+    ("Cloud Hosting", "hosts the Customer's production workloads in two availability regions with nightly backups"),
+    ("Support", "answers support tickets within one business day and escalates outages to an on-call engineer"),
+    ("Data Migration", "moves historical records from the legacy system and validates row counts after each batch"),
+    ("Training", "runs onboarding workshops for administrators and publishes recorded sessions for new staff"),
+    ("Security Review", "performs an annual penetration test and shares a summary of remediated findings"),
+    ("Analytics", "delivers a monthly usage dashboard broken down by team, feature and billing account"),
+]
+
+GOVERNING_LAW = (
+    "2. Governing Law and Disputes. This Schedule is governed by the laws of the State of Delaware, without "
+    "regard to its conflict of laws principles. Any dispute arising out of or relating to this Schedule shall "
+    "be resolved exclusively by binding arbitration administered under the commercial rules then in effect, "
+    "and the Customer waives any right to participate in a class action or to a trial by jury. Judgment on the "
+    "award may be entered in any court having jurisdiction. Each party bears its own costs and attorneys' fees "
+    "except where the arbitrator finds a claim was brought in bad faith."
+)
+NOTICES = (
+    "3. Notices. All notices under this Schedule must be in writing and are deemed given when delivered "
+    "personally, one business day after being sent by overnight courier, or when sent by email with "
+    "confirmation of transmission. Notices to the Provider must be sent to the legal department at the address "
+    "on the Order Form, and notices to the Customer to the contact named there. Either party may change its "
+    "notice address by giving notice to the other party. Operational messages may be sent through the service."
+)
+
+
+def write_boilerplate_pdf(path: str, schedules: int):
+    import fitz
+
+    doc = fitz.open()
+    for i in range(schedules):
+        name, duty = TOPICS[i % len(TOPICS)]
+        services = (
+            f"1. Services. Under Schedule {chr(65 + i % 26)}{i // 26 or ''} ({name}) the Provider {duty}. "
+            f"The Provider assigns a named lead for the {name.lower()} work, reports progress in the monthly "
+            f"review and corrects any deliverable that does not meet the acceptance criteria agreed in writing. "
+            f"The fee for this Schedule is ${250 * (i + 1)} per month, invoiced in advance."
+        )
+        page = doc.new_page()
+        text = "\n\n".join([
+            "ACME MASTER SERVICES AGREEMENT - CONFIDENTIAL",
+            services, GOVERNING_LAW, NOTICES,
+            f"Page {i + 1} of {schedules}",
+        ])
+        page.insert_textbox(fitz.Rect(50, 40, 560, 800), text, fontsize=9)
+    doc.save(path)
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def run(path, enabled: bool, workdir: str):
+    import db
+    import ingest
+    from agent import LegalAgent
+    from numpy_index import NumpyVectorStore
+
+    ingest.DEDUP_THRESHOLD = 0.9 if enabled else 0.0
+    ingest.STRIP_HEADERS_FOOTERS = enabled
+    index_path = os.path.join(workdir, f"index_{enabled}_{os.path.basename(path)}")
+    os.environ["NUMPY_INDEX_PATH"] = index_path
+    db._store = store = NumpyVectorStore()
+
+    embedded = [0]
+    remote = store.embedding_fn._embed_remote
+
+    def counting(texts):
+        embedded[0] += len(texts)
+        return remote(texts)
+
+    store.embedding_fn._embed_remote = counting
+    result = ingest.ingest_document(path)
+    embedded_at_ingest = embedded[0]
+
+    agent = LegalAgent()
+    context_tokens = sum(len(agent._query_db(result.document_id, category)) // 4 for category in agent.categories)
+    store.close()
+    db._store = None
+    return {
+        "chunks": result.num_chunks, "embedded": embedded_at_ingest, "index": directory_bytes(index_path),
+        "context": context_tokens, "dup": result.dedup_ratio, "hf": result.header_footer_lines,
+    }
+
+
+def format_bytes(count):
+    for unit in ("B", "KB", "MB"):
+        if count < 1024:
+            return f"{count:.0f}{unit}"
+        count /= 1024
+    return f"{count:.1f}GB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--schedules", type=int, default=20, help="pages of the generated boilerplate agreement")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_dedup_")
+    os.environ["MODEL_PROVIDER"] = "fake"
+    os.environ["FAKE_EMBED_LATENCY_MS"] = "0"
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "0"
+    os.environ["INCREMENTAL_INGEST"] = "0"
+    os.environ["VECTOR_BACKEND"] = "numpy"
+    os.environ["NUMPY_INDEX_MMAP"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    generated = os.path.join(workdir, "boilerplate_agreement.pdf")
+    write_boilerplate_pdf(generated, args.schedules)
+    paths = args.pdfs or sorted(glob.glob(os.path.join(DOCS_DIR, "*.pdf"))) + [generated]
+
+    print(f"{'document':<32} {'dedup':<5} {'chunks':>6} {'embedded':>8} {'index':>8} {'context':>8} "
+          f"{'dup%':>6} {'hf':>5}")
+    try:
+        for path in paths:
+            for enabled in (False, True):
+                row = run(path, enabled, workdir)
+                print(f"{os.path.basename(path)[:32]:<32} {'on' if enabled else 'off':<5} {row['chunks']:>6} "
+                      f"{row['embedded']:>8} {format_bytes(row['index']):>8} {row['context']:>8} "
+                      f"{row['dup']:>6.1%} {row['hf']:>5}")
+    finally:
+        from db import close_shared_clients
+
+        asyncio.run(close_shared_clients())
+        shutil.rmtree(workdir, ignore_errors=True)
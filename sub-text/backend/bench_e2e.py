@@ -0,0 +1,189 @@
+"""
+End-to-end performance benchmark on the bundled docs/ PDFs.
+
+1. Stage breakdown per PDF: parse, chunk, embed, store, retrieve and LLM
+   latency with the Python-heap peak of each stage.
+2. HTTP load: /analyze and /chat driven in-process through the ASGI app at
+   several concurrency levels, reporting p50/p95 latency, throughput and
+   peak RSS.
+
+Runs against the offline fake provider (MODEL_PROVIDER=fake) by default, so it
+costs no API quota; tune it with FAKE_LLM_LATENCY_MS, FAKE_EMBED_LATENCY_MS and
+FAKE_ERROR_RATE. Pass --live to hit Gemini with GOOGLE_API_KEY instead.
+
+Usage: python bench_e2e.py [--levels 1,4,8] [--requests 8] [--live] [pdf ...]
+"""
+import argparse
+import asyncio
+import glob
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs")
+
+
+def configure_env(live: bool):
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    if not live:
+        os.environ["MODEL_PROVIDER"] = "fake"
+    # Cold-path numbers: fresh store, no embedding or report cache reuse between requests
+    os.environ["CHROMA_PATH"] = os.path.join(workdir, "chroma_db")
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "0"
+    os.environ["REPORT_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("MAX_DOCUMENTS", "1000")
+    return workdir
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def stage(results: dict, name: str):
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    yield
+    results[name] = (time.perf_counter() - start, tracemalloc.get_traced_memory()[1] / 2**20)
+
+
+def bench_stages(path: str):
+    import db
+    from agent import LegalAgent
+    from chunking import chunk_pages
+    from ingest import EMBED_BATCH_SIZE, iter_pages
+
+    store = db.get_vector_store()
+    agent = LegalAgent()
+    agent.prepare_category_embeddings()
+    results = {}
+
+    tracemalloc.start()
+    with stage(results, "parse"):
+        pages = list(iter_pages(path))
+    with stage(results, "chunk"):
+        chunks = list(chunk_pages(pages))
+    texts = [text for text, _, _ in chunks]
+    with stage(results, "embed"):
+        vectors = []
+        for i in range(0, len(texts), EMBED_BATCH_SIZE):
+            vectors.extend(store.embed(texts[i:i + EMBED_BATCH_SIZE]))
+    document_id = uuid.uuid4().hex
+    with stage(results, "store"):
+        store.add_embedded(
+            document_id,
+            [str(i) for i in range(len(texts))],
+            texts,
+            vectors,
+            [{"page": start, "page_start": start, "page_end": end} for _, start, end in chunks]
+        )
+    with stage(results, "retrieve"):
+        contexts = agent._query_categories(document_id)
+
+    async def run_llm():
+        flags = await asyncio.gather(*[
+            agent._request_category_flags(category, agent._format_context(docs, metadatas, pages=False))
+            for category, (docs, metadatas) in contexts.items() if docs
+        ])
+        await agent._generate_executive_summary([f for fs in flags for f in fs])
+
+    with stage(results, "llm"):
+        asyncio.run(run_llm())
+    tracemalloc.stop()
+
+    store.delete_document(document_id)
+    print(f"\n{os.path.basename(path)}: {len(pages)} pages, {len(chunks)} chunks")
+    for name, (seconds, peak_mb) in results.items():
+        print(f"  {name:<9} {seconds * 1000:9.1f}ms   heap peak {peak_mb:7.1f}MB")
+
+
+def unique_pdf(data: bytes) -> bytes:
+    # Trailing comment after %%EOF: still a valid PDF, but a new content hash
+    return data + f"\n%bench-{uuid.uuid4().hex}\n".encode()
+
+
+async def run_level(client, level: int, total: int, make_request):
+    semaphore = asyncio.Semaphore(level)
+    latencies, failures = [], 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            response = await make_request(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(total)])
+    wall = time.perf_counter() - start
+    ms = [l * 1000 for l in latencies]
+    print(f"  concurrency={level:<3} n={total:<4} p50={statistics.median(ms):8.0f}ms  "
+          f"p95={percentile(ms, 0.95):8.0f}ms  throughput={total / wall:6.2f} req/s  "
+          f"failures={failures}  peak RSS={peak_rss_mb():.0f}MB")
+
+
+async def bench_http(paths, levels, requests_per_level):
+    import httpx
+    import main
+
+    pdfs = [(os.path.basename(p), open(p, "rb").read()) for p in paths]
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def analyze(i):
+                name, data = pdfs[i % len(pdfs)]
+                return await client.post("/analyze", files={"file": (f"{i}_{name}", unique_pdf(data), "application/pdf")})
+
+            print("\n/analyze")
+            for level in levels:
+                await run_level(client, level, max(level, requests_per_level), analyze)
+
+            first = await client.post("/analyze", files={"file": (pdfs[0][0], pdfs[0][1], "application/pdf")})
+            document_id = first.json()["document_id"]
+
+            async def chat(i):
+                return await client.post("/chat", json={
+                    "query": "Can they terminate my account without notice?",
+                    "history": [],
+                    "document_id": document_id
+                })
+
+            print("\n/chat")
+            for level in levels:
+                await run_level(client, level, max(level, requests_per_level), chat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--levels", default="1,4,8")
+    parser.add_argument("--requests", type=int, default=8, help="requests per concurrency level")
+    parser.add_argument("--live", action="store_true", help="use Gemini instead of the fake provider")
+    args = parser.parse_args()
+
+    workdir = configure_env(args.live)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    paths = args.pdfs or sorted(glob.glob(os.path.join(DOCS_DIR, "*.pdf")))
+    levels = [int(level) for level in args.levels.split(",")]
+
+    print(f"provider={os.environ.get('MODEL_PROVIDER', 'gemini')}  workdir={workdir}")
+    print("--- Stage breakdown ---")
+    for path in paths:
+        bench_stages(path)
+    print("\n--- HTTP load ---")
+    asyncio.run(bench_http(paths, levels, args.requests))
+    shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,172 @@
+"""
+Compares embedding dimensionality and index storage settings on the bundled
+docs/ PDFs, to pick EMBEDDING_DIMENSIONALITY and NUMPY_INDEX_DTYPE.
+
+All chunks of the corpus go into one index per setting. Queries are the audit
+categories plus keyword prefixes of sampled sentences. Reported per setting:
+- disk: bytes of the persisted index
+- ram: vector bytes held in memory (numpy backend; the memory-mapped float16
+  rescoring copy excluded)
+- query: mean latency of one single-vector query_many call
+- recall@5: overlap of the top 5 with the full-precision 3072-d baseline
+  (exact float32 search)
+
+Runs against the offline fake provider (MODEL_PROVIDER=fake) by default. Its
+hashed bag-of-words vectors are not Matryoshka-trained, so truncated
+dimensions lose more recall there than with the real model; pass --live to
+embed with gemini-embedding-001 (GOOGLE_API_KEY) for numbers to decide on.
+
+Usage: python bench_embedding_storage.py [--dims 3072,768,256] [--queries 50] [--live] [pdf ...]
+"""
+import argparse
+import glob
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# Stores accept only content-hash shaped document ids
+BENCH_DOCUMENT = "0" * 32
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs")
+FULL_DIMENSIONALITY = 3072
+REPEATS = 20
+
+
+def configure_env(live: bool):
+    workdir = tempfile.mkdtemp(prefix="bench_embedding_")
+    if not live:
+        os.environ["MODEL_PROVIDER"] = "fake"
+        os.environ["FAKE_EMBED_LATENCY_MS"] = "0"
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "0"
+    os.environ["CHROMA_PATH"] = os.path.join(workdir, "unused_chroma")
+    return workdir
+
+
+def load_corpus(paths, sample_queries: int):
+    from chunking import SENTENCE_SPLIT
+    from ingest import iter_chunks, iter_pages, normalize_text
+
+    chunks, sentences = [], []
+    for path in paths:
+        pages = list(iter_pages(path, parallel=False))
+        chunks.extend(chunk for chunk, _ in iter_chunks(pages, os.path.basename(path), lambda event: None))
+        full_text = normalize_text(" ".join(text for _, text, _ in pages))
+        sentences.extend(s for s in SENTENCE_SPLIT.split(full_text) if 60 <= len(s) <= 400)
+    rng = random.Random(0)
+    rng.shuffle(sentences)
+    # A partial-keyword query, as a reader would type it
+    queries = [" ".join(sentence.split()[:12]) for sentence in sentences[:sample_queries]]
+    return list(dict.fromkeys(chunks)), queries
+
+
+def embed(texts, dimensionality):
+    from db import EMBEDDING_MODEL, GeminiEmbeddingFunction, get_genai_client
+
+    fn = GeminiEmbeddingFunction(
+        model_name=EMBEDDING_MODEL,
+        output_dimensionality=None if dimensionality == FULL_DIMENSIONALITY else dimensionality,
+        client=get_genai_client()
+    )
+    return fn(texts)
+
+
+def directory_bytes(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files
+    )
+
+
+def build_store(backend: str, path: str, dtype: str, rescore: int):
+    if backend == "chroma":
+        from db import VectorStore
+
+        os.environ["CHROMA_PATH"] = path
+        return VectorStore()
+    from numpy_index import NumpyVectorStore
+
+    os.environ["NUMPY_INDEX_PATH"] = path
+    os.environ["NUMPY_INDEX_DTYPE"] = dtype
+    os.environ["NUMPY_INDEX_RESCORE"] = str(rescore)
+    os.environ["NUMPY_INDEX_MMAP"] = "0"
+    return NumpyVectorStore()
+
+
+def run_setting(label, backend, dtype, rescore, chunks, vectors, query_vectors, baseline, workdir):
+    path = os.path.join(workdir, label.replace(" ", "_"))
+    store = build_store(backend, path, dtype, rescore)
+    ids = [str(i) for i in range(len(chunks))]
+    store.add_embedded(BENCH_DOCUMENT, ids, chunks, vectors, [{"chunk": i} for i in range(len(chunks))])
+    store.mark_complete(BENCH_DOCUMENT)
+
+    results, latencies = [], []
+    for query in query_vectors:
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            docs, metadatas = store.query_many(BENCH_DOCUMENT, [query], 5)[0]
+        latencies.append((time.perf_counter() - start) / REPEATS)
+        results.append({meta["chunk"] for meta in metadatas})
+
+    recall = statistics.mean(len(found & truth) / len(truth) for found, truth in zip(results, baseline))
+    ram = store._index(BENCH_DOCUMENT).nbytes() if backend == "numpy" else None
+    disk = directory_bytes(path)
+    store.close()
+    return {"disk": disk, "ram": ram, "query_ms": statistics.mean(latencies) * 1000, "recall": recall}
+
+
+def format_bytes(count):
+    if count is None:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024:
+            return f"{count:.0f}{unit}"
+        count /= 1024
+    return f"{count:.1f}TB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--dims", default="3072,768,256", help="embedding dimensionalities to compare")
+    parser.add_argument("--queries", type=int, default=50, help="sampled sentence queries (plus the categories)")
+    parser.add_argument("--live", action="store_true", help="embed with Gemini instead of the fake provider")
+    args = parser.parse_args()
+
+    workdir = configure_env(args.live)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import numpy as np
+    from agent import LegalAgent
+
+    chunks, queries = load_corpus(args.pdfs or sorted(glob.glob(os.path.join(DOCS_DIR, "*.pdf"))), args.queries)
+    queries = LegalAgent().categories + queries
+    print(f"provider={os.environ.get('MODEL_PROVIDER', 'gemini')}  {len(chunks)} chunks  {len(queries)} queries")
+
+    # Ground truth: exact float32 search at full dimensionality
+    full_chunks = np.asarray(embed(chunks, FULL_DIMENSIONALITY), dtype=np.float32)
+    full_queries = np.asarray(embed(queries, FULL_DIMENSIONALITY), dtype=np.float32)
+    full_chunks /= np.linalg.norm(full_chunks, axis=1, keepdims=True)
+    full_queries /= np.linalg.norm(full_queries, axis=1, keepdims=True)
+    baseline = [set(np.argsort(-(full_chunks @ query))[:5].tolist()) for query in full_queries]
+
+    settings = [
+        ("numpy float32", "numpy", "float32", 0),
+        ("numpy float16", "numpy", "float16", 0),
+        ("numpy int8+rescore", "numpy", "int8", 4),
+        ("numpy int8", "numpy", "int8", 0),
+        ("chroma float32", "chroma", "float32", 0),
+    ]
+    print(f"\n{'dims':>5}  {'setting':<20} {'disk':>8} {'ram':>8} {'query':>9} {'recall@5':>9}")
+    for dims in [int(d) for d in args.dims.split(",")]:
+        if dims == FULL_DIMENSIONALITY:
+            vectors, query_vectors = full_chunks.tolist(), full_queries.tolist()
+        else:
+            vectors, query_vectors = embed(chunks, dims), embed(queries, dims)
+        for label, backend, dtype, rescore in settings:
+            row = run_setting(f"{dims} {label}", backend, dtype, rescore, chunks, vectors, query_vectors,
+                              baseline, workdir)
+            print(f"{dims:>5}  {label:<20} {format_bytes(row['disk']):>8} {format_bytes(row['ram']):>8} "
+                  f"{row['query_ms']:7.3f}ms {row['recall']:9.1%}")
+    shutil.rmtree(workdir, ignore_errors=True)
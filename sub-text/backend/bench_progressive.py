@@ -0,0 +1,217 @@
+"""
+Measures progressive analysis (progressive.py) against a plain ingest-then-
+analyze run on generated service agreements of growing length.
+
+Each agreement is mostly operational boilerplate (delivery, inspection,
+insurance, ...) with one section per audit category (fees, liability,
+termination, intellectual property, data protection) placed a third of the
+way in or later, where a front-to-back ingest reaches it last. Per length:
+
+- chunks: chunks indexed; windows: progressive windows
+- full first / full report: seconds until the first category event and the
+  final report when ingest has to finish before the audit starts
+- prog first: seconds until the first category event of the progressive run,
+  with the completeness of the index it was found on
+- prog report: seconds until its final report
+- same: whether the final red flags (category, risk, quote, page) match the
+  plain run's exactly
+- early: share of the final flags already in the first partial report
+- calls: model calls (audit and summary) of the plain / progressive run
+
+Every run is a separate process with its own store and caches, against the
+offline fake provider. --embed-ms and --llm-ms set its per-call latencies,
+--embed-rpm the embedding quota (requests per minute) the client keeps to,
+which is what makes a long document slow to index.
+
+Usage: python bench_progressive.py [--pages 50,100,200,400] [--embed-ms 1000] [--llm-ms 1500] [--embed-rpm 60]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+FILLER_TOPICS = [
+    "DELIVERY", "INSPECTION AND ACCEPTANCE", "INSURANCE", "RECORDS AND AUDIT", "PERSONNEL", "FACILITIES",
+    "REPORTING", "CHANGE ORDERS", "QUALITY STANDARDS", "SUBCONTRACTING", "FORCE MAJEURE", "NOTICES",
+]
+NOUNS = ["Supplier", "Customer", "Project Manager", "site lead", "quality team", "account manager"]
+OBJECTS = ["shipment", "work order", "inspection report", "maintenance log", "delivery schedule",
+           "staffing plan", "safety checklist", "status report", "equipment list", "site survey"]
+VERBS = ["prepare", "review", "update", "submit", "approve", "file", "verify", "archive"]
+
+CATEGORY_SECTIONS = [
+    (0.35, "FEES AND PAYMENT",
+     "The Customer authorizes the Supplier to charge a recurring subscription fee that renews automatically "
+     "each month unless cancelled thirty days in advance. The Supplier may add late fees of 5% per month and "
+     "change its pricing at any time without notice. Hidden service charges apply to every renewal."),
+    (0.55, "LIMITATION OF LIABILITY AND ARBITRATION",
+     "The Supplier is not liable for any damages whatsoever. Any dispute shall be resolved by binding "
+     "arbitration, and the Customer waives any right to a jury trial or to join a class action. The "
+     "Customer shall indemnify the Supplier against all claims."),
+    (0.7, "TERMINATION",
+     "The Supplier may suspend or terminate the Customer's account at any time, for any reason or no reason, "
+     "without notice. Upon termination all fees paid are forfeited and the Customer's data may be deleted "
+     "immediately."),
+    (0.85, "INTELLECTUAL PROPERTY",
+     "The Customer grants the Supplier a perpetual, irrevocable, worldwide, royalty-free license to use, "
+     "copy and sell any content the Customer uploads. The Supplier owns all feedback and derivative works."),
+    (0.95, "DATA PROTECTION AND PRIVACY",
+     "The Supplier may collect personal information about the Customer's staff and sell or share it with "
+     "advertising partners and other third parties. Cookies track users across websites."),
+]
+
+
+def filler_paragraph(rng, number: str) -> str:
+    sentences = []
+    for _ in range(rng.randint(4, 6)):
+        sentences.append(
+            f"The {rng.choice(NOUNS)} shall {rng.choice(VERBS)} each {rng.choice(OBJECTS)} within "
+            f"{rng.randint(2, 90)} days of the {rng.choice(OBJECTS)} for site {rng.randint(100, 999)}"
+            f" and keep record {rng.randint(1000, 99999)} on file."
+        )
+    return f"{number} " + " ".join(sentences)
+
+
+def write_agreement(path: str, pages: int):
+    import fitz
+
+    rng = random.Random(pages)
+    placed = {max(2, int(pages * fraction)): (title, text) for fraction, title, text in CATEGORY_SECTIONS}
+    doc = fitz.open()
+    section = 0
+    for page_num in range(1, pages + 1):
+        parts = []
+        if page_num in placed:
+            section += 1
+            title, text = placed[page_num]
+            parts += [f"{section}. {title}", f"{section}.1 {text}"]
+        if page_num % 2 == 1 or page_num - 1 in placed:
+            section += 1
+            parts.append(f"{section}. {FILLER_TOPICS[section % len(FILLER_TOPICS)]}")
+        parts += [filler_paragraph(rng, f"{section}.{i + 2}") for i in range(3)]
+        doc.new_page().insert_textbox(fitz.Rect(50, 40, 560, 800), "\n\n".join(parts), fontsize=9)
+    doc.save(path)
+
+
+def configure_env(workdir: str, args):
+    os.environ["MODEL_PROVIDER"] = "fake"
+    os.environ["FAKE_EMBED_LATENCY_MS"] = str(args.embed_ms)
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_ms)
+    os.environ["FAKE_LATENCY_JITTER"] = "0"
+    os.environ["EMBED_REQUESTS_PER_MINUTE"] = str(args.embed_rpm)
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "0"
+    os.environ["VECTOR_BACKEND"] = "numpy"
+    os.environ["NUMPY_INDEX_PATH"] = os.path.join(workdir, "numpy_index")
+    os.environ["REPORT_CACHE_PATH"] = os.path.join(workdir, "report_cache.sqlite3")
+    os.environ["PAGE_TEXT_DB_PATH"] = os.path.join(workdir, "page_texts.sqlite3")
+    os.environ["VERSIONS_DB_PATH"] = os.path.join(workdir, "versions.sqlite3")
+    # Every document is progressive here, so short ones show the overhead
+    os.environ["PROGRESSIVE_MIN_PAGES"] = "1"
+
+
+def flag_key(flag) -> list:
+    return [flag.category, flag.risk_level, flag.quote, flag.page_number]
+
+
+async def run(path: str, progressive: bool) -> dict:
+    from agent import LegalAgent
+    from db import close_shared_clients
+    from ingest import ingest_document
+    from progressive import iter_progressive_analysis
+
+    agent = LegalAgent()
+    await asyncio.to_thread(agent.prepare_category_embeddings)
+    result = {"windows": 1, "first": None, "first_completeness": 1.0, "partial": None, "calls": 0}
+    models = agent.client.aio.models
+    generate = models.generate_content
+
+    async def counting(**kwargs):
+        result["calls"] += 1
+        return await generate(**kwargs)
+
+    models.generate_content = counting
+    start = time.perf_counter()
+    try:
+        if progressive:
+            events = iter_progressive_analysis(agent, file_path=path)
+        else:
+            ingested = await asyncio.to_thread(ingest_document, path)
+            result["chunks"] = ingested.num_chunks
+            events = agent.iter_analysis(ingested.document_id, ingested.text_hash)
+        async for event in events:
+            kind = event["event"]
+            if kind == "ingest_progress" and event["stage"] == "window":
+                result["windows"] = event["windows"]
+            elif kind == "ingested":
+                result["chunks"] = event["num_chunks"]
+            elif kind == "category" and result["first"] is None and event["red_flags"]:
+                result["first"] = time.perf_counter() - start
+                result["first_completeness"] = event.get("completeness", 1.0)
+            elif kind == "partial_report" and result["partial"] is None:
+                result["partial"] = [flag_key(flag) for flag in event["report"].red_flags]
+            elif kind == "report":
+                result["report"] = time.perf_counter() - start
+                result["flags"] = [flag_key(flag) for flag in event["report"].red_flags]
+    finally:
+        await close_shared_clients()
+    return result
+
+
+def child(args):
+    workdir = tempfile.mkdtemp(prefix="bench_progressive_run_")
+    configure_env(workdir, args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        print(json.dumps(asyncio.run(run(args.run, args.mode == "progressive"))))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def measure(path: str, mode: str, args) -> dict:
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run", path, "--mode", mode,
+         "--embed-ms", str(args.embed_ms), "--llm-ms", str(args.llm_ms), "--embed-rpm", str(args.embed_rpm)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_progressive_")
+    try:
+        print(f"{'pages':>5} {'chunks':>6} {'windows':>7} {'full first':>10} {'full report':>11} "
+              f"{'prog first':>16} {'prog report':>11} {'same':>5} {'early':>6} {'calls':>7}")
+        for pages in [int(value) for value in args.pages.split(",")]:
+            path = os.path.join(workdir, f"agreement_{pages}.pdf")
+            write_agreement(path, pages)
+            full = measure(path, "full", args)
+            prog = measure(path, "progressive", args)
+            final = {json.dumps(flag) for flag in prog["flags"]}
+            early = sum(json.dumps(flag) in final for flag in prog["partial"] or []) / max(1, len(final))
+            print(f"{pages:>5} {prog['chunks']:>6} {prog['windows']:>7} {full['first']:9.2f}s "
+                  f"{full['report']:10.2f}s {prog['first']:6.2f}s ({prog['first_completeness']:4.0%}) "
+                  f"{prog['report']:10.2f}s {str(full['flags'] == prog['flags']):>5} {early:6.0%} "
+                  f"{full['calls']:>3}/{prog['calls']:<3}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="50,100,200,400", help="comma-separated agreement lengths")
+    parser.add_argument("--embed-ms", type=int, default=1000, help="fake latency of one embedding call")
+    parser.add_argument("--llm-ms", type=int, default=1500, help="fake latency of one model call")
+    parser.add_argument("--embed-rpm", type=int, default=60, help="embedding requests per minute (0 = no quota)")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=["full", "progressive"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        child(args)
+    else:
+        main(args)
@@ -0,0 +1,175 @@
+"""
+Measures the local quote locator (quote_locator.py) on the bundled docs/ PDFs.
+
+1. Prompt tokens (chars / 4) the [Page X] tags added to the five category
+   audit contexts, now that audit prompts are sent without them.
+2. Locating sampled quotes. Passages of 12-40 words are cut from the page
+   texts, so their page is known, and handed to locate() as a model might
+   return them:
+   - verbatim: whitespace collapsed
+   - restyled: straight quotes swapped for curly ones, first letter recased,
+     closing punctuation dropped
+   - elided:   middle third replaced by "..."
+   - reworded: about one word in eight dropped or replaced
+   - invented: the passage's words shuffled (must not be found)
+   Reported: share found (exact / fuzzy), page correct among found, and mean
+   locate time. For comparison, the tag the old prompts put before the chunk
+   holding each passage: a single [Page X] names the page, a [Pages X-Y]
+   range left the model to guess.
+
+Runs against the offline fake provider with the numpy backend.
+
+Usage: python bench_quote_locator.py [--quotes 300] [pdf ...]
+"""
+import argparse
+import asyncio
+import glob
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs")
+VARIANTS = ("verbatim", "restyled", "elided", "reworded", "invented")
+FILLER = ["the", "any", "such", "all", "this", "other", "shall", "may"]
+
+
+def configure_env():
+    workdir = tempfile.mkdtemp(prefix="bench_quote_locator_")
+    os.environ["MODEL_PROVIDER"] = "fake"
+    os.environ["FAKE_EMBED_LATENCY_MS"] = "0"
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "0"
+    os.environ["INCREMENTAL_INGEST"] = "0"
+    os.environ["VECTOR_BACKEND"] = "numpy"
+    os.environ["NUMPY_INDEX_PATH"] = os.path.join(workdir, "numpy_index")
+    os.environ["PAGE_TEXT_DB_PATH"] = os.path.join(workdir, "page_texts.sqlite3")
+    return workdir
+
+
+def variant(kind: str, words, rng):
+    if kind == "verbatim":
+        return " ".join(words)
+    if kind == "restyled":
+        text = " ".join(words).replace('"', "“").replace("'", "’").rstrip(".,;:")
+        return text[:1].swapcase() + text[1:]
+    if kind == "elided":
+        third = len(words) // 3
+        return " ".join(words[:third]) + " ... " + " ".join(words[-third:])
+    if kind == "reworded":
+        reworded = []
+        for word in words:
+            roll = rng.random()
+            if roll < 0.06:
+                continue
+            reworded.append(rng.choice(FILLER) if roll < 0.12 else word)
+        return " ".join(reworded)
+    shuffled = list(words)
+    rng.shuffle(shuffled)
+    return " ".join(shuffled)
+
+
+def sample_passages(locator, pages, rng, count):
+    """(page number, raw words) cut from one page's indexed (non header/footer) words."""
+    texts = {page[0]: page[1] for page in pages}
+    bounds = list(locator._page_first_word) + [len(locator.words)]
+    passages = []
+    while len(passages) < count:
+        page_index = rng.randrange(len(locator.page_numbers))
+        first_word, end_word = bounds[page_index], bounds[page_index + 1]
+        length = rng.randint(12, 40)
+        if end_word - first_word < length:
+            continue
+        start = rng.randrange(first_word, end_word - length + 1)
+        page = locator.page_numbers[page_index]
+        raw = texts[page][locator._starts[start]:locator._ends[start + length - 1]]
+        passages.append((page, raw.split()))
+    return passages
+
+
+def chunk_tag(passage_words, chunks):
+    """(first, last) page of the tag before the chunk holding the passage, or None."""
+    from quote_locator import quote_words
+
+    needle = f" {' '.join(quote_words(' '.join(passage_words)))} "
+    for text, meta in chunks:
+        if needle in text:
+            start = meta.get("page_start", meta.get("page"))
+            return start, meta.get("page_end", start)
+    return None
+
+
+async def main(paths, quotes):
+    from agent import LegalAgent
+    from db import close_shared_clients, get_vector_store
+    from ingest import ingest_document
+    from page_texts import get_page_text_store
+    from quote_locator import QuoteLocator, quote_words
+
+    store = get_vector_store()
+    agent = LegalAgent()
+    rng = random.Random(0)
+    rows = {kind: {"found": 0, "exact": 0, "correct": 0, "ms": [], "n": 0} for kind in VARIANTS}
+    tags = {"single": 0, "range": 0, "n": 0}
+
+    print(f"{'document':<32} {'pages':>5} {'build':>8} {'tag tokens':>10} {'context tokens':>14}")
+    try:
+        for path in paths:
+            result = await asyncio.to_thread(ingest_document, path)
+            pages = get_page_text_store().get(result.document_id)
+            start = time.perf_counter()
+            locator = QuoteLocator(pages)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            contexts = await asyncio.to_thread(agent._query_categories, result.document_id)
+            tagged = sum(len(agent._format_context(docs, metas)) // 4 for docs, metas in contexts.values())
+            plain = sum(len(agent._format_context(docs, metas, pages=False)) // 4 for docs, metas in contexts.values())
+            print(f"{os.path.basename(path)[:32]:<32} {len(pages):>5} {build_ms:6.1f}ms {tagged - plain:>10} "
+                  f"{plain:>14}")
+
+            docs, metas = store.get_all(result.document_id)
+            chunks = [(f" {' '.join(quote_words(doc))} ", meta) for doc, meta in zip(docs, metas)]
+            for page, words in sample_passages(locator, pages, rng, quotes // len(paths)):
+                tag = chunk_tag(words, chunks)
+                if tag is not None:
+                    tags["n"] += 1
+                    tags["single" if tag[0] == tag[1] else "range"] += 1
+                for kind in VARIANTS:
+                    quote = variant(kind, words, rng)
+                    start = time.perf_counter()
+                    match = locator.locate(quote)
+                    row = rows[kind]
+                    row["ms"].append((time.perf_counter() - start) * 1000)
+                    row["n"] += 1
+                    if match is not None:
+                        row["found"] += 1
+                        row["exact"] += match["match"] == "exact"
+                        row["correct"] += match["page"] == page
+    finally:
+        await close_shared_clients()
+
+    print(f"\n{'quotes':<10} {'found':>7} {'exact':>7} {'fuzzy':>7} {'page ok':>8} {'locate':>9}")
+    for kind, row in rows.items():
+        found = row["found"] or 1
+        print(f"{kind:<10} {row['found'] / row['n']:7.1%} {row['exact'] / row['n']:7.1%} "
+              f"{(row['found'] - row['exact']) / row['n']:7.1%} {row['correct'] / found:8.1%} "
+              f"{statistics.mean(row['ms']):7.2f}ms")
+    n = max(1, tags["n"])
+    print(f"\nold [Page] tags: {tags['single'] / n:.1%} single page, {tags['range'] / n:.1%} a page range")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--quotes", type=int, default=300, help="sampled passages across all documents")
+    args = parser.parse_args()
+
+    workdir = configure_env()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        paths = args.pdfs or sorted(glob.glob(os.path.join(DOCS_DIR, "*.pdf")))
+        asyncio.run(main(paths, args.quotes))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
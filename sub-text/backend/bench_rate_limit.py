@@ -0,0 +1,149 @@
+"""
+Holds a mixed load against a simulated server quota and compares:
+
+- legacy:   fixed semaphore (LLM_MAX_CONCURRENCY) + exponential backoff on 429
+- no quota: the shared limiter as shipped, with no client-side quota
+            configured: the AIMD window, server retry delays and the
+            request rate it learns from 429s
+- quota:    the same limiter with LLM_REQUESTS_PER_MINUTE set to the server quota
+
+The load is a burst of distinct background calls (audits) with interactive
+chat calls arriving every --chat-interval seconds. Reported per mode: goodput
+against the quota, 429s the server returned, calls that still failed after
+retries, and chat latency. A final run fires identical calls together to
+show coalescing.
+
+Runs against the offline fake provider, whose FAKE_LLM_REQUESTS_PER_MINUTE
+quota answers over-quota calls with a 429 carrying a retry delay.
+
+Usage: python bench_rate_limit.py [--quota 600] [--calls 300] [--latency-ms 500]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+
+MODE_LABELS = {"legacy": "legacy", "adaptive": "no quota", "quota": "quota"}
+
+
+def configure_env(args):
+    os.environ["MODEL_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_REQUESTS_PER_MINUTE"] = str(args.quota)
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["LLM_MAX_RETRIES"] = str(args.retries)
+    os.environ["LLM_MAX_CONCURRENCY"] = str(args.concurrency)
+
+
+async def legacy_generate(client, semaphore, prompt, config, retries):
+    """The previous _generate: fixed concurrency, jittered exponential backoff."""
+    from rate_limit import is_retryable
+
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore:
+                return await client.aio.models.generate_content(model="m", contents=prompt, config=config)
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            await asyncio.sleep(1.0 * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+async def run_mode(mode: str, args):
+    import rate_limit
+    from agent import LegalAgent
+    from google.genai import types
+    from providers import FakeGenaiClient
+
+    os.environ["LLM_REQUESTS_PER_MINUTE"] = str(args.quota) if mode == "quota" else "0"
+    rate_limit._limiters.clear()
+    agent = LegalAgent()
+    agent.client = FakeGenaiClient()
+    quota = agent.client.models.settings.quotas["generate"]
+    config = types.GenerateContentConfig()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def call(prompt):
+        if mode == "legacy":
+            return await legacy_generate(agent.client, semaphore, prompt, config, args.retries)
+        return await agent._generate(prompt, config, operation="bench")
+
+    async def background(i):
+        try:
+            await call(f"audit {i}")
+            return True
+        except Exception:
+            return False
+
+    chat_latencies, chat_failures = [], 0
+
+    async def chats(done: asyncio.Event):
+        nonlocal chat_failures
+        i = 0
+        while not done.is_set():
+            await asyncio.sleep(args.chat_interval)
+            start = time.perf_counter()
+            try:
+                with rate_limit.interactive():
+                    await call(f"chat {i}")
+                chat_latencies.append(time.perf_counter() - start)
+            except Exception:
+                chat_failures += 1
+            i += 1
+
+    done = asyncio.Event()
+    chat_task = asyncio.ensure_future(chats(done))
+    start = time.perf_counter()
+    results = await asyncio.gather(*[background(i) for i in range(args.calls)])
+    elapsed = time.perf_counter() - start
+    done.set()
+    await chat_task
+
+    ok = sum(results)
+    goodput = (ok + len(chat_latencies)) / elapsed * 60
+    latency = "n/a"
+    if chat_latencies:
+        ordered = sorted(chat_latencies)
+        latency = (f"p50={statistics.median(ordered) * 1000:.0f}ms "
+                   f"p95={ordered[round(0.95 * (len(ordered) - 1))] * 1000:.0f}ms")
+    print(f"  {MODE_LABELS[mode]:<9} {elapsed:6.1f}s  "
+          f"goodput={goodput:6.0f}/min ({goodput / args.quota:4.0%} of quota)  429s={quota.rejected:<5} failed={args.calls - ok + chat_failures:<4} chat {latency}")
+
+
+async def run_coalescing(args):
+    import rate_limit
+    from agent import LegalAgent
+    from google.genai import types
+    from providers import FakeGenaiClient
+
+    os.environ["LLM_REQUESTS_PER_MINUTE"] = "0"
+    rate_limit._limiters.clear()
+    agent = LegalAgent()
+    agent.client = FakeGenaiClient()
+    await asyncio.gather(*[
+        agent._generate("same prompt", types.GenerateContentConfig(), operation="bench") for _ in range(20)
+    ])
+    print(f"  coalescing: 20 identical concurrent calls -> "
+          f"{agent.client.models.settings.quotas['generate'].accepted} upstream call(s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quota", type=int, default=600, help="server quota, requests per minute")
+    parser.add_argument("--calls", type=int, default=300, help="background calls in the burst")
+    parser.add_argument("--latency-ms", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16, help="LLM_MAX_CONCURRENCY")
+    parser.add_argument("--retries", type=int, default=3, help="LLM_MAX_RETRIES")
+    parser.add_argument("--chat-interval", type=float, default=0.5, help="seconds between chat calls")
+    args = parser.parse_args()
+
+    configure_env(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    print(f"quota={args.quota}/min  burst={args.calls} calls  latency={args.latency_ms}ms  "
+          f"max concurrency={args.concurrency}  retries={args.retries}")
+    for mode in ("legacy", "adaptive", "quota"):
+        asyncio.run(run_mode(mode, args))
+    asyncio.run(run_coalescing(args))
@@ -0,0 +1,134 @@
+"""
+Compares chat retrieval modes on the bundled docs/ PDFs:
+
+- vector:    embed the query, vector search (RETRIEVAL_MODE=vector)
+- hybrid:    vector and BM25 rankings fused by reciprocal rank, every query embedded
+- fast path: hybrid, but confident keyword queries are answered by BM25 alone
+             without an embedding call (the default chat path)
+
+Queries are known-item: each is built from one sampled sentence of a document
+and counts as found when a chunk containing that sentence is in the top 5.
+Two kinds are sampled per sentence:
+- keywords: its three rarest terms, as a reader would search ("termination fee $500")
+- phrase:   its first twelve words, a partial quote
+
+Reported per mode and kind: mean and p95 latency of one retrieval, hit@5,
+and the share of queries that skipped the embedding call.
+
+Runs against the offline fake provider (FAKE_EMBED_LATENCY_MS stands in for
+the embedding round trip) with the embedding cache off, so every embedded
+query pays it. The fake's hashed bag-of-words vectors are themselves nearly
+lexical; pass --live to embed with gemini-embedding-001 (GOOGLE_API_KEY).
+
+Usage: python bench_retrieval.py [--queries 60] [--embed-latency-ms 50] [--live] [pdf ...]
+"""
+import argparse
+import asyncio
+import glob
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs")
+
+
+def configure_env(args):
+    workdir = tempfile.mkdtemp(prefix="bench_retrieval_")
+    if not args.live:
+        os.environ["MODEL_PROVIDER"] = "fake"
+        os.environ["FAKE_EMBED_LATENCY_MS"] = str(args.embed_latency_ms)
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "0"
+    os.environ["INCREMENTAL_INGEST"] = "0"
+    os.environ["CHROMA_PATH"] = os.path.join(workdir, "chroma")
+    os.environ["NUMPY_INDEX_PATH"] = os.path.join(workdir, "numpy_index")
+    return workdir
+
+
+def sample_queries(document_id, index, rng, count):
+    """(document_id, kind, query, target chunk positions) built from sentences of the document's chunks."""
+    from chunking import SENTENCE_SPLIT
+    from lexical_index import tokenize
+
+    sentences = []
+    for chunk in index.chunks:
+        sentences.extend(s for s in SENTENCE_SPLIT.split(chunk) if 80 <= len(s) <= 400)
+    sentences = list(dict.fromkeys(sentences))
+    rng.shuffle(sentences)
+
+    queries = []
+    for sentence in sentences[:count]:
+        targets = {i for i, chunk in enumerate(index.chunks) if sentence in chunk}
+        words = sentence.split()
+        terms = sorted(set(tokenize(sentence)), key=lambda term: -index.idf(term))[:3]
+        queries.append((document_id, "keywords", " ".join(terms), targets))
+        queries.append((document_id, "phrase", " ".join(words[:12]), targets))
+    return queries
+
+
+async def run_mode(agent, store, queries, mode):
+    from telemetry import CHAT_RETRIEVAL
+
+    agent.retrieval_mode = "vector" if mode == "vector" else "hybrid"
+    agent.lexical_fast_path_confidence = 1.0 if mode == "fast path" else float("inf")
+    rows = {}
+    for document_id, kind, query, targets in queries:
+        start = time.perf_counter()
+        (docs, _), path = await agent._retrieve_for_query(document_id, query)
+        elapsed = time.perf_counter() - start
+        chunks = store.lexical_index(document_id).chunks
+        hit = any(chunks.index(doc) in targets for doc in docs)
+        row = rows.setdefault(kind, {"latency": [], "hits": 0, "lexical": 0})
+        row["latency"].append(elapsed * 1000)
+        row["hits"] += hit
+        row["lexical"] += path == "lexical"
+    return rows
+
+
+async def main(args):
+    from agent import LegalAgent
+    from db import close_shared_clients, get_vector_store
+    from ingest import ingest_document
+
+    paths = args.pdfs or sorted(glob.glob(os.path.join(DOCS_DIR, "*.pdf")))
+    store = get_vector_store()
+    rng = random.Random(0)
+    queries = []
+    for path in paths:
+        result = await asyncio.to_thread(ingest_document, path)
+        index = store.lexical_index(result.document_id)
+        queries.extend(sample_queries(result.document_id, index, rng, args.queries // len(paths)))
+
+    agent = LegalAgent()
+    print(f"provider={os.environ.get('MODEL_PROVIDER', 'gemini')}  {len(paths)} documents  {len(queries)} queries")
+    print(f"\n{'mode':<10} {'kind':<9} {'mean':>8} {'p95':>8} {'hit@5':>7} {'no embed':>9}")
+    try:
+        for mode in ("vector", "hybrid", "fast path"):
+            rows = await run_mode(agent, store, queries, mode)
+            for kind, row in rows.items():
+                latencies = sorted(row["latency"])
+                count = len(latencies)
+                p95 = latencies[min(count - 1, int(count * 0.95))]
+                print(f"{mode:<10} {kind:<9} {statistics.mean(latencies):6.1f}ms {p95:6.1f}ms "
+                      f"{row['hits'] / count:7.1%} {row['lexical'] / count:9.1%}")
+    finally:
+        await close_shared_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--queries", type=int, default=60, help="sampled sentences (two queries each)")
+    parser.add_argument("--embed-latency-ms", type=int, default=50, help="fake embedding round trip")
+    parser.add_argument("--live", action="store_true", help="embed with Gemini instead of the fake provider")
+    args = parser.parse_args()
+
+    workdir = configure_env(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        asyncio.run(main(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,85 @@
+"""
+Measures the per-query overhead of building a VectorStore for every call
+(the old `_query_db` behaviour) versus reusing the process-wide store.
+
+Queries use precomputed vectors against a throwaway Chroma directory, so no
+Gemini calls are made and the numbers isolate client/collection setup cost.
+
+Usage: python bench_store_setup.py [iterations]
+"""
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-placeholder")
+os.environ["CHROMA_PATH"] = tempfile.mkdtemp(prefix="bench_chroma_")
+os.environ["EMBEDDING_CACHE_ENABLED"] = "0"
+
+import db
+
+DOC_ID = "benchmark"
+DIM = 768
+NUM_CHUNKS = 200
+
+
+def seed():
+    store = db.get_vector_store()
+    rng = random.Random(0)
+    collection = store._collection(DOC_ID)
+    collection.add(
+        ids=[str(i) for i in range(NUM_CHUNKS)],
+        documents=[f"chunk {i}" for i in range(NUM_CHUNKS)],
+        embeddings=[[rng.random() for _ in range(DIM)] for _ in range(NUM_CHUNKS)],
+        metadatas=[{"page": i // 4 + 1} for i in range(NUM_CHUNKS)]
+    )
+    store._touch(DOC_ID)
+
+
+def query_vector():
+    return [random.random() for _ in range(DIM)]
+
+
+def per_call(iterations: int):
+    timings = []
+    for _ in range(iterations):
+        vector = query_vector()
+        start = time.perf_counter()
+        # What every category / chat turn used to pay
+        db._genai_client = None
+        store = db.VectorStore()
+        store._collection(DOC_ID).query(query_embeddings=[vector], n_results=5)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def shared(iterations: int):
+    store = db.get_vector_store()
+    timings = []
+    for _ in range(iterations):
+        vector = query_vector()
+        start = time.perf_counter()
+        store._collection(DOC_ID).query(query_embeddings=[vector], n_results=5)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label: str, timings):
+    ms = [t * 1000 for t in timings]
+    print(f"{label:<28} mean={statistics.mean(ms):7.2f}ms  p50={statistics.median(ms):7.2f}ms  "
+          f"p95={sorted(ms)[int(len(ms) * 0.95) - 1]:7.2f}ms")
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    seed()
+    print(f"--- VectorStore setup overhead ({iterations} queries, {NUM_CHUNKS} chunks) ---")
+    before = per_call(iterations)
+    after = shared(iterations)
+    report("new VectorStore per query", before)
+    report("shared VectorStore", after)
+    print(f"Overhead removed per query: {(statistics.mean(before) - statistics.mean(after)) * 1000:.2f}ms")
+    shutil.rmtree(os.environ["CHROMA_PATH"], ignore_errors=True)
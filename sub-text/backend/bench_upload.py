@@ -0,0 +1,131 @@
+"""
+Concurrent-upload benchmark for the /analyze request path.
+
+Every request uploads a different PDF (a docs/ file with a unique trailing
+comment) under the same filename, the case where per-filename temp files
+collide. Reported per concurrency level:
+
+- p50/p95: request latency
+- disk/req: bytes the server process wrote to storage per request
+  (/proc/self/io write_bytes, so it includes the vector index)
+- wrong: responses whose document_id is not the hash of the bytes sent
+- failed: non-200 responses; leaked: files left behind in the working directory
+
+Then an oversized and a non-PDF upload, which must be refused (413/400)
+without being parsed.
+
+Runs in-process through the ASGI app against the offline fake provider with
+the report and embedding caches off and zero simulated latency, so the
+upload and parse path is what is timed. Uses the numpy vector backend.
+
+Usage: python bench_upload.py [--levels 1,8,32] [--requests 32] [pdf ...]
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs")
+
+
+def configure_env():
+    workdir = tempfile.mkdtemp(prefix="bench_upload_")
+    os.environ["MODEL_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = "0"
+    os.environ["FAKE_EMBED_LATENCY_MS"] = "0"
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "0"
+    os.environ["REPORT_CACHE_ENABLED"] = "0"
+    os.environ["INCREMENTAL_INGEST"] = "0"
+    os.environ["VECTOR_BACKEND"] = "numpy"
+    os.environ["NUMPY_INDEX_PATH"] = os.path.join(workdir, "numpy_index")
+    os.environ["MAX_DOCUMENTS"] = "100000"
+    return workdir
+
+
+def write_bytes() -> int:
+    try:
+        with open("/proc/self/io") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("write_bytes"))
+    except (OSError, StopIteration):
+        return 0
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run_level(client, pdf: bytes, level: int, total: int):
+    semaphore = asyncio.Semaphore(level)
+    latencies, wrong, failed = [], 0, 0
+
+    async def one():
+        nonlocal wrong, failed
+        data = pdf + f"\n%bench-{uuid.uuid4().hex}\n".encode()
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/analyze", files={"file": ("contract.pdf", data, "application/pdf")})
+            latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            failed += 1
+        elif response.json()["document_id"] != hashlib.sha256(data).hexdigest()[:32]:
+            wrong += 1
+
+    written = write_bytes()
+    await asyncio.gather(*[one() for _ in range(total)])
+    per_request = (write_bytes() - written) / total
+    print(f"  concurrency={level:<3} n={total:<4} p50={statistics.median(latencies):7.1f}ms "
+          f"p95={percentile(latencies, 0.95):7.1f}ms  disk/req={per_request / 1024:7.0f}KB  "
+          f"wrong={wrong}  failed={failed}")
+
+
+async def main(paths, levels, requests):
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for path in paths:
+                with open(path, "rb") as f:
+                    pdf = f.read()
+                print(f"\n{os.path.basename(path)} ({len(pdf) / 1024:.0f}KB)")
+                for level in levels:
+                    await run_level(client, pdf, level, max(level, requests))
+
+            print("\nrejections")
+            for name, data in (("oversized.pdf", b"%PDF-1.4\n" + b"0" * (64 * 1024 * 1024)),
+                               ("notes.pdf", b"not a pdf at all")):
+                start = time.perf_counter()
+                response = await client.post("/analyze", files={"file": (name, data, "application/pdf")})
+                print(f"  {name:<14} {response.status_code}  {(time.perf_counter() - start) * 1000:7.1f}ms  "
+                      f"{response.json().get('detail', '')[:70]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--levels", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    args = parser.parse_args()
+
+    workdir = configure_env()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    paths = args.pdfs or sorted(glob.glob(os.path.join(DOCS_DIR, "*.pdf")))
+    levels = [int(level) for level in args.levels.split(",")]
+
+    rundir = os.path.join(workdir, "cwd")
+    os.makedirs(rundir)
+    os.chdir(rundir)
+    try:
+        asyncio.run(main(paths, levels, args.requests))
+        print(f"\nleaked files in the working directory: {sorted(os.listdir(rundir))}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
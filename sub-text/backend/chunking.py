@@ -0,0 +1,163 @@
+import re
+from typing import Iterable, Iterator, List, Tuple
+
+# Lines that open a new section or numbered clause: "ARTICLE IV", "Section 12.",
+# "§ 3", "7.2 Fees", "(b) the Borrower ..."
+CLAUSE_START = re.compile(
+    r"""^\s*(?:
+        (?:ARTICLE|Article|SECTION|Section|CLAUSE|Clause)\s+[\dIVXLC]+\b
+      | §\s*\d+
+      | \d{1,3}(?:\.\d{1,3})*[.)]?\s+[A-Z(“"]
+      | \([a-zA-Z0-9]{1,4}\)\s+\S
+    )""",
+    re.X
+)
+# Lines that name a section rather than open a paragraph: "ARTICLE IV - FEES", "Section 12. Termination",
+# "7.2 Payment Terms" (lettered sub-clauses such as "(b) ..." are not sections)
+SECTION_START = re.compile(
+    r"""^\s*(?:
+        (?:ARTICLE|Article|SECTION|Section|CLAUSE|Clause)\s+[\dIVXLC]+\b
+      | §\s*\d+
+      | \d{1,3}(?:\.\d{1,3})*[.)]?\s+[A-Z(“"]
+    )""",
+    re.X
+)
+HEADING_MAX_CHARS = 80
+SENTENCE_END = re.compile(r"""[.:;!?]["'”’)\]]*$""")
+SENTENCE_SPLIT = re.compile(r"""(?<=[.!?])["'”’)\]]*\s+(?=[A-Z(“"]|\d)""")
+
+
+def _is_heading(line: str) -> bool:
+    letters = [c for c in line if c.isalpha()]
+    return len(line) <= 80 and len(letters) >= 4 and line.isupper()
+
+
+def _starts_clause(line: str) -> bool:
+    return bool(CLAUSE_START.match(line)) or _is_heading(line.strip())
+
+
+def section_headings(text: str) -> List[str]:
+    """Short lines of a chunk that start a section: numbered section titles and all-caps headings."""
+    headings = []
+    for line in text.splitlines():
+        line = line.strip()
+        if len(line) <= HEADING_MAX_CHARS and (SECTION_START.match(line) or _is_heading(line)):
+            headings.append(line)
+    return headings
+
+
+def split_units(text: str) -> List[str]:
+    """
+    Splits one page of extracted text into paragraph/clause units.
+    PDF text is hard-wrapped, so a paragraph ends on a blank line, before a
+    clause marker or heading, or after a sentence that stops short of the
+    page's usual line width.
+    """
+    lines = text.splitlines()
+    lengths = sorted(len(line.rstrip()) for line in lines if line.strip())
+    if not lengths:
+        return []
+    typical_width = lengths[int(len(lengths) * 0.9) - 1] if len(lengths) > 1 else lengths[0]
+
+    units = []
+    current: List[str] = []
+    for line in lines:
+        if not line.strip():
+            if current:
+                units.append("\n".join(current))
+                current = []
+            continue
+        if current:
+            prev = current[-1].rstrip()
+            ends_paragraph = SENTENCE_END.search(prev) and len(prev) < 0.85 * typical_width
+            if ends_paragraph or _starts_clause(line):
+                units.append("\n".join(current))
+                current = []
+        current.append(line.rstrip())
+    if current:
+        units.append("\n".join(current))
+    return units
+
+
+def _split_long(unit: str, max_chars: int) -> List[str]:
+    """Breaks an oversized unit at sentence boundaries (hard-cutting only run-on sentences)."""
+    if len(unit) <= max_chars:
+        return [unit]
+    pieces, current = [], ""
+    for sentence in SENTENCE_SPLIT.split(unit):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def iter_units(pages: Iterable[Tuple[int, str, int]]) -> Iterator[Tuple[str, int, int, bool]]:
+    """
+    Yields (text, page_start, page_end, starts_clause) for every unit in the
+    document. A paragraph cut off by a page break is rejoined with its
+    continuation on the next page.
+    """
+    pending = None  # Last unit of the previous page, if it ended mid-sentence
+    for page_num, text, _ in pages:
+        units = split_units(text)
+        if not units:
+            continue
+        if pending is not None:
+            unit_text, page_start, _, starts = pending
+            if not _starts_clause(units[0]):
+                units[0] = f"{unit_text}\n{units[0]}"
+                first = (units[0], page_start, page_num, starts)
+            else:
+                yield pending
+                first = (units[0], page_num, page_num, True)
+            pending = None
+        else:
+            first = (units[0], page_num, page_num, _starts_clause(units[0]))
+
+        page_units = [first] + [(u, page_num, page_num, _starts_clause(u)) for u in units[1:]]
+        last = page_units.pop()
+        yield from page_units
+        if SENTENCE_END.search(last[0].rstrip()):
+            yield last
+        else:
+            pending = last
+    if pending is not None:
+        yield pending
+
+
+def chunk_pages(pages: Iterable[Tuple[int, str, int]], max_chars: int = 1800,
+                min_chars: int = 500) -> Iterator[Tuple[str, int, int]]:
+    """
+    Structure-aware chunker. Packs whole paragraphs/clauses into chunks of at
+    most `max_chars`, starting a new chunk at a section or clause boundary once
+    the current one holds `min_chars`. Chunks can span page breaks and carry
+    (text, page_start, page_end). There is no overlap between chunks.
+    """
+    buf: List[str] = []
+    buf_len = 0
+    page_start = page_end = None
+
+    for unit_text, unit_start, unit_end, starts_clause in iter_units(pages):
+        for i, piece in enumerate(_split_long(unit_text, max_chars)):
+            boundary = starts_clause and i == 0 and buf_len >= min_chars
+            if buf and (buf_len + 1 + len(piece) > max_chars or boundary):
+                yield "\n".join(buf), page_start, page_end
+                buf, buf_len = [], 0
+            if not buf:
+                page_start = unit_start
+            buf.append(piece)
+            buf_len += len(piece) + (1 if buf_len else 0)
+            page_end = unit_end
+
+    if buf:
+        yield "\n".join(buf), page_start, page_end
@@ -1,64 +1,476 @@
+from abc import ABC, abstractmethod
 from google import genai
-import chromadb
-from chromadb import Documents, EmbeddingFunction, Embeddings
-from typing import List, Optional
+from google.genai import types
+from typing import Dict, List, Optional
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from lexical_index import LexicalIndex
+from page_texts import get_page_text_store
+from providers import FakeGenaiClient, get_provider_name
+from quote_locator import QuoteLocator
+from rate_limit import get_rate_limiter, is_retryable
+from telemetry import span
+import hashlib
 import os
+import random
+import re
+import threading
+import time
+import numpy as np
 
-class GeminiEmbeddingFunction(EmbeddingFunction):
-    def __init__(self, api_key: str, model_name: str = "models/gemini-embedding-001"):
-        self.client = genai.Client(api_key=api_key)
+# embed_content accepts at most this many texts per request
+MAX_EMBED_BATCH = 100
+EMBEDDING_MODEL = "models/gemini-embedding-001"
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+
+_genai_client: Optional[genai.Client] = None
+_genai_client_lock = threading.Lock()
+
+def get_genai_client() -> genai.Client:
+    """
+    Process-wide Gemini client. Sharing one client keeps its HTTP connection
+    pool warm across ingest, retrieval and chat instead of reconnecting per call.
+    MODEL_PROVIDER=fake swaps in the offline stand-in from providers.py.
+    """
+    global _genai_client
+    with _genai_client_lock:
+        if _genai_client is None and get_provider_name() == "fake":
+            _genai_client = FakeGenaiClient()
+        if _genai_client is None:
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise ValueError("GOOGLE_API_KEY not found in environment variables")
+            _genai_client = genai.Client(api_key=api_key)
+        return _genai_client
+
+class GeminiEmbeddingFunction:
+    def __init__(self, api_key: Optional[str] = None, model_name: str = "models/gemini-embedding-001",
+                 output_dimensionality: Optional[int] = None,
+                 cache: Optional[EmbeddingCache] = None,
+                 client: Optional[genai.Client] = None):
+        self.client = client or genai.Client(api_key=api_key)
         self.model_name = model_name
+        self.output_dimensionality = output_dimensionality
+        self.cache = cache
 
-    def __call__(self, input: Documents) -> Embeddings:
-        # Batch embedding support
-        response = self.client.models.embed_content(
-            model=self.model_name,
-            contents=input
-        )
-        return [e.values for e in response.embeddings]
+    @property
+    def signature(self) -> str:
+        """Vectors are only comparable between functions with the same signature."""
+        return f"{self.model_name}:{self.output_dimensionality or 'default'}"
+
+    def _embed_remote(self, texts: List[str]) -> List[List[float]]:
+        config = None
+        if self.output_dimensionality:
+            config = types.EmbedContentConfig(output_dimensionality=self.output_dimensionality)
+        vectors = []
+        # Respect the API's per-request batch limit
+        for i in range(0, len(texts), MAX_EMBED_BATCH):
+            vectors.extend(self._embed_batch(texts[i:i + MAX_EMBED_BATCH], config))
+        return vectors
+
+    def _embed_batch(self, texts: List[str], config) -> List[List[float]]:
+        """One embed_content call through the model's shared limiter, retried on 429/5xx."""
+        limiter = get_rate_limiter("embed", self.model_name)
+        tokens = sum(len(text) for text in texts) // 4
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            try:
+                # A 429 here shrinks the limiter's window and sets its cool-down,
+                # which paces the retry below along with every other caller
+                with limiter.slot_sync(tokens):
+                    response = self.client.models.embed_content(
+                        model=self.model_name,
+                        contents=texts,
+                        config=config
+                    )
+                vectors = [e.values for e in response.embeddings]
+                if self.output_dimensionality:
+                    # Only the full-size output comes normalized; truncated ones need it for cosine/L2 search
+                    matrix = np.asarray(vectors, dtype=np.float32)
+                    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+                    vectors = matrix.tolist()
+                return vectors
+            except Exception as e:
+                if attempt >= EMBED_MAX_RETRIES or not is_retryable(e):
+                    raise
+                print(f"Embedding call failed ({e}), retrying")
+                time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return self._embed_remote(list(input))
+
+        # Only chunks that have never been seen go to the remote API
+        keys = [EmbeddingCache.make_key(text, self.model_name, self.output_dimensionality) for text in input]
+        cached = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, input):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self._embed_remote(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(fresh)
+            cached.update(fresh)
+
+        return [cached[key] for key in keys]
+
+# Last access time per document id, shared by every store in the process
+_document_access: Dict[str, float] = {}
+_document_access_lock = threading.Lock()
+
+COLLECTION_PREFIX = "doc_"
+DOCUMENT_ID = re.compile(r"[0-9a-f]{32}")
+
+def compute_document_id(data: bytes) -> str:
+    """Content hash used to namespace a document's chunks."""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+def is_document_id(value: str) -> bool:
+    """True for ids compute_document_id can produce (32 lowercase hex digits); anything else is client input."""
+    return bool(DOCUMENT_ID.fullmatch(value))
+
+class BaseVectorStore(ABC):
+    """
+    Per-document chunk store. Subclasses provide the storage backend; this base
+    owns the embedding function, idle tracking/eviction, the text-query helpers
+    and each document's in-memory lexical (BM25) index and quote locator.
+    """
 
-class VectorStore:
     def __init__(self):
-        # Use a persistent client for now (or ephemeral for hackathon speed)
-        self.client = chromadb.PersistentClient(path="./chroma_db")
-        
         # Use Google Generative AI Embeddings
         # Note: You need to set GOOGLE_API_KEY env var
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables")
-            
+        # EMBEDDING_DIMENSIONALITY truncates the 3072-d output (e.g. 768 or 256): smaller
+        # indexes and faster queries for a little recall
         self.embedding_fn = GeminiEmbeddingFunction(
-            api_key=api_key,
-            model_name="models/gemini-embedding-001"
-        )
-        
-        self.collection = self.client.get_or_create_collection(
-            name="legal_docs",
-            embedding_function=self.embedding_fn
+            model_name=EMBEDDING_MODEL,
+            output_dimensionality=int(os.getenv("EMBEDDING_DIMENSIONALITY", "0")) or None,
+            cache=get_embedding_cache(),
+            client=get_genai_client()
         )
 
-    def add_documents(self, chunks: List[str], metadatas: List[dict]):
+        # Idle documents are dropped after this many seconds, or oldest-first above the size cap
+        self.ttl_seconds = float(os.getenv("DOCUMENT_TTL_SECONDS", "3600"))
+        self.max_documents = int(os.getenv("MAX_DOCUMENTS", "50"))
+
+        self._lexical: Dict[str, LexicalIndex] = {}
+        self._locators: Dict[str, QuoteLocator] = {}
+        self._index_lock = threading.Lock()
+
+    def _register_persisted(self, document_ids: List[str]):
+        # Documents persisted by a previous process start their idle clock now
+        now = time.time()
+        with _document_access_lock:
+            for document_id in document_ids:
+                _document_access.setdefault(document_id, now)
+
+    def _touch(self, document_id: str):
+        # Only content-hash ids are tracked, so eviction never deletes anything named by client input
+        if not is_document_id(document_id):
+            raise ValueError(f"Invalid document id: {document_id!r}")
+        with _document_access_lock:
+            _document_access[document_id] = time.time()
+
+    def has_document(self, document_id: str) -> bool:
+        with _document_access_lock:
+            known = document_id in _document_access
+        if not known:
+            return False
+        metadata = self._metadata(document_id)
+        # Ingest writes in batches; only a fully written document counts
+        if not metadata.get("complete"):
+            return False
+        if metadata.get("embedding", f"{EMBEDDING_MODEL}:default") != self.embedding_fn.signature:
+            # Indexed under another embedding model or dimensionality: unusable with our query vectors
+            print(f"Re-indexing {document_id}: embedded as {metadata.get('embedding', 'default')}")
+            self.delete_document(document_id)
+            return False
+        return True
+
+    def get_text_hash(self, document_id: str) -> Optional[str]:
+        return self._metadata(document_id).get("text_hash")
+
+    def _completion_metadata(self, text_hash: Optional[str]) -> dict:
+        metadata = {"complete": True, "embedding": self.embedding_fn.signature}
+        if text_hash:
+            metadata["text_hash"] = text_hash
+        return metadata
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embeds texts through the cached embedding function (for precomputing query vectors)."""
+        with span("embed_batch", texts=len(texts)):
+            return [list(map(float, v)) for v in self.embedding_fn(texts)]
+
+    def add_documents(self, document_id: str, chunks: List[str], metadatas: List[dict]):
         ids = [str(i) for i in range(len(chunks))]
-        self.collection.add(
-            documents=chunks,
-            metadatas=metadatas,
-            ids=ids
-        )
+        self.add_embedded(document_id, ids, chunks, self.embed(chunks), metadatas)
+        self.mark_complete(document_id)
+
+    def query(self, document_id: str, query_text: str, n_results: int = 5):
+        """
+        Returns (documents, metadatas) from the given document only.
+        """
+        return self.query_many(document_id, self.embed([query_text]), n_results)[0]
+
+    def index_lexical(self, document_id: str, chunks: List[str], metadatas: List[dict]):
+        """Builds the document's keyword index from its chunks in ingest order (called by ingest)."""
+        index = LexicalIndex(chunks, metadatas)
+        with self._index_lock:
+            self._lexical[document_id] = index
+
+    def lexical_index(self, document_id: str) -> LexicalIndex:
+        with self._index_lock:
+            index = self._lexical.get(document_id)
+        if index is None:
+            # Indexed by another process or before a restart: rebuild from the stored chunks
+            docs, metadatas = self.get_all(document_id)
+            index = LexicalIndex(docs, metadatas)
+            with self._index_lock:
+                index = self._lexical.setdefault(document_id, index)
+        return index
+
+    def index_pages(self, document_id: str, pages: List[tuple]):
+        """
+        Stores the document's (page number, text, stripped header/footer line
+        indexes) and builds its quote locator (called by ingest).
+        """
+        get_page_text_store().put(document_id, pages)
+        locator = QuoteLocator(pages)
+        with self._index_lock:
+            self._locators[document_id] = locator
+
+    def quote_locator(self, document_id: str) -> QuoteLocator:
+        with self._index_lock:
+            locator = self._locators.get(document_id)
+        if locator is None:
+            pages = get_page_text_store().get(document_id)
+            if pages is None:
+                # Indexed before page texts were stored: chunks stand in for pages, each on
+                # its first page, so offsets are relative to the chunk text
+                docs, metadatas = self.get_all(document_id)
+                pages = [(meta.get("page_start", meta.get("page", 0)), doc) for doc, meta in zip(docs, metadatas)]
+            locator = QuoteLocator(pages)
+            with self._index_lock:
+                locator = self._locators.setdefault(document_id, locator)
+        return locator
+
+    def delete_document(self, document_id: str):
+        with _document_access_lock:
+            _document_access.pop(document_id, None)
+        with self._index_lock:
+            self._lexical.pop(document_id, None)
+            self._locators.pop(document_id, None)
+        get_page_text_store().delete(document_id)
+        self._drop(document_id)
 
-    def query(self, query_text: str, n_results: int = 5):
+    def evict_idle(self, keep: Optional[str] = None) -> List[str]:
         """
-        Returns (documents, metadatas)
+        Drops documents idle for longer than the TTL, then the least recently
+        used ones until at most max_documents remain. `keep` is never evicted.
         """
-        results = self.collection.query(
-            query_texts=[query_text],
+        now = time.time()
+        with _document_access_lock:
+            by_age = sorted(_document_access.items(), key=lambda item: item[1])
+        expired = [doc_id for doc_id, last_used in by_age if now - last_used > self.ttl_seconds]
+        remaining = [doc_id for doc_id, _ in by_age if doc_id not in expired and doc_id != keep]
+        # Reserve a slot for `keep`, which may be about to be added
+        overflow = len(remaining) + (1 if keep else 0) - self.max_documents
+        if overflow > 0:
+            expired.extend(remaining[:overflow])
+
+        evicted = []
+        for doc_id in expired:
+            if doc_id == keep:
+                continue
+            self.delete_document(doc_id)
+            evicted.append(doc_id)
+        return evicted
+
+    # Backend-specific storage
+
+    @abstractmethod
+    def _metadata(self, document_id: str) -> dict:
+        """Document-level metadata written by mark_complete (empty while partially written)."""
+
+    @abstractmethod
+    def mark_complete(self, document_id: str, text_hash: Optional[str] = None):
+        """Records that every chunk is written, with the document-level metadata."""
+
+    @abstractmethod
+    def count(self, document_id: str) -> int:
+        """Number of chunks stored for the document."""
+
+    @abstractmethod
+    def add_embedded(self, document_id: str, ids: List[str], chunks: List[str],
+                     embeddings: List[List[float]], metadatas: List[dict]):
+        """Writes chunks whose embeddings were computed ahead of time (see ingest pipeline)."""
+
+    @abstractmethod
+    def update_metadatas(self, document_id: str, ids: List[str], metadatas: List[dict]):
+        """Replaces the metadata of already written chunks."""
+
+    @abstractmethod
+    def query_many(self, document_id: str, query_embeddings: List[List[float]], n_results: int = 5):
+        """
+        Runs several precomputed query vectors in one call.
+        Returns one (documents, metadatas) pair per query vector.
+        """
+
+    @abstractmethod
+    def get_all(self, document_id: str):
+        """Returns (documents, metadatas) for every chunk, in ingest order."""
+
+    @abstractmethod
+    def get_embedded(self, document_id: str):
+        """Returns (documents, embeddings, metadatas) for every chunk, in ingest order."""
+
+    @abstractmethod
+    def _drop(self, document_id: str):
+        """Deletes the document's stored chunks."""
+
+    def close(self):
+        pass
+
+def _chroma_embedding_function(fn: GeminiEmbeddingFunction):
+    """Adapts `fn` to chromadb's EmbeddingFunction interface, which collections require."""
+    from chromadb import EmbeddingFunction
+
+    class ChromaEmbeddingFunction(EmbeddingFunction):
+        def __init__(self):
+            pass
+
+        def __call__(self, input):
+            return fn(list(input))
+
+    return ChromaEmbeddingFunction()
+
+class VectorStore(BaseVectorStore):
+    """Chroma-backed store: one persistent collection per document."""
+
+    def __init__(self):
+        super().__init__()
+        # Imported here so the numpy backend never loads chromadb
+        import chromadb
+
+        # Use a persistent client for now (or ephemeral for hackathon speed)
+        self.client = chromadb.PersistentClient(path=os.getenv("CHROMA_PATH", "./chroma_db"))
+        self._chroma_embedding_fn = _chroma_embedding_function(self.embedding_fn)
+
+        # Collection handles are reused across queries instead of looked up every call
+        self._collections: Dict[str, object] = {}
+        self._collections_lock = threading.Lock()
+
+        self._register_persisted([
+            name[len(COLLECTION_PREFIX):]
+            for name in self._list_collection_names()
+            if name.startswith(COLLECTION_PREFIX)
+        ])
+
+    def _list_collection_names(self) -> List[str]:
+        return [c if isinstance(c, str) else c.name for c in self.client.list_collections()]
+
+    def _collection(self, document_id: str):
+        if not is_document_id(document_id):
+            raise ValueError(f"Invalid document id: {document_id!r}")
+        with self._collections_lock:
+            collection = self._collections.get(document_id)
+            if collection is None:
+                collection = self.client.get_or_create_collection(
+                    name=f"{COLLECTION_PREFIX}{document_id}",
+                    embedding_function=self._chroma_embedding_fn
+                )
+                self._collections[document_id] = collection
+            return collection
+
+    def _metadata(self, document_id: str) -> dict:
+        return self._collection(document_id).metadata or {}
+
+    def mark_complete(self, document_id: str, text_hash: Optional[str] = None):
+        self._collection(document_id).modify(metadata=self._completion_metadata(text_hash))
+
+    def count(self, document_id: str) -> int:
+        return self._collection(document_id).count()
+
+    def add_embedded(self, document_id: str, ids: List[str], chunks: List[str],
+                     embeddings: List[List[float]], metadatas: List[dict]):
+        self._touch(document_id)
+        self._collection(document_id).upsert(
+            ids=ids,
+            documents=chunks,
+            embeddings=embeddings,
+            metadatas=metadatas
+        )
+
+    def update_metadatas(self, document_id: str, ids: List[str], metadatas: List[dict]):
+        self._collection(document_id).update(ids=ids, metadatas=metadatas)
+
+    def query_many(self, document_id: str, query_embeddings: List[List[float]], n_results: int = 5):
+        self._touch(document_id)
+        results = self._collection(document_id).query(
+            query_embeddings=query_embeddings,
             n_results=n_results
         )
-        return results['documents'][0], results['metadatas'][0]
+        return list(zip(results['documents'], results['metadatas']))
 
-    def clear(self):
-        self.client.delete_collection("legal_docs")
-        self.collection = self.client.create_collection(
-            name="legal_docs",
-            embedding_function=self.embedding_fn
+    def get_all(self, document_id: str):
+        self._touch(document_id)
+        results = self._collection(document_id).get(include=["documents", "metadatas"])
+        order = sorted(range(len(results['ids'])), key=lambda i: int(results['ids'][i]))
+        return [results['documents'][i] for i in order], [results['metadatas'][i] for i in order]
+
+    def get_embedded(self, document_id: str):
+        self._touch(document_id)
+        results = self._collection(document_id).get(include=["documents", "embeddings", "metadatas"])
+        order = sorted(range(len(results['ids'])), key=lambda i: int(results['ids'][i]))
+        return (
+            [results['documents'][i] for i in order],
+            [list(map(float, results['embeddings'][i])) for i in order],
+            [results['metadatas'][i] for i in order]
         )
+
+    def _drop(self, document_id: str):
+        with self._collections_lock:
+            self._collections.pop(document_id, None)
+        try:
+            self.client.delete_collection(f"{COLLECTION_PREFIX}{document_id}")
+        except Exception as e:
+            print(f"Delete collection error for {document_id}: {e}")
+
+    def close(self):
+        with self._collections_lock:
+            self._collections.clear()
+        self.client.close()
+
+_store: Optional[BaseVectorStore] = None
+_store_lock = threading.Lock()
+
+def get_vector_store() -> BaseVectorStore:
+    """
+    Process-wide store, created on first use (normally at app startup).
+    VECTOR_BACKEND picks the implementation: "chroma" (default) or "numpy".
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.getenv("VECTOR_BACKEND", "chroma").lower()
+            if backend == "numpy":
+                from numpy_index import NumpyVectorStore
+                _store = NumpyVectorStore()
+            elif backend == "chroma":
+                _store = VectorStore()
+            else:
+                raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
+        return _store
+
+async def close_shared_clients():
+    """Releases the shared store and Gemini client. Called from the FastAPI lifespan."""
+    global _store, _genai_client
+    with _store_lock:
+        store, _store = _store, None
+    if store is not None:
+        store.close()
+    with _genai_client_lock:
+        client, _genai_client = _genai_client, None
+    if client is not None:
+        await client.aio.aclose()
+        client.close()
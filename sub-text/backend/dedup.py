@@ -0,0 +1,170 @@
+"""
+Near-duplicate removal in the ingest path.
+
+RunningLineStripper drops running headers and footers (lines repeated at the
+top or bottom of many pages, page numbers ignored) before chunking.
+
+ChunkDeduplicator finds chunks that are near-copies of an earlier chunk of
+the same document (boilerplate repeated per section, restated definitions)
+with MinHash signatures over word shingles and LSH banding. Copies are
+dropped before embedding; the earlier, canonical chunk records every page
+the text appears on. Chunks whose numbers differ are never merged, since in
+a contract "$50" and "$500" are different clauses.
+"""
+import hashlib
+import re
+import zlib
+from collections import Counter, defaultdict, deque
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Lines at each end of a page that can be a running header or footer
+EDGE_LINES = 3
+# Pages read before the first is released, so repeats are known from the start
+LOOKAHEAD_PAGES = 8
+# A running line is on at least this share of the pages seen (and on 3 or more)
+MIN_PAGE_SHARE = 0.5
+MIN_PAGES = 3
+
+NUM_PERMUTATIONS = 64
+BANDS = 16  # 4 rows per band: pairs above ~0.5 similarity share a bucket
+SHINGLE_WORDS = 5
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, _PRIME, size=(NUM_PERMUTATIONS, 1)).astype(np.int64)
+_B = _rng.randint(0, _PRIME, size=(NUM_PERMUTATIONS, 1)).astype(np.int64)
+
+_DIGITS = re.compile(r"\d+")
+
+
+def _line_key(line: str) -> str:
+    return " ".join(_DIGITS.sub("#", line.lower()).split())
+
+
+class RunningLineStripper:
+    """Streams (page number, text, total pages) tuples with running header/footer lines removed."""
+
+    def __init__(self):
+        self.lines_removed = 0
+        # Page number -> indexes (in text.splitlines()) of the lines removed from it
+        self.dropped_lines: Dict[int, List[int]] = {}
+        self._edge_counts: Counter = Counter()
+        self._pages_seen = 0
+
+    @staticmethod
+    def _edges(lines: List[str]) -> Set[str]:
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        edge = filled[:EDGE_LINES] + filled[-EDGE_LINES:]
+        return {_line_key(lines[i]) for i in edge}
+
+    def _is_running(self, key: str) -> bool:
+        return self._edge_counts[key] >= max(MIN_PAGES, MIN_PAGE_SHARE * self._pages_seen)
+
+    def _strip(self, page: Tuple[int, str, int]) -> Tuple[int, str, int]:
+        page_num, text, total_pages = page
+        lines = text.splitlines()
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        edge = set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+        drop = {i for i in edge if self._is_running(_line_key(lines[i]))}
+        if not drop:
+            return page
+        self.lines_removed += len(drop)
+        self.dropped_lines[page_num] = sorted(drop)
+        return page_num, "\n".join(line for i, line in enumerate(lines) if i not in drop), total_pages
+
+    def __call__(self, pages: Iterable[Tuple[int, str, int]]) -> Iterator[Tuple[int, str, int]]:
+        buffered = deque()
+        for page in pages:
+            self._pages_seen += 1
+            self._edge_counts.update(self._edges(page[1].splitlines()))
+            buffered.append(page)
+            if len(buffered) > LOOKAHEAD_PAGES:
+                yield self._strip(buffered.popleft())
+        while buffered:
+            yield self._strip(buffered.popleft())
+
+
+def minhash(text: str) -> np.ndarray:
+    words = text.lower().split()
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingles), dtype=np.int64,
+                         count=len(shingles))
+    return ((_A * hashes + _B) % _PRIME).min(axis=1)
+
+
+class ChunkDeduplicator:
+    """
+    Filters one document's (chunk, metadata) stream, keeping the first of each
+    group of near-duplicates. Kept chunks are numbered in order, matching the
+    ids ingest assigns them.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.total = 0
+        self.duplicates = 0
+        self._signatures: List[np.ndarray] = []
+        self._numbers: List[Tuple[str, ...]] = []
+        self._exact: Dict[str, int] = {}
+        self._buckets: Dict[bytes, List[int]] = defaultdict(list)
+        # Canonical chunk position -> pages its dropped copies were on
+        self.extra_pages: Dict[int, Set[int]] = defaultdict(set)
+
+    @property
+    def ratio(self) -> float:
+        return self.duplicates / self.total if self.total else 0.0
+
+    def _find(self, digest: str, signature: np.ndarray, numbers: Tuple[str, ...],
+              bands: List[bytes]) -> Optional[int]:
+        exact = self._exact.get(digest)
+        if exact is not None:
+            return exact
+        candidates = {position for band in bands for position in self._buckets.get(band, ())}
+        for position in sorted(candidates):
+            if (self._numbers[position] == numbers
+                    and np.mean(self._signatures[position] == signature) >= self.threshold):
+                return position
+        return None
+
+    def filter(self, chunks: Iterable[Tuple[str, dict]]) -> Iterator[Tuple[str, dict]]:
+        for text, meta in chunks:
+            self.total += 1
+            if not self.threshold:
+                yield text, meta
+                continue
+            digest = hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+            signature = minhash(text)
+            numbers = tuple(_DIGITS.findall(text))
+            rows = NUM_PERMUTATIONS // BANDS
+            bands = [bytes([band]) + signature[band * rows:(band + 1) * rows].tobytes() for band in range(BANDS)]
+
+            canonical = self._find(digest, signature, numbers, bands)
+            if canonical is not None:
+                self.duplicates += 1
+                start = meta.get("page_start", meta.get("page"))
+                self.extra_pages[canonical].update(range(start, meta.get("page_end", start) + 1))
+                continue
+
+            position = len(self._signatures)
+            self._signatures.append(signature)
+            self._numbers.append(numbers)
+            self._exact[digest] = position
+            for band in bands:
+                self._buckets[band].append(position)
+            yield text, meta
+
+    def merged_metadatas(self, metadatas: List[dict]) -> Dict[int, dict]:
+        """
+        New metadata for each canonical chunk that absorbed copies, by position:
+        "pages" lists every page the text appears on, comma-separated (stores
+        only take scalar metadata).
+        """
+        merged = {}
+        for position, pages in self.extra_pages.items():
+            meta = dict(metadatas[position])
+            start = meta.get("page_start", meta.get("page"))
+            all_pages = pages | set(range(start, meta.get("page_end", start) + 1))
+            meta["pages"] = ",".join(str(page) for page in sorted(all_pages))
+            merged[position] = meta
+        return merged
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from sqlite_store import SqliteStore
+
+
+class EmbeddingCache(SqliteStore):
+    """
+    Content-addressed on-disk cache for embedding vectors.
+
+    Entries are keyed by sha256(model name + output dimensionality + chunk text),
+    so the same clause uploaded by different users is only embedded once.
+    The cache is bounded by entry count and evicts least-recently-used rows.
+    """
+    pragmas = ["PRAGMA synchronous=NORMAL"]
+
+    def __init__(self, path: str = "./embedding_cache.sqlite3", max_entries: int = 200_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        super().__init__(path)
+
+    def _schema(self) -> List[str]:
+        return [
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)",
+        ]
+
+    @staticmethod
+    def make_key(text: str, model_name: str, output_dimensionality: Optional[int] = None) -> str:
+        h = hashlib.sha256()
+        h.update(model_name.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(str(output_dimensionality or "default").encode("utf-8"))
+        h.update(b"\x00")
+        h.update(text.encode("utf-8"))
+        return h.hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        """Returns the cached vectors for the given keys and refreshes their LRU position."""
+        if not keys:
+            return {}
+
+        found: Dict[str, List[float]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLite limits the number of bound parameters, so look up in slices
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, Sequence[float]]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Returns the process-wide cache, or None when disabled via EMBEDDING_CACHE_ENABLED=0."""
+    global _cache
+    if os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "0":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(
+                path=os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3"),
+                max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+            )
+        return _cache
@@ -1,7 +1,43 @@
-import fitz  # PyMuPDF
-from typing import List
-from db import VectorStore
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from chunking import chunk_pages, section_headings
+from db import compute_document_id, get_vector_store
+from dedup import ChunkDeduplicator, RunningLineStripper
+from lexical_index import tokenize
+from pdf_extract import extract_page_range, init_worker, open_pdf
+from schemas import IngestResult
+from telemetry import CHUNKS, TimedIterator, record_span, span
+from versions import get_version_registry
+import contextvars
+import hashlib
+import multiprocessing
 import os
+import threading
+import time
+
+# Gemini's embed_content accepts at most 100 texts per request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+# Embedding batches in flight at once; also bounds how much text is held in memory
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# PDFs with at least this many pages are parsed in a process pool
+PARALLEL_PARSE_MIN_PAGES = int(os.getenv("PARALLEL_PARSE_MIN_PAGES", "200"))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 2)))
+PARSE_PAGES_PER_TASK = 25
+# "structure" (clause-aware, page-spanning) or "fixed" (legacy per-page windows)
+CHUNKER = os.getenv("CHUNKER", "structure")
+# Running headers/footers are removed from each page before chunking
+STRIP_HEADERS_FOOTERS = os.getenv("STRIP_HEADERS_FOOTERS", "1") == "1"
+# Chunks at least this similar (estimated shingle Jaccard) to an earlier chunk are not embedded; 0 = off
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+# Documents with at least this many pages are indexed in prioritized windows when the caller
+# passes priority_terms (progressive analysis, see progressive.py); 0 = never
+PROGRESSIVE_MIN_PAGES = int(os.getenv("PROGRESSIVE_MIN_PAGES", "100"))
+# Pages at the start of the document indexed right after the sections matching priority_terms
+PROGRESSIVE_FIRST_PAGES = int(os.getenv("PROGRESSIVE_FIRST_PAGES", "10"))
+# Chunks in the first window; every later window is twice the size of the one before
+PROGRESSIVE_WINDOW_CHUNKS = int(os.getenv("PROGRESSIVE_WINDOW_CHUNKS", "200"))
 
 def chunk_text(text: str, chunk_size: int = 1500, overlap: int = 150) -> List[str]:
     """Splits text into chunks."""
@@ -18,41 +54,447 @@ def chunk_text(text: str, chunk_size: int = 1500, overlap: int = 150) -> List[st
         start += chunk_size - overlap
     return chunks
 
-def ingest_document(file_path: str):
+def file_document_id(file_path: str) -> str:
+    """Same content hash as db.compute_document_id, computed without loading the whole file."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:32]
+
+# Per-document ingest locks with their number of holders and waiters
+_document_locks: Dict[str, list] = {}
+_document_locks_guard = threading.Lock()
+
+@contextmanager
+def _document_lock(document_id: str):
+    """Serializes ingests of one document, so a concurrent identical upload reuses the first one's index."""
+    with _document_locks_guard:
+        entry = _document_locks.setdefault(document_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _document_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _document_locks[document_id]
+
+def normalize_text(text: str) -> str:
+    """Whitespace-insensitive form of page text used for the document text hash."""
+    return " ".join(text.split())
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+def iter_hashed(pages: Iterable[Tuple[int, str, int]], text_hash,
+                page_hashes: Optional[List[str]] = None,
+                page_texts: Optional[List[Tuple[int, str]]] = None) -> Iterator[Tuple[int, str, int]]:
+    """
+    Passes pages through while feeding their normalized text into `text_hash`
+    and, if given, appending each page's own hash to `page_hashes` and its
+    extracted text to `page_texts` (for the quote locator).
+    """
+    for page_num, text, total_pages in pages:
+        normalized = normalize_text(text)
+        if normalized:
+            text_hash.update(normalized.encode("utf-8"))
+            text_hash.update(b"\f")
+        if page_hashes is not None:
+            page_hashes.append(hashlib.sha256(normalized.encode("utf-8")).hexdigest())
+        if page_texts is not None:
+            page_texts.append((page_num, text))
+        yield page_num, text, total_pages
+
+def iter_pages(file_path: str, parallel: bool = True,
+               data: Optional[bytes] = None) -> Iterator[Tuple[int, str, int]]:
+    """
+    Lazily yields (page number, text, total pages). Very large PDFs are split into
+    page ranges and extracted in a process pool, with a bounded number of ranges
+    in flight so extracted text never piles up ahead of the embedding stage.
+    With `data`, the PDF is read from those bytes instead of file_path.
+    """
+    source = data if data is not None else file_path
+    doc = open_pdf(source)
+    total_pages = doc.page_count
+
+    if not parallel or total_pages < PARALLEL_PARSE_MIN_PAGES or PARSE_WORKERS < 2:
+        try:
+            for page_num, page in enumerate(doc, start=1):
+                yield page_num, page.get_text(), total_pages
+        finally:
+            doc.close()
+        return
+
+    doc.close()
+    ranges = deque(range(0, total_pages, PARSE_PAGES_PER_TASK))
+    # spawn, not fork: the parent holds Chroma/HTTP threads that must not be forked.
+    # The PDF goes to each worker once through the initializer; tasks carry only a page range.
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_worker, initargs=(source,)) as pool:
+        in_flight = deque()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < PARSE_WORKERS * 2:
+                start = ranges.popleft()
+                in_flight.append(pool.submit(extract_page_range, start, start + PARSE_PAGES_PER_TASK))
+            for page_num, text in in_flight.popleft().result():
+                yield page_num, text, total_pages
+
+def iter_reported(pages: Iterable[Tuple[int, str, int]],
+                  report: Callable[[dict], None]) -> Iterator[Tuple[int, str, int]]:
+    for page_num, text, total_pages in pages:
+        if page_num % 10 == 0 or page_num == total_pages:
+            report({"stage": "parse", "pages_done": page_num, "total_pages": total_pages})
+        yield page_num, text, total_pages
+
+def iter_chunks(pages: Iterable[Tuple[int, str, int]], source: str,
+                report: Callable[[dict], None],
+                stripper: Optional[RunningLineStripper] = None) -> Iterator[Tuple[str, dict]]:
+    """
+    Chunks text as pages arrive, yielding (chunk, metadata). The default
+    structure-aware chunker follows clause boundaries across pages; CHUNKER=fixed
+    restores the per-page 1500/150 character windows. Running headers and
+    footers are stripped first (pass `stripper` to read its count afterwards).
+    """
+    pages = iter_reported(pages, report)
+    if STRIP_HEADERS_FOOTERS:
+        pages = (stripper or RunningLineStripper())(pages)
+
+    if CHUNKER == "fixed":
+        for page_num, text, _ in pages:
+            if not text.strip():
+                continue
+            for chunk in chunk_text(text):
+                yield chunk, {"source": source, "page": page_num, "page_start": page_num, "page_end": page_num}
+        return
+
+    for chunk, page_start, page_end in chunk_pages(pages):
+        # "page" stays the first page for consumers that only know about one
+        yield chunk, {"source": source, "page": page_start, "page_start": page_start, "page_end": page_end}
+
+def iter_batches(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def page_count(file_path: str, data: Optional[bytes] = None) -> int:
+    doc = open_pdf(data if data is not None else file_path)
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+def prioritized_windows(chunks: List[Tuple[int, Tuple[str, dict]]], priority_terms: Sequence[str]) -> List[list]:
     """
-    Parses PDF page-by-page, chunks text, and stores directly in ChromaDB with metadata.
+    Splits (position, (chunk, metadata)) in document order into embedding
+    windows for a progressive ingest. Chunks of sections whose heading holds
+    all words of one of `priority_terms` come first, then the rest of the first
+    PROGRESSIVE_FIRST_PAGES pages, then everything else, each in document
+    order. The first window has PROGRESSIVE_WINDOW_CHUNKS chunks and each
+    later one twice as many as the last, so it is sized independently of the
+    document and a long document takes few windows.
     """
-    db = VectorStore()
-    
-    # Open Document
-    doc = fitz.open(file_path)
-    
-    all_chunks = []
-    all_metadatas = []
-    
+    terms = [set(words) for words in (tokenize(term) for term in priority_terms) if words]
+    ranked = []
+    in_section = False  # Whether the section the previous chunk ended in matched
+    for position, (text, meta) in chunks:
+        matched = in_section
+        for heading in section_headings(text):
+            words = set(tokenize(heading))
+            in_section = any(term <= words for term in terms)
+            matched = matched or in_section
+        first_pages = meta.get("page_start", meta.get("page", 0)) <= PROGRESSIVE_FIRST_PAGES
+        ranked.append((0 if matched else 1 if first_pages else 2, position, (text, meta)))
+    ranked.sort(key=lambda item: item[:2])
+
+    windows, start, size = [], 0, max(1, PROGRESSIVE_WINDOW_CHUNKS)
+    while start < len(ranked):
+        windows.append([(position, chunk) for _, position, chunk in ranked[start:start + size]])
+        start += size
+        size *= 2
+    return windows
+
+def _with_dropped_lines(page_texts: List[Tuple[int, str]], stripper: RunningLineStripper) -> List[tuple]:
+    """(page number, text, header/footer lines stripped from it), as the quote locator takes pages."""
+    return [(page_num, text, stripper.dropped_lines.get(page_num, [])) for page_num, text in page_texts]
+
+def parse_document(file_path: str) -> dict:
+    """
+    Parses and chunks one PDF without touching the store or the network, so it
+    can run in a process-pool worker (batch runs). The result is passed back
+    to ingest_document as `parsed`.
+    """
+    start = time.perf_counter()
+    text_hash = hashlib.sha256()
+    page_hashes: List[str] = []
+    page_texts: List[Tuple[int, str]] = []
+    stripper = RunningLineStripper()
+    pages = iter_hashed(iter_pages(file_path, parallel=False), text_hash, page_hashes, page_texts)
+    chunks = list(iter_chunks(pages, os.path.basename(file_path), lambda event: None, stripper))
+    return {
+        "document_id": file_document_id(file_path),
+        "text_hash": text_hash.hexdigest(),
+        "page_hashes": page_hashes,
+        "page_texts": _with_dropped_lines(page_texts, stripper),
+        "chunks": chunks,
+        "header_footer_lines": stripper.lines_removed,
+        "seconds": time.perf_counter() - start
+    }
+
+def ingest_document(file_path: str, progress: Optional[Callable[[dict], None]] = None,
+                    source: Optional[str] = None, parsed: Optional[dict] = None,
+                    data: Optional[bytes] = None,
+                    priority_terms: Optional[Sequence[str]] = None) -> IngestResult:
+    """
+    Parses PDF page-by-page, chunks text, and stores it in ChromaDB under the
+    document's content hash, with a BM25 keyword index of the same chunks.
+    Re-uploads of an already indexed document are free, and concurrent
+    uploads of the same bytes ingest it once: the others wait, then reuse it.
+    A file with different bytes but the same text (or an evicted document) is
+    parsed and embedded again, with embeddings served by the embedding cache;
+    only then is its text hash known for the report cache.
+
+    Stages are pipelined: pages are extracted lazily, chunks are grouped into
+    bounded embedding batches that run concurrently, and each batch is written
+    to the store as soon as its embeddings come back. Running headers and
+    footers are stripped before chunking, and near-duplicate chunks are
+    dropped before embedding (see dedup.py).
+    `progress`, if given, is called with small status dicts as stages advance.
+
+    `source` names the document across versions. Only an explicit source is
+    versioned: filenames like "contract.pdf" are shared by unrelated uploads,
+    so without one nothing is diffed. When an earlier version of the same
+    source is still indexed, chunks whose text is unchanged reuse its
+    embeddings and only new or edited chunks are embedded; those are marked
+    is_new in their metadata.
+
+    `parsed`, from parse_document, skips parsing and chunking here.
+    `data`, the PDF's bytes as uploaded (see uploads.py), is parsed in memory;
+    file_path then only names the document.
+
+    With `priority_terms`, a document of PROGRESSIVE_MIN_PAGES pages or more is
+    indexed progressively: it is parsed and chunked up front, then embedded in
+    prioritized windows (see prioritized_windows). Every window but the last
+    is fully written, keyword-indexed and reported as a "window" progress
+    event before the next starts, so the partial index can be queried. Chunk
+    ids follow document order either way, and the finished index is the one a
+    plain ingest builds.
+    """
+    if parsed:
+        document_id = parsed["document_id"]
+    else:
+        document_id = compute_document_id(data) if data is not None else file_document_id(file_path)
+    with span("ingest", file=os.path.basename(file_path)) as attributes, _document_lock(document_id):
+        result = _ingest(document_id, file_path, progress, source, parsed, data, priority_terms)
+        attributes.update(document_id=result.document_id, chunks=result.num_chunks, reused=result.reused,
+                          chunks_reused=result.chunks_reused)
+        return result
+
+def _previous_version(db, versions, source: Optional[str], document_id: str):
+    """The latest other indexed version of `source`, with its chunk embeddings by chunk hash."""
+    if versions is None or source is None:
+        return None, {}
+    previous = versions.latest(source, exclude=document_id)
+    if previous is None or not db.has_document(previous["document_id"]):
+        return None, {}
+    docs, embeddings, _ = db.get_embedded(previous["document_id"])
+    return previous, {chunk_hash(doc): vector for doc, vector in zip(docs, embeddings)}
+
+def _ingest(document_id: str, file_path: str, progress: Optional[Callable[[dict], None]], source: Optional[str],
+            parsed: Optional[dict], data: Optional[bytes],
+            priority_terms: Optional[Sequence[str]]) -> IngestResult:
+    report = progress or (lambda event: None)
+    db = get_vector_store()
+    # Unversioned uploads are neither diffed nor recorded
+    versions = get_version_registry() if source is not None else None
+
+    db.evict_idle(keep=document_id)
+
+    if db.has_document(document_id):
+        if versions is not None and versions.get(source, document_id) is not None:
+            versions.touch(source, document_id)
+        return IngestResult(
+            document_id=document_id,
+            num_chunks=db.count(document_id),
+            text_hash=db.get_text_hash(document_id),
+            reused=True
+        )
+
+    previous, previous_embeddings = _previous_version(db, versions, source, document_id)
+
     filename = os.path.basename(file_path)
+    # Hash of the normalized text: byte-different PDFs with identical text share cached reports
+    text_hash = hashlib.sha256()
+    page_hashes: List[str] = parsed["page_hashes"] if parsed else []
+    page_texts: List[tuple] = parsed["page_texts"] if parsed else []
+    # Parse and chunk run lazily inside the batching loop; their time is accumulated and reported after it
+    pages = TimedIterator(iter_pages(file_path, data=data) if not parsed else [])
+    stripper = RunningLineStripper()
+    chunks = TimedIterator(
+        iter_chunks(iter_hashed(pages, text_hash, page_hashes, page_texts), filename, report, stripper) if not parsed
+        else parsed["chunks"]
+    )
+    # Near-copies of earlier chunks are dropped here, before they cost an embedding
+    deduplicator = ChunkDeduplicator(DEDUP_THRESHOLD)
+
+    def embed_missing(texts: List[str], known: List[Optional[List[float]]]) -> List[List[float]]:
+        missing = [text for text, vector in zip(texts, known) if vector is None]
+        fresh = iter(db.embed(missing) if missing else [])
+        return [vector if vector is not None else next(fresh) for vector in known]
+
+    chunks_reused = 0
+    # Every chunk in id order, for the keyword index built once the document is complete
+    all_texts: List[str] = []
+    all_metadatas: List[dict] = []
 
-    for page_num, page in enumerate(doc, start=1):
-        text = page.get_text()
-        if not text.strip():
-            continue
-            
-        # Chunk this page's text
-        page_chunks = chunk_text(text)
-        
-        for chunk in page_chunks:
-            all_chunks.append(chunk)
-            all_metadatas.append({
-                "source": filename,
-                "page": page_num
-            })
-    
-    if not all_chunks:
+    # Kept chunks are numbered in document order, whatever order they are embedded in
+    numbered = enumerate(deduplicator.filter(chunks))
+    progressive = (priority_terms is not None and not parsed and PROGRESSIVE_MIN_PAGES > 0
+                   and page_count(file_path, data) >= PROGRESSIVE_MIN_PAGES)
+    if progressive:
+        # Header stripping, chunking and dedup follow document order, so the
+        # whole text is chunked first; only embedding is reordered
+        numbered = list(numbered)
+        all_texts.extend(text for _, (text, _) in numbered)
+        all_metadatas.extend(meta for _, (_, meta) in numbered)
+        windows = prioritized_windows(numbered, priority_terms)
+        # Page texts are complete, so quotes found on the partial index can be placed
+        with span("quote_index", pages=len(page_texts)):
+            db.index_pages(document_id, _with_dropped_lines(page_texts, stripper))
+        print(f"Progressive ingest: {len(all_texts)} chunks in {len(windows)} windows")
+    else:
+        windows = [numbered]
+
+    num_chunks = 0
+    # Progressive ingest: batches still being embedded per window, and how many windows are
+    # fully submitted / reported. Later windows are submitted without waiting for earlier ones
+    window_batches = [0] * len(windows)
+    windows_submitted = windows_reported = 0
+    written: List[int] = []
+    with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as embed_pool:
+        in_flight = {}
+
+        def report_windows():
+            # A window is reported once it and every window before it are written (never the last)
+            nonlocal windows_reported
+            reported = windows_reported
+            while (windows_reported < min(windows_submitted, len(windows) - 1)
+                   and not window_batches[windows_reported]):
+                windows_reported += 1
+            if windows_reported == reported:
+                return
+            written.sort()
+            db.index_lexical(document_id, [all_texts[i] for i in written], [all_metadatas[i] for i in written])
+            report({"stage": "window", "document_id": document_id, "window": windows_reported,
+                    "windows": len(windows), "chunks_done": num_chunks, "total_chunks": len(all_texts),
+                    "completeness": round(num_chunks / len(all_texts), 4)})
+
+        def write_completed(block: bool):
+            nonlocal num_chunks
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED, timeout=None if block else 0)
+            for future in done:
+                ids, texts, metadatas, window_index = in_flight.pop(future)
+                with span("vector_add", chunks=len(ids)):
+                    db.add_embedded(document_id, ids, texts, future.result(), metadatas)
+                num_chunks += len(ids)
+                report({"stage": "embed", "chunks_done": num_chunks})
+                if progressive:
+                    window_batches[window_index] -= 1
+                    written.extend(int(chunk_id) for chunk_id in ids)
+            if progressive and done:
+                report_windows()
+
+        for window_index, window in enumerate(windows):
+            for batch in iter_batches(window, EMBED_BATCH_SIZE):
+                ids = [str(position) for position, _ in batch]
+                texts = [chunk for _, (chunk, _) in batch]
+                metadatas = [meta for _, (_, meta) in batch]
+                if not progressive:
+                    all_texts.extend(texts)
+                    all_metadatas.extend(metadatas)
+
+                # Unchanged chunks of the previous version keep their embeddings
+                known = [previous_embeddings.get(chunk_hash(text)) for text in texts]
+                if previous is not None:
+                    for meta, vector in zip(metadatas, known):
+                        meta["is_new"] = vector is None
+                    chunks_reused += sum(vector is not None for vector in known)
+
+                # Backpressure: parsing pauses while the embedding stage is saturated
+                while len(in_flight) >= EMBED_CONCURRENCY:
+                    write_completed(block=True)
+                # Copy the context so embed_batch spans land in this request's trace
+                future = embed_pool.submit(contextvars.copy_context().run, embed_missing, texts, known)
+                in_flight[future] = (ids, texts, metadatas, window_index)
+                window_batches[window_index] += 1
+                write_completed(block=False)
+            windows_submitted += 1
+            if progressive:
+                report_windows()
+
+        while in_flight:
+            write_completed(block=True)
+
+    if parsed:
+        # Parse and chunk already ran in a worker process
+        record_span("parse_worker", parsed["seconds"], pages=len(page_hashes), chunks=chunks.items)
+    else:
+        record_span("parse", pages.seconds, pages=pages.items)
+        # Chunking time excludes the page extraction it pulls from
+        record_span("chunk", max(0.0, chunks.seconds - pages.seconds), chunks=chunks.items)
+    CHUNKS.labels(stage="ingest").inc(chunks.items)
+    CHUNKS.labels(stage="duplicate").inc(deduplicator.duplicates)
+    text_hash = parsed["text_hash"] if parsed else text_hash.hexdigest()
+    header_footer_lines = parsed["header_footer_lines"] if parsed else stripper.lines_removed
+
+    if not num_chunks:
         print("Warning: No text extracted from PDF.")
-        return 0
+        return IngestResult(document_id=document_id, num_chunks=0)
+
+    # Canonical chunks list every page their dropped copies were on
+    merged = deduplicator.merged_metadatas(all_metadatas)
+    if merged:
+        db.update_metadatas(document_id, [str(i) for i in merged], list(merged.values()))
+        for position, meta in merged.items():
+            all_metadatas[position] = meta
+    if deduplicator.duplicates or header_footer_lines:
+        print(f"Dedup: {deduplicator.duplicates}/{deduplicator.total} chunks were near-duplicates, "
+              f"{header_footer_lines} header/footer lines stripped")
+
+    db.mark_complete(document_id, text_hash=text_hash)
+    with span("lexical_index", chunks=num_chunks):
+        db.index_lexical(document_id, all_texts, all_metadatas)
+    # Findings' quotes are placed on pages locally (quote_locator.py), not by the model
+    if not progressive:
+        with span("quote_index", pages=len(page_texts)):
+            db.index_pages(document_id, page_texts if parsed else _with_dropped_lines(page_texts, stripper))
+
+    pages_changed = None
+    if previous is not None:
+        previous_pages = set(previous["page_hashes"])
+        pages_changed = sum(page not in previous_pages for page in page_hashes)
+        print(f"New version of {source}: {pages_changed}/{len(page_hashes)} pages changed, "
+              f"{chunks_reused}/{num_chunks} chunks reused from {previous['document_id']}")
+    if versions is not None:
+        versions.record(source, document_id, page_hashes,
+                        previous_document_id=previous["document_id"] if previous else None)
+
+    if db.embedding_fn.cache is not None:
+        print(f"Embedding cache: {db.embedding_fn.cache.stats()}")
 
-    # Clear previous and add new
-    db.clear()
-    db.add_documents(all_chunks, all_metadatas)
-    
-    return len(all_chunks)
+    return IngestResult(
+        document_id=document_id,
+        num_chunks=num_chunks,
+        text_hash=text_hash,
+        chunks_reused=chunks_reused,
+        pages_changed=pages_changed,
+        duplicate_chunks=deduplicator.duplicates,
+        dedup_ratio=round(deduplicator.ratio, 4),
+        header_footer_lines=header_footer_lines
+    )
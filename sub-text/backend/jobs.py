@@ -0,0 +1,221 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import List, Optional
+
+from progressive import iter_progressive_analysis
+from schemas import AnalysisReport, JobStatus
+from sqlite_store import SqliteStore
+from telemetry import trace
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFullError(Exception):
+    """Raised by JobManager.submit when the queue is at capacity (backpressure)."""
+
+
+class JobStore(SqliteStore):
+    """SQLite-backed job state, so queued and running jobs survive a restart."""
+
+    def __init__(self, path: str = "./jobs.sqlite3"):
+        super().__init__(path)
+
+    def _schema(self) -> List[str]:
+        return [
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                refresh INTEGER NOT NULL DEFAULT 0,
+                progress TEXT NOT NULL DEFAULT '{}',
+                report TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        ]
+
+    def create(self, job_id: str, filename: str, file_path: str, refresh: bool):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, filename, file_path, refresh, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, filename, file_path, int(refresh), now, now)
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, status: Optional[str] = None, progress: Optional[dict] = None,
+               report: Optional[AnalysisReport] = None, error: Optional[str] = None):
+        fields, values = ["updated_at = ?"], [time.time()]
+        if status is not None:
+            fields.append("status = ?")
+            values.append(status)
+        if progress is not None:
+            fields.append("progress = ?")
+            values.append(json.dumps(progress))
+        if report is not None:
+            fields.append("report = ?")
+            values.append(report.model_dump_json())
+        if error is not None:
+            fields.append("error = ?")
+            values.append(error)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {', '.join(fields)} WHERE id = ?", (*values, job_id))
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            columns = [column[0] for column in cursor.description]
+        return dict(zip(columns, row)) if row else None
+
+    def unfinished(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+class JobManager:
+    """
+    Bounded queue plus a fixed pool of worker tasks running ingest and the
+    audit outside of any HTTP request. submit() refuses work when the queue
+    is full instead of letting it grow without limit. Large documents are
+    analyzed progressively: a running job's report is the latest partial one.
+    """
+
+    def __init__(self, agent, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.agent = agent
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.max_queue = max_queue or int(os.getenv("JOB_QUEUE_SIZE", "20"))
+        self.upload_dir = os.getenv("JOB_UPLOAD_DIR", "./job_uploads")
+        self.store = JobStore(os.getenv("JOBS_DB_PATH", "./jobs.sqlite3"))
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+        # Jobs that were queued or mid-run when the previous process stopped
+        recovered = self.store.unfinished()
+        for job_id in recovered:
+            self.store.update(job_id, status=QUEUED)
+            self._tasks.append(asyncio.create_task(self.queue.put(job_id)))
+        if recovered:
+            print(f"Recovered {len(recovered)} unfinished jobs")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.close()
+
+    async def submit(self, upload, refresh: bool = False) -> str:
+        """Queues a received upload (see uploads.py); its file is kept in upload_dir until the job ends."""
+        # The queue is only touched on the event loop (asyncio.Queue is not thread-safe)
+        if self.queue.full():
+            raise QueueFullError(f"Job queue is full ({self.max_queue} waiting)")
+
+        job_id = uuid.uuid4().hex
+        file_path = os.path.join(self.upload_dir, f"{job_id}.pdf")
+        await asyncio.to_thread(self._persist, upload, job_id, file_path, refresh)
+        try:
+            # Concurrent submits can fill the queue while this one was saving its file
+            self.queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            await asyncio.to_thread(self._reject, job_id)
+            raise QueueFullError(f"Job queue is full ({self.max_queue} waiting)")
+        return job_id
+
+    def _persist(self, upload, job_id: str, file_path: str, refresh: bool):
+        upload.save(file_path)
+        self.store.create(job_id, upload.filename, file_path, refresh)
+
+    def _reject(self, job_id: str):
+        self.store.update(job_id, status=FAILED, error="Job queue is full")
+        self._discard_upload(job_id)
+
+    def status(self, job_id: str) -> Optional[JobStatus]:
+        row = self.store.get(job_id)
+        if row is None:
+            return None
+        return JobStatus(
+            job_id=row["id"],
+            status=row["status"],
+            filename=row["filename"],
+            progress=json.loads(row["progress"]),
+            report=AnalysisReport.model_validate_json(row["report"]) if row["report"] else None,
+            error=row["error"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"]
+        )
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                # Jobs run outside any HTTP request, so each gets its own trace
+                with trace(f"job {job_id}", job_id=job_id):
+                    await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                await asyncio.to_thread(self._fail, job_id, str(e))
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job_id: str):
+        row = await asyncio.to_thread(self.store.get, job_id)
+        if row is None or row["status"] not in (QUEUED, RUNNING):
+            return
+        progress = {"stage": "ingest"}
+        # SQLite writes are blocking; keep them off the event loop
+        await asyncio.to_thread(self.store.update, job_id, status=RUNNING, progress=progress)
+
+        report = None
+        async for event in iter_progressive_analysis(
+            self.agent, use_cache=not row["refresh"], file_path=row["file_path"]
+        ):
+            if event["event"] == "ingest_progress":
+                progress["ingest"] = {key: value for key, value in event.items() if key != "event"}
+            elif event["event"] == "ingested":
+                progress.update(stage="analyze", document_id=event["document_id"], num_chunks=event["num_chunks"])
+            elif event["event"] == "category":
+                progress.update(categories_done=event["completed"], categories_total=event["total"])
+            elif event["event"] == "partial_report":
+                report = event["report"]
+                progress["completeness"] = report.completeness
+            elif event["event"] == "summary":
+                progress["stage"] = "summary"
+            elif event["event"] == "report":
+                report = event["report"]
+                progress["completeness"] = report.completeness
+            await asyncio.to_thread(self.store.update, job_id, progress=dict(progress),
+                                    report=report if event["event"] == "partial_report" else None)
+
+        progress["stage"] = "done"
+        await asyncio.to_thread(self.store.update, job_id, status=DONE, progress=progress, report=report)
+        await asyncio.to_thread(self._discard_upload, job_id)
+
+    def _fail(self, job_id: str, error: str):
+        self.store.update(job_id, status=FAILED, error=error)
+        self._discard_upload(job_id)
+
+    def _discard_upload(self, job_id: str):
+        # Kept on cancellation (shutdown) so the recovered job can run again
+        row = self.store.get(job_id)
+        if row and os.path.exists(row["file_path"]):
+            os.remove(row["file_path"])
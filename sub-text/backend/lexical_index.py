@@ -0,0 +1,123 @@
+"""
+BM25 keyword search over one document's chunks, held in memory.
+
+Legal questions are often keyword-heavy ("arbitration", "early termination
+fee", "$500"), and exact terms rank well here without an embedding call. The
+vector store keeps one index per document: built at ingest, rebuilt from the
+stored chunks after a restart, dropped with the document. Agent retrieval
+fuses it with vector search by reciprocal rank (see reciprocal_rank_fusion).
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her
+here hers him his how i if in into is it its itself just me more most my no nor not of off on once only or
+other our ours out over own same she should so some such than that the their theirs them then there these
+they this those through to too under until up very was we were what when where which while who whom why
+will with would you your yours
+""".split())
+
+# Words, and amounts such as $1,000.50 or 30% kept whole
+_TOKEN = re.compile(r"\$?\d+(?:[.,]\d+)*%?|[a-z]+")
+
+# Standard BM25 parameters
+K1 = 1.5
+B = 0.75
+# Reciprocal-rank fusion constant; damps the difference between the top few ranks
+RRF_K = 60
+
+
+def _stem(word: str) -> str:
+    """Folds plurals only ("fees" -> "fee", "parties" -> "party"); legal terms are otherwise kept exact."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if token[0] == "$" or token[0].isdigit():
+            token = token.replace(",", "")
+            tokens.append(token)
+            if token[0] == "$":
+                tokens.append(token[1:])  # "$500" also matches a query for "500"
+        else:
+            tokens.append(_stem(token))
+    return tokens
+
+
+class LexicalIndex:
+    """Inverted index of one document's chunks (in ingest order) with BM25 scoring."""
+
+    def __init__(self, chunks: List[str], metadatas: List[dict]):
+        self.chunks = chunks
+        self.metadatas = metadatas
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.lengths: List[int] = []
+        for position, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            self.lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self.postings[term].append((position, frequency))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def idf(self, term: str) -> float:
+        frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.chunks) - frequency + 0.5) / (frequency + 0.5))
+
+    def score(self, query: str) -> List[Tuple[int, float]]:
+        """(chunk position, BM25 score) for every chunk matching any query term, best first."""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf(term)
+            for position, frequency in self.postings.get(term, ()):
+                norm = K1 * (1 - B + B * self.lengths[position] / self.average_length)
+                scores[position] += idf * frequency * (K1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def search(self, query: str, n_results: int = 5) -> Tuple[List[str], List[dict]]:
+        """Returns (documents, metadatas), in the shape of a vector store query."""
+        top = [position for position, _ in self.score(query)[:n_results]]
+        return [self.chunks[p] for p in top], [self.metadatas[p] for p in top]
+
+    def confidence(self, query: str) -> float:
+        """
+        Share of the query's terms, weighted by IDF, that the best-scoring chunk
+        contains: 1.0 when it holds every term, lower when terms are missing
+        from it (or from the whole document). 0.0 for a query with no terms.
+        """
+        terms = set(tokenize(query))
+        ranked = self.score(query)
+        if not terms or not ranked:
+            return 0.0
+        best_terms = set(tokenize(self.chunks[ranked[0][0]]))
+        total = sum(self.idf(term) for term in terms)
+        matched = sum(self.idf(term) for term in terms if term in best_terms)
+        return matched / total if total else 0.0
+
+
+def reciprocal_rank_fusion(rankings: List[Tuple[List[str], List[dict]]],
+                           n_results: int) -> Tuple[List[str], List[dict]]:
+    """
+    Merges (documents, metadatas) rankings of the same document, scoring each
+    chunk by sum(1 / (RRF_K + rank)) over the rankings it appears in. Ranks,
+    not raw scores, are combined, so BM25 and cosine scales never need aligning.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    metadata_by_chunk: Dict[str, dict] = {}
+    for docs, metadatas in rankings:
+        for rank, (doc, meta) in enumerate(zip(docs, metadatas)):
+            scores[doc] += 1 / (RRF_K + rank + 1)
+            metadata_by_chunk.setdefault(doc, meta)
+    # Stable sort: ties keep the order of the first ranking
+    fused = sorted(scores, key=lambda doc: -scores[doc])[:n_results]
+    return fused, [metadata_by_chunk[doc] for doc in fused]
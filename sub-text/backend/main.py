@@ -1,18 +1,36 @@
+import asyncio
+import json
+import math
 import os
-import shutil
+from contextlib import asynccontextmanager
+from typing import Optional
 from dotenv import load_dotenv
 
 # Load env vars *before* importing local modules that use them (like ingest/db)
 load_dotenv()
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
-from ingest import ingest_document
-from agent import LegalAgent
-from schemas import AnalysisReport, ChatRequest
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from schemas import AnalysisReport, BatchRequest, ChatRequest, JobStatus
+from telemetry import MetricsMiddleware, metrics_payload, span
+from warmup import Warmup
 
-app = FastAPI(title="Subtext API", version="1.0.0")
+# The pipeline modules (ingest, agent, db, batch, jobs, progressive) pull in chromadb,
+# google-genai and PyMuPDF; they are imported by the warmup and inside the
+# handlers below, so the server starts listening without waiting on them.
+warmup = Warmup()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Opens the store, embeds the category queries and primes connections in the background; see GET /ready
+    warmup.start()
+    yield
+    await warmup.stop()
+
+app = FastAPI(title="Subtext API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,47 +39,213 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-# Initialize Agent
-agent = LegalAgent()
+# Outermost, so request latency includes CORS handling and streamed bodies
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
 def read_root():
     return {"message": "Subtext Backend is Running. Beware the Fine Print."}
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once the startup warmup has finished, 503 before. Lists each warmup step."""
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=warmup.status())
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint: request and per-stage latency histograms, tokens, retries, cost."""
+    payload, content_type = metrics_payload()
+    return Response(content=payload, media_type=content_type)
+
 @app.post("/analyze", response_model=AnalysisReport)
-async def analyze_document(file: UploadFile = File(...)):
+async def analyze_document(file: UploadFile = File(...), refresh: bool = False, source: Optional[str] = None):
     """
-    1. Save file locally.
-    2. Ingest into ChromaDB.
-    3. Run Agent Analysis.
+    1. Receive the file (in memory; large uploads spool to a temporary file)
+       and check its size and page limits (413/400).
+    2. Ingest into ChromaDB (diffed against the previous version of ?source=
+       when given; without it nothing is diffed).
+    3. Run Agent Analysis (served from the report cache unless ?refresh=true).
     """
+    upload = await _receive(file)
     try:
-        file_location = f"temp_{file.filename}"
-        with open(file_location, "wb+") as file_object:
-            shutil.copyfileobj(file.file, file_object)
-            
+        agent = await warmup.agent()
+        from ingest import ingest_document
+
         # Ingest
-        num_chunks = ingest_document(file_location)
-        print(f"Ingested {num_chunks} chunks from {file.filename}")
-        
+        # Parsing and embedding are blocking; keep the event loop free for other requests
+        ingest_result = await asyncio.to_thread(ingest_document, **upload.ingest_kwargs(source))
+        print(f"Ingested {ingest_result.num_chunks} chunks from {file.filename} "
+              f"as {ingest_result.document_id} (reused={ingest_result.reused})")
+        upload.close()
+
         # Analyze
-        report = await agent.analyze_document(file_location)
-        
-        # Cleanup
-        os.remove(file_location)
+        report = await agent.analyze_document(
+            ingest_result.document_id,
+            text_hash=ingest_result.text_hash,
+            use_cache=not refresh
+        )
         
         return report
         
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        upload.close()
+
+async def _receive(file: UploadFile):
+    from uploads import UploadRejected, receive_upload
+
+    try:
+        with span("upload", file=file.filename):
+            return await receive_upload(file)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+def _ndjson(event: dict) -> str:
+    return json.dumps(jsonable_encoder(event)) + "\n"
+
+@app.post("/analyze/stream")
+async def analyze_document_stream(file: UploadFile = File(...), refresh: bool = False, source: Optional[str] = None):
+    """
+    Same pipeline as /analyze, streamed as NDJSON (one JSON event per line):
+    ingest_progress -> ingested -> category (one per finished category, with the
+    running overall_risk_score) -> summary -> report. Failures arrive as an
+    "error" event since the 200 status has already been sent. A cached report
+    skips straight to the "report" event. Uploads over the size or page
+    limits, or unreadable, are refused (413/400) before the stream starts.
+
+    Documents of PROGRESSIVE_MIN_PAGES or more are analyzed progressively
+    (see progressive.py): while they are indexed, rounds of category events
+    and a "partial_report" with completeness below 1 arrive before "ingested".
+    """
+    upload = await _receive(file)
+
+    async def events():
+        try:
+            agent = await warmup.agent()
+            from progressive import iter_progressive_analysis
+
+            yield _ndjson({"event": "ingest_started", "filename": file.filename})
+            async for event in iter_progressive_analysis(agent, use_cache=not refresh, **upload.ingest_kwargs(source)):
+                if event["event"] == "ingested":
+                    upload.close()
+                yield _ndjson(event)
+        except Exception as e:
+            print(f"Error: {e}")
+            yield _ndjson({"event": "error", "detail": str(e)})
+        finally:
+            upload.close()
+
+    # Also closed after the response, in case the client left before the stream started
+    return StreamingResponse(events(), media_type="application/x-ndjson", background=BackgroundTask(upload.close))
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: BatchRequest):
+    """
+    Analyzes server-side PDFs and directories, streaming one NDJSON result per
+    document as it finishes. With `output` (a .jsonl file), results are also
+    appended there and `resume` skips documents already done. Disabled (404)
+    unless BATCH_ROOT is set; paths and output are resolved under it and may
+    not leave it.
+    """
+    batch_root = os.getenv("BATCH_ROOT")
+    if not batch_root:
+        raise HTTPException(status_code=404, detail="Batch analysis is disabled (BATCH_ROOT is not set)")
+    root = os.path.realpath(batch_root)
+
+    def resolve(path: str) -> str:
+        resolved = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, resolved]) != root:
+            raise HTTPException(status_code=400, detail=f"{path} is outside BATCH_ROOT")
+        return resolved
+
+    paths = [resolve(path) for path in request.paths]
+    output = resolve(request.output) if request.output else None
+    if output and not output.endswith(".jsonl"):
+        raise HTTPException(status_code=400, detail="output must be a .jsonl file")
+    if request.resume and not output:
+        raise HTTPException(status_code=400, detail="resume needs an output file")
+
+    agent = await warmup.agent()
+    from batch import BatchRunner, collect_pdfs, run_to_file
+
+    paths = collect_pdfs(paths)
+    if not paths:
+        raise HTTPException(status_code=400, detail="No PDFs found")
+
+    runner = BatchRunner(agent)
+    if output:
+        records = run_to_file(runner, paths, output, resume=request.resume, refresh=request.refresh)
+    else:
+        records = runner.run(paths, refresh=request.refresh)
+
+    async def lines():
+        async for record in records:
+            yield _ndjson(record)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...), refresh: bool = False):
+    """
+    Queues an analysis and returns immediately. Poll GET /jobs/{job_id}.
+    Returns 503 with Retry-After when the queue is full, 413/400 for uploads
+    over the size or page limits. Jobs run outside any request, so on Cloud
+    Run the service needs --no-cpu-throttling and --min-instances=1 (see
+    DEPLOYMENT_GUIDE.md); otherwise they stall between polls.
+    """
+    job_manager = await warmup.job_manager()
+    from jobs import QueueFullError
+
+    upload = await _receive(file)
+    try:
+        job_id = await job_manager.submit(upload, refresh)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    finally:
+        upload.close()
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    job_manager = await warmup.job_manager()
+    status = await asyncio.to_thread(job_manager.status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
 
 @app.post("/chat")
 async def chat_with_doc(request: ChatRequest):
-    response = await agent.chat(request.query, request.history)
-    return {"response": response}
+    # Chat is scoped to the document the client analyzed; never fall back to someone else's
+    document_id = request.document_id
+    if not document_id:
+        raise HTTPException(status_code=400, detail="document_id is required (returned by /analyze)")
+    agent = await warmup.agent()
+    from db import get_vector_store, is_document_id
+    from rate_limit import is_rate_limited, retry_after
+
+    if not is_document_id(document_id):
+        raise HTTPException(status_code=400, detail="Invalid document_id")
+    # Checked before any store access that would create or track the document
+    if not await asyncio.to_thread(get_vector_store().has_document, document_id):
+        raise HTTPException(status_code=404, detail="Document not found; analyze it first")
+    session = agent.get_session(request.session_id, document_id, request.history)
+    try:
+        response = await agent.chat(session, request.query)
+    except Exception as e:
+        print(f"Chat Error: {e}")
+        if is_rate_limited(e):
+            raise HTTPException(
+                status_code=429, detail="The model is over its rate limit, try again shortly.",
+                headers={"Retry-After": str(math.ceil(retry_after(e) or 10))}
+            )
+        raise HTTPException(status_code=502, detail=f"Model call failed: {e}")
+    return {"response": response, "document_id": document_id, "session_id": session.session_id}
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
+    import uvicorn
+
+    # Auto-reload is for local development only; it runs the app in a watched child process
+    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=os.getenv("UVICORN_RELOAD", "0") == "1")
@@ -0,0 +1,275 @@
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from db import BaseVectorStore, is_document_id
+
+
+def quantize(vectors: np.ndarray, dtype) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Unit-length float32 rows in the storage dtype. int8 uses one symmetric
+    scale per row (returned alongside), so a row's largest component maps to 127.
+    """
+    if dtype != np.int8:
+        return vectors.astype(dtype), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class _DocumentIndex:
+    """
+    Chunks of one document plus their unit-normalized embeddings as a single
+    matrix in the storage dtype. With int8 storage and rescoring, a float16
+    copy is kept alongside (memory-mapped once persisted) to re-rank the
+    quantized search's candidates at near-full precision.
+    """
+
+    def __init__(self, dtype, rescore: int):
+        self.dtype = dtype
+        self.rescore = rescore if dtype == np.int8 else 0
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[dict] = []
+        self.meta: dict = {}
+        self._rows: Dict[str, int] = {}
+        self._pending: List[np.ndarray] = []
+        self.matrix: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None  # Per-row dequantization scale (int8)
+        self.full: Optional[np.ndarray] = None  # float16 copy for rescoring
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        for row, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+            existing = self._rows.get(chunk_id)
+            if existing is None:
+                self._rows[chunk_id] = len(self.ids)
+                self.ids.append(chunk_id)
+                self.documents.append(document)
+                self.metadatas.append(metadata)
+                self._pending.append(vectors[row])
+            else:
+                # Re-written chunk: rewrite its row in place
+                self._consolidate()
+                self.documents[existing] = document
+                self.metadatas[existing] = metadata
+                stored, scales = quantize(vectors[row:row + 1], self.dtype)
+                self.matrix = np.array(self.matrix)  # Detach from a read-only memory map
+                self.matrix[existing] = stored[0]
+                if scales is not None:
+                    self.scales = np.array(self.scales)
+                    self.scales[existing] = scales[0]
+                if self.full is not None:
+                    self.full = np.array(self.full)
+                    self.full[existing] = vectors[row].astype(np.float16)
+
+    def _consolidate(self):
+        """Folds rows appended since the last search into one contiguous matrix."""
+        if not self._pending:
+            return
+        fresh = np.stack(self._pending)
+        stored, scales = quantize(fresh, self.dtype)
+        self.matrix = stored if self.matrix is None else np.concatenate([self.matrix, stored])
+        if scales is not None:
+            self.scales = scales if self.scales is None else np.concatenate([self.scales, scales])
+        if self.rescore:
+            fresh = fresh.astype(np.float16)
+            self.full = fresh if self.full is None else np.concatenate([self.full, fresh])
+        self._pending = []
+
+    def vectors(self, rows) -> np.ndarray:
+        """float32 embeddings for the given rows: from the rescoring copy when kept, else dequantized."""
+        if self.full is not None:
+            return np.asarray(self.full[rows], dtype=np.float32)
+        vectors = np.asarray(self.matrix[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][:, None]
+        return vectors
+
+    def search(self, queries: np.ndarray, n_results: int):
+        self._consolidate()
+        if self.matrix is None or not len(self.ids):
+            return [([], []) for _ in range(len(queries))]
+
+        # Cosine similarity: rows and queries are unit length, so one matrix product
+        scores = queries @ self.matrix.T.astype(np.float32, copy=False)
+        if self.scales is not None:
+            scores *= self.scales
+        k = min(n_results, scores.shape[1])
+        # Quantized scores only shortlist; the float16 copy of the shortlist decides the order
+        shortlist = min(k * self.rescore, scores.shape[1]) if self.full is not None else k
+        top = np.argpartition(-scores, shortlist - 1, axis=1)[:, :shortlist]
+        results = []
+        for q, candidates in enumerate(top):
+            if shortlist > k:
+                exact = np.asarray(self.full[np.sort(candidates)], dtype=np.float32) @ queries[q]
+                candidates = np.sort(candidates)[np.argsort(-exact)[:k]]
+            else:
+                candidates = candidates[np.argsort(-scores[q, candidates])]
+            results.append(([self.documents[i] for i in candidates], [self.metadatas[i] for i in candidates]))
+        return results
+
+    def nbytes(self) -> int:
+        """Vector bytes held in RAM (memory-mapped arrays live in the page cache instead)."""
+        return sum(
+            array.nbytes for array in (self.matrix, self.scales, self.full)
+            if array is not None and not isinstance(array, np.memmap)
+        )
+
+
+class NumpyVectorStore(BaseVectorStore):
+    """
+    In-process vector index: exact brute-force top-k over one matrix per
+    document. Per-document chunk counts are small, so a vectorized matrix
+    product beats a round-trip through Chroma's SQLite/HNSW stack and has
+    perfect recall. Completed documents are persisted as .npy files and, with
+    NUMPY_INDEX_MMAP=1, served memory-mapped from disk.
+
+    NUMPY_INDEX_DTYPE picks the stored precision: float32, float16 (half the
+    size, same ranking in practice) or int8 (a quarter; per-row scales). int8
+    search shortlists NUMPY_INDEX_RESCORE x n_results candidates and re-ranks
+    them against a float16 copy kept memory-mapped on disk; 0 disables
+    rescoring and the copy.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.path = os.getenv("NUMPY_INDEX_PATH", "./numpy_index")
+        self.dtype = np.dtype(os.getenv("NUMPY_INDEX_DTYPE", "float32")).type
+        if self.dtype not in (np.float32, np.float16, np.int8):
+            raise ValueError(f"Unsupported NUMPY_INDEX_DTYPE: {self.dtype.__name__}")
+        self.rescore = int(os.getenv("NUMPY_INDEX_RESCORE", "4"))
+        self.mmap = os.getenv("NUMPY_INDEX_MMAP", "0") == "1"
+        self._indexes: Dict[str, _DocumentIndex] = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+        self._register_persisted([
+            name for name in os.listdir(self.path)
+            if is_document_id(name) and os.path.exists(os.path.join(self.path, name, "meta.json"))
+        ])
+
+    def _dir(self, document_id: str) -> str:
+        # The id names a directory that eviction deletes: never let it point anywhere else
+        if not is_document_id(document_id):
+            raise ValueError(f"Invalid document id: {document_id!r}")
+        root = os.path.realpath(self.path)
+        path = os.path.realpath(os.path.join(root, document_id))
+        if os.path.dirname(path) != root:
+            raise ValueError(f"Document directory escapes NUMPY_INDEX_PATH: {path}")
+        return path
+
+    def _index(self, document_id: str) -> _DocumentIndex:
+        with self._lock:
+            index = self._indexes.get(document_id)
+            if index is None:
+                index = self._load(document_id) or _DocumentIndex(self.dtype, self.rescore)
+                self._indexes[document_id] = index
+            return index
+
+    def _load(self, document_id: str) -> Optional[_DocumentIndex]:
+        directory = self._dir(document_id)
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            return None
+        mmap_mode = "r" if self.mmap else None
+        matrix = np.load(os.path.join(directory, "vectors.npy"), mmap_mode=mmap_mode)
+        # Served in the precision it was written in, whatever NUMPY_INDEX_DTYPE says now
+        index = _DocumentIndex(matrix.dtype.type, self.rescore)
+        index.matrix = matrix
+        if os.path.exists(os.path.join(directory, "scales.npy")):
+            index.scales = np.load(os.path.join(directory, "scales.npy"))
+        if index.rescore and os.path.exists(os.path.join(directory, "full.npy")):
+            index.full = np.load(os.path.join(directory, "full.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "meta.json")) as f:
+            index.meta = json.load(f)
+        with open(os.path.join(directory, "chunks.json")) as f:
+            chunks = json.load(f)
+        index.ids, index.documents, index.metadatas = chunks["ids"], chunks["documents"], chunks["metadatas"]
+        index._rows = {chunk_id: row for row, chunk_id in enumerate(index.ids)}
+        return index
+
+    def _metadata(self, document_id: str) -> dict:
+        return self._index(document_id).meta
+
+    def mark_complete(self, document_id: str, text_hash: Optional[str] = None):
+        index = self._index(document_id)
+        with self._lock:
+            index._consolidate()
+            index.meta = self._completion_metadata(text_hash)
+
+            directory = self._dir(document_id)
+            os.makedirs(directory, exist_ok=True)
+            matrix = index.matrix if index.matrix is not None else np.zeros((0, 0), dtype=index.dtype)
+            np.save(os.path.join(directory, "vectors.npy"), matrix)
+            if index.scales is not None:
+                np.save(os.path.join(directory, "scales.npy"), index.scales)
+            if index.full is not None:
+                np.save(os.path.join(directory, "full.npy"), index.full)
+            with open(os.path.join(directory, "chunks.json"), "w") as f:
+                json.dump({"ids": index.ids, "documents": index.documents, "metadatas": index.metadatas}, f)
+            # meta.json last: its presence marks a fully written document on disk
+            with open(os.path.join(directory, "meta.json"), "w") as f:
+                json.dump(index.meta, f)
+
+            if self.mmap and len(index.ids):
+                index.matrix = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+            if index.full is not None and len(index.ids):
+                # Only the shortlist's rows are ever read back
+                index.full = np.load(os.path.join(directory, "full.npy"), mmap_mode="r")
+
+    def count(self, document_id: str) -> int:
+        return len(self._index(document_id).ids)
+
+    def add_embedded(self, document_id: str, ids: List[str], chunks: List[str],
+                     embeddings: List[List[float]], metadatas: List[dict]):
+        self._touch(document_id)
+        index = self._index(document_id)
+        with self._lock:
+            index.upsert(ids, chunks, embeddings, metadatas)
+
+    def update_metadatas(self, document_id: str, ids: List[str], metadatas: List[dict]):
+        index = self._index(document_id)
+        with self._lock:
+            # Written to disk by the next mark_complete
+            for chunk_id, metadata in zip(ids, metadatas):
+                index.metadatas[index._rows[chunk_id]] = metadata
+
+    def query_many(self, document_id: str, query_embeddings: List[List[float]], n_results: int = 5):
+        self._touch(document_id)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        index = self._index(document_id)
+        with self._lock:
+            return index.search(queries, n_results)
+
+    def get_all(self, document_id: str):
+        self._touch(document_id)
+        index = self._index(document_id)
+        with self._lock:
+            order = sorted(range(len(index.ids)), key=lambda i: int(index.ids[i]))
+            return [index.documents[i] for i in order], [index.metadatas[i] for i in order]
+
+    def get_embedded(self, document_id: str):
+        self._touch(document_id)
+        index = self._index(document_id)
+        with self._lock:
+            index._consolidate()
+            order = sorted(range(len(index.ids)), key=lambda i: int(index.ids[i]))
+            vectors = index.vectors(order).tolist() if index.matrix is not None and order else []
+            return [index.documents[i] for i in order], vectors, [index.metadatas[i] for i in order]
+
+    def _drop(self, document_id: str):
+        with self._lock:
+            self._indexes.pop(document_id, None)
+        shutil.rmtree(self._dir(document_id), ignore_errors=True)
+
+    def close(self):
+        with self._lock:
+            self._indexes.clear()
@@ -0,0 +1,59 @@
+import json
+import os
+import threading
+import time
+import zlib
+from typing import List, Optional
+
+from sqlite_store import SqliteStore
+
+
+class PageTextStore(SqliteStore):
+    """Each indexed document's page texts (and stripped lines), compressed, so locators survive restarts."""
+
+    def __init__(self, path: str = "./page_texts.sqlite3"):
+        super().__init__(path)
+
+    def _schema(self) -> List[str]:
+        return [
+            """
+            CREATE TABLE IF NOT EXISTS page_texts (
+                document_id TEXT PRIMARY KEY,
+                pages BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        ]
+
+    def put(self, document_id: str, pages: List[tuple]):
+        blob = zlib.compress(json.dumps(pages).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO page_texts (document_id, pages, created_at) VALUES (?, ?, ?)",
+                (document_id, blob, time.time())
+            )
+            self._conn.commit()
+
+    def get(self, document_id: str) -> Optional[List[tuple]]:
+        with self._lock:
+            row = self._conn.execute("SELECT pages FROM page_texts WHERE document_id = ?", (document_id,)).fetchone()
+        if row is None:
+            return None
+        return [tuple(page) for page in json.loads(zlib.decompress(row[0]))]
+
+    def delete(self, document_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM page_texts WHERE document_id = ?", (document_id,))
+            self._conn.commit()
+
+
+_store: Optional[PageTextStore] = None
+_store_lock = threading.Lock()
+
+
+def get_page_text_store() -> PageTextStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PageTextStore(os.getenv("PAGE_TEXT_DB_PATH", "./page_texts.sqlite3"))
+        return _store
@@ -0,0 +1,26 @@
+import fitz  # PyMuPDF
+from typing import List, Tuple, Union
+
+# Kept free of chromadb/genai imports: this module is loaded by parse worker processes
+
+# The PDF a parse worker extracts from, opened once per worker by init_worker
+_worker_doc = None
+
+
+def open_pdf(source: Union[str, bytes]) -> fitz.Document:
+    """Opens a PDF from a path, or straight from its bytes without a file."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def init_worker(source: Union[str, bytes]):
+    """Process-pool initializer: the PDF (path or bytes) reaches each worker once, not with every task."""
+    global _worker_doc
+    _worker_doc = open_pdf(source)
+
+
+def extract_page_range(start: int, end: int) -> List[Tuple[int, str]]:
+    """Returns (1-based page number, text) for pages [start, end) of the PDF given to init_worker."""
+    return [(page_num + 1, _worker_doc[page_num].get_text())
+            for page_num in range(start, min(end, _worker_doc.page_count))]
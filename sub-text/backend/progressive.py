@@ -0,0 +1,104 @@
+"""
+Progressive analysis: a large document is audited while it is still being
+indexed, so the first findings do not wait for its last page.
+
+ingest_document(priority_terms=...) embeds a document of
+PROGRESSIVE_MIN_PAGES or more in prioritized windows: sections whose
+headings match the audit categories, then the first pages, then the rest
+(see ingest.prioritized_windows). After each window the categories are
+audited on the partial index. A window that lands while a round is still
+running is picked up by the next round, so rounds never queue behind each
+other.
+
+Once ingest finishes, the normal analysis (agent.iter_analysis) runs on the
+complete index, so the final report is the one a full run produces. It
+starts straight away, next to any round still running. The flag cache and
+the coalescing of identical model calls mean categories whose context did
+not change since a round cost no extra model call.
+"""
+import asyncio
+from typing import AsyncIterator
+
+from ingest import ingest_document
+
+
+async def iter_progressive_analysis(agent, use_cache: bool = True, **ingest_kwargs) -> AsyncIterator[dict]:
+    """
+    Ingests one document (ingest_kwargs as for ingest_document) and analyzes
+    it, yielding events in order:
+    - {"event": "ingest_progress", ...} as ingest advances; stage "window"
+      each time a window is indexed
+    - per round on the partial index: "category" events, then a
+      "partial_report" (both carry completeness < 1)
+    - {"event": "ingested", ...} with the IngestResult fields (the round
+      running at that point may still finish after it)
+    - the events of agent.iter_analysis: category, summary, report
+    Small documents have no windows and go straight to the full analysis.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    priority_terms = [term for terms in agent.category_headings.values() for term in terms]
+
+    # Progress callbacks come from the ingest thread
+    def on_progress(event: dict):
+        loop.call_soon_threadsafe(queue.put_nowait, ("progress", event))
+
+    ingest_task = asyncio.ensure_future(
+        asyncio.to_thread(ingest_document, progress=on_progress, priority_terms=priority_terms, **ingest_kwargs)
+    )
+    ingest_task.add_done_callback(lambda _: queue.put_nowait(("ingested", None)))
+
+    async def run_round(window: dict):
+        try:
+            async for event in agent.iter_partial_analysis(window["document_id"], window["completeness"]):
+                queue.put_nowait(("round", event))
+        except Exception as e:
+            print(f"Progressive round at {window['completeness']:.0%} failed: {e}")
+        finally:
+            queue.put_nowait(("round_done", None))
+
+    async def run_final(ingest_result):
+        try:
+            async for event in agent.iter_analysis(ingest_result.document_id, ingest_result.text_hash, use_cache):
+                queue.put_nowait(("final", event))
+        except Exception as e:
+            queue.put_nowait(("final_done", e))
+        else:
+            queue.put_nowait(("final_done", None))
+
+    round_task = final_task = None
+    window = None  # Latest indexed window no round has covered yet
+    final_started = False
+    try:
+        while True:
+            kind, event = await queue.get()
+            if kind == "progress":
+                yield {"event": "ingest_progress", **event}
+                if event["stage"] == "window":
+                    window = event
+            elif kind == "round":
+                # A round still running when ingest ends is shown until the final analysis
+                # has something to say; it keeps running after that so the final analysis
+                # can join its model calls for contexts that have not changed
+                if not final_started:
+                    yield event
+            elif kind == "round_done":
+                round_task = None
+            elif kind == "ingested":
+                ingest_result = ingest_task.result()
+                yield {"event": "ingested", **ingest_result.model_dump()}
+                final_task = asyncio.ensure_future(run_final(ingest_result))
+            elif kind == "final":
+                final_started = True
+                yield event
+            elif kind == "final_done":
+                if event is not None:
+                    raise event
+                break
+            if window is not None and round_task is None and final_task is None:
+                round_task = asyncio.ensure_future(run_round(window))
+                window = None
+    finally:
+        for task in (round_task, final_task):
+            if task is not None:
+                task.cancel()
@@ -0,0 +1,310 @@
+"""
+Model providers. `db.get_genai_client()` hands out either the real Gemini
+client or, with MODEL_PROVIDER=fake, the deterministic local stand-in below.
+The fake implements the subset of the genai.Client surface the backend uses
+(models / aio.models embed_content and generate_content, caches create,
+update and delete) so load tests and
+benchmarks can run without an API key or quota.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import List, Optional
+
+from google.genai import errors, types
+from pydantic import TypeAdapter
+
+TOKEN = re.compile(r"[a-z0-9]+")
+CONTEXT_BLOCK = re.compile(r"Context Clauses:\n(.*?)\n\s*Task:", re.S)
+CATEGORY_LIST = re.compile(r"categories:\n((?:[ \t]*- [^\n]+\n)+)")
+
+
+def get_provider_name() -> str:
+    return os.getenv("MODEL_PROVIDER", "gemini").lower()
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """
+    Hash-seeded bag-of-words vector: every token adds a signed unit to a
+    hashed dimension, so texts that share words land close together and
+    lexical queries retrieve sensible chunks. Deterministic across runs.
+    """
+    vector = [0.0] * dim
+    for token in TOKEN.findall(text.lower()):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if not norm:
+        # Empty text: a fixed pseudo-random unit vector
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vector = [rng.gauss(0, 1) for _ in range(dim)]
+        norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector]
+
+
+def _prompt_text(contents) -> str:
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, list):
+        return "\n".join(_prompt_text(c) for c in contents)
+    if isinstance(contents, types.Content):
+        return "\n".join(p.text or "" for p in contents.parts or [])
+    if isinstance(contents, dict):
+        return "\n".join(p.get("text", "") for p in contents.get("parts", []))
+    return str(contents)
+
+
+class FakeQuota:
+    """Server-side rate limit: a bucket holding one second's worth of requests."""
+
+    def __init__(self, requests_per_minute: float):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.accepted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()  # Embeddings are requested from ingest threads
+
+    def admit(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                self.rejected += 1
+                delay = (1 - self.tokens) / self.rate
+                raise errors.ClientError(429, {"error": {
+                    "message": "Fake quota exceeded", "status": "RESOURCE_EXHAUSTED",
+                    "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{delay:.3f}s"}]
+                }})
+            self.tokens -= 1
+            self.accepted += 1
+
+
+class FakeModelSettings:
+    """Knobs read from the environment so a benchmark can dial in realistic behaviour."""
+
+    def __init__(self):
+        self.embedding_dim = int(os.getenv("FAKE_EMBEDDING_DIM", "3072"))
+        self.embed_latency = float(os.getenv("FAKE_EMBED_LATENCY_MS", "50")) / 1000
+        self.llm_latency = float(os.getenv("FAKE_LLM_LATENCY_MS", "1500")) / 1000
+        self.latency_jitter = float(os.getenv("FAKE_LATENCY_JITTER", "0.2"))
+        self.error_rate = float(os.getenv("FAKE_ERROR_RATE", "0"))
+        # Paid once per client (sync and async separately), like opening its first HTTPS connection
+        self.connect_latency = float(os.getenv("FAKE_CONNECT_LATENCY_MS", "0")) / 1000
+        self.rng = random.Random(int(os.getenv("FAKE_SEED", "0")))
+        # Server-side quotas (requests per minute, 0 = none): calls over them get a 429 with a retry delay
+        self.quotas = {
+            "embed": FakeQuota(float(os.getenv("FAKE_EMBED_REQUESTS_PER_MINUTE", "0"))),
+            "generate": FakeQuota(float(os.getenv("FAKE_LLM_REQUESTS_PER_MINUTE", "0"))),
+        }
+
+    def delay(self, base: float) -> float:
+        return max(0.0, base * (1 + self.rng.uniform(-self.latency_jitter, self.latency_jitter)))
+
+    def maybe_fail(self):
+        if self.error_rate and self.rng.random() < self.error_rate:
+            if self.rng.random() < 0.7:
+                raise errors.ClientError(429, {"error": {"message": "Fake quota exceeded", "status": "RESOURCE_EXHAUSTED"}})
+            raise errors.ServerError(503, {"error": {"message": "Fake backend unavailable", "status": "UNAVAILABLE"}})
+
+
+def _ttl_seconds(ttl: Optional[str]) -> float:
+    return float(ttl.rstrip("s")) if ttl else 3600.0
+
+
+class FakeCaches:
+    """
+    Cached contents held in memory; generate_content prepends them to the
+    prompt. Like the real store, an entry expires once its TTL runs out and
+    is then answered with 404.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.expires_at = {}
+
+    def create(self, model: str, config: Optional[types.CreateCachedContentConfig] = None):
+        name = f"cachedContents/fake-{len(self.entries) + 1}"
+        parts = [_prompt_text(config.system_instruction or "") if config else ""]
+        if config and config.contents:
+            parts.append(_prompt_text(config.contents))
+        self.entries[name] = "\n".join(parts)
+        self.expires_at[name] = time.time() + _ttl_seconds(config.ttl if config else None)
+        return types.CachedContent(name=name, model=model)
+
+    def get_text(self, name: str) -> str:
+        if name not in self.entries or time.time() >= self.expires_at[name]:
+            raise errors.ClientError(404, {"error": {"message": f"{name} not found", "status": "NOT_FOUND"}})
+        return self.entries[name]
+
+    def update(self, name: str, config: Optional[types.UpdateCachedContentConfig] = None):
+        self.get_text(name)
+        self.expires_at[name] = time.time() + _ttl_seconds(config.ttl if config else None)
+        return types.CachedContent(name=name)
+
+    def delete(self, name: str):
+        self.entries.pop(name, None)
+        self.expires_at.pop(name, None)
+
+
+class FakeAsyncCaches:
+    def __init__(self, caches: FakeCaches):
+        self._caches = caches
+
+    async def create(self, model: str, config: Optional[types.CreateCachedContentConfig] = None):
+        return self._caches.create(model, config)
+
+    async def update(self, name: str, config: Optional[types.UpdateCachedContentConfig] = None):
+        return self._caches.update(name, config)
+
+    async def delete(self, name: str):
+        self._caches.delete(name)
+
+
+class FakeConnection:
+    def __init__(self, settings: FakeModelSettings):
+        self._latency = settings.connect_latency
+        self._lock = threading.Lock()
+
+    def setup_delay(self) -> float:
+        """Connection setup latency for this call: the full cost on the first call, then nothing."""
+        with self._lock:
+            latency, self._latency = self._latency, 0.0
+        return latency
+
+
+class FakeModels:
+    def __init__(self, settings: FakeModelSettings, caches: FakeCaches):
+        self.settings = settings
+        self.caches = caches
+        self.connection = FakeConnection(settings)
+
+    def _embed(self, contents, config) -> types.EmbedContentResponse:
+        texts = [contents] if isinstance(contents, str) else list(contents)
+        dim = (config.output_dimensionality if config and config.output_dimensionality
+               else self.settings.embedding_dim)
+        return types.EmbedContentResponse(
+            embeddings=[types.ContentEmbedding(values=fake_embedding(t, dim)) for t in texts]
+        )
+
+    def _generate(self, contents, config) -> types.GenerateContentResponse:
+        prompt = _prompt_text(contents)
+        cached_tokens = None
+        if config is not None and config.cached_content:
+            cached = self.caches.get_text(config.cached_content)
+            cached_tokens = len(cached) // 4
+            prompt = f"{cached}\n{prompt}"
+        elif config is not None and config.system_instruction:
+            prompt = f"{_prompt_text(config.system_instruction)}\n{prompt}"
+        wants_json = config is not None and config.response_mime_type == "application/json"
+
+        parsed = None
+        if wants_json:
+            # One canned flag per requested category (a single unnamed one for a
+            # per-category prompt), each quoting a different context chunk
+            flags = []
+            context = CONTEXT_BLOCK.search(prompt)
+            matches = [chunk for chunk in re.split(r"\n\s*\n", context.group(1)) if chunk.strip()] if context else []
+            listed = CATEGORY_LIST.search(prompt) if config.response_schema else None
+            categories = [line.strip()[2:] for line in listed.group(1).splitlines()] if listed else []
+            for i, category in enumerate(categories or [None]):
+                if not matches:
+                    break
+                quote = " ".join(matches[i % len(matches)].split()[:25])
+                flag = {
+                    "risk_level": ["High", "Medium", "Low"][len(quote) % 3],
+                    "description": "Stand-in finding generated by the offline fake provider.",
+                    "quote": quote,
+                }
+                if category:
+                    flag["category"] = category
+                flags.append(flag)
+            text = json.dumps(flags)
+            if config.response_schema is not None:
+                # The real SDK validates against the schema and fills in .parsed
+                parsed = TypeAdapter(config.response_schema).validate_python(flags)
+        else:
+            text = "Stand-in response from the offline fake provider."
+
+        response = types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=len(prompt) // 4,
+                cached_content_token_count=cached_tokens,
+                candidates_token_count=len(text) // 4,
+                thoughts_token_count=len(text) // 2,
+            )
+        )
+        response.parsed = parsed
+        return response
+
+    def get(self, model: str) -> types.Model:
+        time.sleep(self.connection.setup_delay())
+        return types.Model(name=model)
+
+    def embed_content(self, model: str, contents, config: Optional[types.EmbedContentConfig] = None):
+        self.settings.quotas["embed"].admit()
+        time.sleep(self.connection.setup_delay() + self.settings.delay(self.settings.embed_latency))
+        self.settings.maybe_fail()
+        return self._embed(contents, config)
+
+    def generate_content(self, model: str, contents, config: Optional[types.GenerateContentConfig] = None):
+        self.settings.quotas["generate"].admit()
+        time.sleep(self.connection.setup_delay() + self.settings.delay(self.settings.llm_latency))
+        self.settings.maybe_fail()
+        return self._generate(contents, config)
+
+
+class FakeAsyncModels:
+    def __init__(self, models: FakeModels):
+        self._models = models
+        self.settings = models.settings
+        self.connection = FakeConnection(models.settings)
+
+    async def get(self, model: str) -> types.Model:
+        await asyncio.sleep(self.connection.setup_delay())
+        return types.Model(name=model)
+
+    async def embed_content(self, model: str, contents, config: Optional[types.EmbedContentConfig] = None):
+        self.settings.quotas["embed"].admit()
+        await asyncio.sleep(self.connection.setup_delay() + self.settings.delay(self.settings.embed_latency))
+        self.settings.maybe_fail()
+        return self._models._embed(contents, config)
+
+    async def generate_content(self, model: str, contents, config: Optional[types.GenerateContentConfig] = None):
+        self.settings.quotas["generate"].admit()
+        await asyncio.sleep(self.connection.setup_delay() + self.settings.delay(self.settings.llm_latency))
+        self.settings.maybe_fail()
+        return self._models._generate(contents, config)
+
+
+class FakeAsyncClient:
+    def __init__(self, models: FakeModels):
+        self.models = FakeAsyncModels(models)
+        self.caches = FakeAsyncCaches(models.caches)
+
+    async def aclose(self):
+        pass
+
+
+class FakeGenaiClient:
+    """Drop-in for genai.Client backed by FakeModels."""
+
+    def __init__(self):
+        self.caches = FakeCaches()
+        self.models = FakeModels(FakeModelSettings(), self.caches)
+        self.aio = FakeAsyncClient(self.models)
+
+    def close(self):
+        pass
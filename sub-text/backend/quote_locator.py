@@ -0,0 +1,188 @@
+"""
+Finds where an audit finding's quote sits in the document.
+
+Ingest stores each page's extracted text (page_texts.PageTextStore), with the running
+header/footer lines it stripped. A QuoteLocator indexes one document's pages
+as normalized words (lowercased, NFKC, every punctuation mark dropped,
+line-break hyphens rejoined), each mapped back to its page and character
+offsets in that page's text. Stripped lines are left out, as they are from
+the chunks the model quotes, so a quote running across a page break still
+reads as one passage. locate() resolves a quote to a page and offset span:
+
+- exact: every word of the quote, in order (an ellipsis may skip text)
+- fuzzy: at least QUOTE_MATCH_THRESHOLD of the quote's words line up with
+  one passage (the model reworded or dropped a few words)
+
+A quote that matches nowhere is most likely not in the document at all.
+Pages no longer need to be read back by the model from [Page X] tags.
+"""
+import os
+import re
+import unicodedata
+from array import array
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional
+
+# Share of a quote's words that must line up with one passage for a fuzzy match
+QUOTE_MATCH_THRESHOLD = float(os.getenv("QUOTE_MATCH_THRESHOLD", "0.8"))
+# Shorter quotes must match exactly; a handful of common words lines up anywhere
+MIN_FUZZY_WORDS = 6
+# Words this frequent in the document cast no votes for where a quote starts
+MAX_ANCHOR_POSITIONS = 200
+ANCHOR_CANDIDATES = 5
+# Extra words on each side of a candidate passage, for insertions and deletions
+WINDOW_PADDING = 8
+# Words an ellipsis may skip between two parts of a quote
+MAX_ELISION_WORDS = 400
+
+# A word, with hyphenated parts ("non-refundable", "termi-\nnation") kept together
+_WORD = re.compile(r"[^\W_]+(?:-\s*[^\W_]+)*")
+_ELLIPSIS = re.compile(r"(?:\.\s*){3,}|…")
+
+
+def _normalize(word: str) -> str:
+    return "".join(unicodedata.normalize("NFKC", word).lower().replace("-", "").split())
+
+
+def quote_words(text: str) -> List[str]:
+    return [_normalize(word) for word in _WORD.findall(text)]
+
+
+def _blank_lines(text: str, skipped: Iterable[int]) -> str:
+    """`text` with the lines at the `skipped` indexes replaced by spaces, so offsets are unchanged."""
+    skipped = set(skipped)
+    if not skipped:
+        return text
+    lines = text.splitlines(keepends=True)
+    for index in skipped:
+        if index < len(lines):
+            line = lines[index]
+            body = line.rstrip("\r\n")
+            lines[index] = " " * len(body) + line[len(body):]
+    return "".join(lines)
+
+
+class QuoteLocator:
+    """
+    Normalized word index over one document's pages, given in order as
+    (page number, text) or (page number, text, indexes of lines to leave out).
+    """
+
+    def __init__(self, pages: Iterable[tuple]):
+        self.page_numbers: List[int] = []
+        self._page_first_word = array("l")
+        self._starts = array("l")  # Character offset of each word in its page's text
+        self._ends = array("l")
+        words: List[str] = []
+        for page_num, text, *skipped in pages:
+            self.page_numbers.append(page_num)
+            self._page_first_word.append(len(words))
+            for match in _WORD.finditer(_blank_lines(text, skipped[0] if skipped else ())):
+                words.append(_normalize(match.group()))
+                self._starts.append(match.start())
+                self._ends.append(match.end())
+        self.words = words
+
+        # " w0 w1 ... " with each word's offset, so str.find resolves a whole-word phrase to a word index
+        self._text = " " + " ".join(words) + " "
+        self._char_offsets = array("l")
+        offset = 1
+        for word in words:
+            self._char_offsets.append(offset)
+            offset += len(word) + 1
+
+        self._positions: Dict[str, List[int]] = defaultdict(list)
+        for position, word in enumerate(words):
+            self._positions[word].append(position)
+
+    def _page_index(self, word: int) -> int:
+        return bisect_right(self._page_first_word, word) - 1
+
+    def _span(self, first: int, last: int, kind: str, score: float) -> dict:
+        """Location of words [first, last] as pages and character offsets within each page's text."""
+        return {
+            "page": self.page_numbers[self._page_index(first)],
+            "start": self._starts[first],
+            "page_end": self.page_numbers[self._page_index(last)],
+            "end": self._ends[last],
+            "match": kind,
+            "score": round(score, 3),
+        }
+
+    def _find_all(self, words: List[str], start_word: int = 0, end_word: Optional[int] = None) -> List[int]:
+        """Word indexes where `words` occur as a phrase, starting in [start_word, end_word)."""
+        needle = " " + " ".join(words) + " "
+        end_char = self._char_offsets[end_word] if end_word is not None and end_word < len(self.words) else None
+        found = []
+        position = self._text.find(needle, self._char_offsets[start_word] - 1 if start_word < len(self.words) else len(self._text))
+        while position != -1 and (end_char is None or position + 1 < end_char):
+            found.append(bisect_right(self._char_offsets, position + 1) - 1)
+            position = self._text.find(needle, position + 1)
+        return found
+
+    def _exact(self, segments: List[List[str]], hint_pages) -> Optional[dict]:
+        spans = []
+        for first in self._find_all(segments[0]):
+            last = first + len(segments[0]) - 1
+            for segment in segments[1:]:
+                following = self._find_all(segment, last + 1, last + 1 + MAX_ELISION_WORDS + len(segment))
+                if not following:
+                    break
+                last = following[0] + len(segment) - 1
+            else:
+                spans.append((first, last))
+        if not spans:
+            return None
+        # Repeated text (boilerplate) matches several times: prefer the pages the finding came from
+        first, last = next((span for span in spans if self._in_pages(span[0], hint_pages)), spans[0])
+        return self._span(first, last, "exact", 1.0)
+
+    def _in_pages(self, word: int, pages) -> bool:
+        return bool(pages) and self.page_numbers[self._page_index(word)] in pages
+
+    def _fuzzy(self, words: List[str], hint_pages) -> Optional[dict]:
+        votes: Counter = Counter()
+        for offset, word in enumerate(words):
+            positions = self._positions.get(word, ())
+            if len(positions) > MAX_ANCHOR_POSITIONS:
+                continue
+            for position in positions:
+                votes[position - offset] += 1
+
+        best = None
+        for anchor, _ in votes.most_common(ANCHOR_CANDIDATES):
+            low = max(0, anchor - WINDOW_PADDING)
+            window = self.words[low:anchor + len(words) + WINDOW_PADDING]
+            blocks = [block for block in SequenceMatcher(None, words, window, autojunk=False).get_matching_blocks()
+                      if block.size]
+            if not blocks:
+                continue
+            score = sum(block.size for block in blocks) / len(words)
+            first, last = low + blocks[0].b, low + blocks[-1].b + blocks[-1].size - 1
+            key = (score, self._in_pages(first, hint_pages))
+            if best is None or key > best[0]:
+                best = (key, first, last)
+        if best is None or best[0][0] < QUOTE_MATCH_THRESHOLD:
+            return None
+        (score, _), first, last = best
+        return self._span(first, last, "fuzzy", score)
+
+    def locate(self, quote: str, hint_pages: Iterable[int] = ()) -> Optional[dict]:
+        """
+        {"page", "start", "page_end", "end", "match", "score"} for the quote's
+        passage, or None when it is not in the document. `start` is a
+        character offset in the text of `page`, `end` one in the text of
+        `page_end`. `hint_pages` breaks ties between repeated passages.
+        """
+        segments = [words for words in (quote_words(part) for part in _ELLIPSIS.split(quote)) if words]
+        if not segments or not self.words:
+            return None
+        hint_pages = set(hint_pages)
+        match = self._exact(segments, hint_pages)
+        if match is None:
+            words = [word for segment in segments for word in segment]
+            if len(words) >= MIN_FUZZY_WORDS:
+                match = self._fuzzy(words, hint_pages)
+        return match
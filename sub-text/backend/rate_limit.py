@@ -0,0 +1,400 @@
+"""
+Client-side admission control for Gemini calls.
+
+Every call to one model goes through that model's AdaptiveLimiter, shared by
+the whole process (request handlers, background jobs, batch runs, ingest
+threads):
+
+- token buckets for the request quota (requests per minute) and the token
+  quota (tokens per minute; reserved from an estimate, settled with actual
+  usage once the response arrives)
+- an AIMD concurrency window: +1/window per success, halved on a 429, so the
+  number of calls in flight settles just under what the quota sustains; with
+  no request quota configured, the request rate is learned the same way
+  (set to the recent success rate on a 429, +1/min per success)
+- a cool-down after a 429 that honours the server's retry delay
+- two priorities: interactive calls (chat) are admitted before queued
+  background work (audits, ingest)
+"""
+import asyncio
+import collections
+import contextvars
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+from google.genai import errors
+
+from telemetry import LIMITER_CONCURRENCY, LIMITER_THROTTLED, LIMITER_WAIT_SECONDS
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Learning a request rate from 429s when no quota is configured. The first 429
+# sets it to what the server let through over a full quota period (a lower bound
+# on the quota, exact for per-minute quotas); it then doubles every second until
+# the next 429 halves it. From there it grows by RATE_GROWTH_PER_SECOND of itself
+# per second while callers wait on it, and a 429 cuts it to RATE_DECREASE. Only
+# calls admitted after the last cut can cut it again, so one overshoot costs one cut.
+RATE_WINDOW_SECONDS = 60.0
+RATE_SLOW_START_GROWTH = 4.0
+RATE_GROWTH_PER_SECOND = 0.1
+RATE_DECREASE = 0.8
+# Longest the dispatcher sleeps while a learned rate is growing, so growth reaches waiting callers
+RATE_GROWTH_TICK_SECONDS = 0.1
+# Longest the limiter pauses after a 429, whatever the server asks for
+MAX_COOLDOWN_SECONDS = 60.0
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("priority", default=BACKGROUND)
+
+
+@contextmanager
+def interactive():
+    """Marks calls made inside the block (and threads started from it) as interactive."""
+    token = _priority.set(INTERACTIVE)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return isinstance(error, errors.APIError) and error.code == 429
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, rate limits (429) and server errors (5xx) are worth retrying."""
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if isinstance(error, errors.APIError):
+        return error.code == 429 or (error.code or 0) >= 500
+    return False
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Server-requested delay in seconds: the Retry-After header, else google.rpc.RetryInfo in the body."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is not None:
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    details = getattr(error, "details", None)
+    error_body = details.get("error", details) if isinstance(details, dict) else {}
+    for detail in error_body.get("details", []) if isinstance(error_body, dict) else []:
+        delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        match = re.fullmatch(r"([\d.]+)s", delay or "")
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """`per_minute` of 0 disables the bucket."""
+
+    def __init__(self, per_minute: float, burst: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, burst)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float = 1) -> float:
+        """Seconds until `amount` can be taken (a request larger than the bucket waits for a full one)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return max(0.0, min(amount, self.capacity) - self._tokens) / self.rate
+
+    def take(self, amount: float = 1):
+        if self.rate > 0:
+            self._refill()
+            self._tokens -= amount
+
+    def settle(self, amount: float):
+        """Corrects an earlier reservation: positive takes more, negative gives back."""
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+    def drain(self):
+        """Empties the bucket, e.g. when the server reports the quota is used up."""
+        if self.rate > 0:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+
+
+class _Waiter:
+    """One caller queued for a slot: an asyncio future or a thread event."""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop], tokens: int):
+        self.loop = loop
+        self.tokens = tokens
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+        self.granted = False
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class Slot:
+    """Held for the duration of one call; report actual token usage through `used_tokens`."""
+
+    def __init__(self, limiter: "AdaptiveLimiter", tokens: int):
+        self.limiter = limiter
+        self.reserved_tokens = tokens
+        self.admitted = time.monotonic()
+
+    def used_tokens(self, tokens: int):
+        with self.limiter._lock:
+            self.limiter.tokens.settle(tokens - self.reserved_tokens)
+        self.reserved_tokens = tokens
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 burst: int = 5, max_concurrency: int = 8, min_concurrency: int = 1):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute, burst)
+        self._learn_rate = requests_per_minute <= 0
+        self._successes = collections.deque()
+        self._slow_start = True
+        self._last_growth = 0.0
+        self._last_rate_cut = 0.0
+        # A minute's worth of tokens (or the largest single call) may go out at once
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self._last_decrease = 0.0
+        self._throttle_streak = 0
+        self._queue = []  # (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._timer_due = 0.0
+        LIMITER_CONCURRENCY.labels(limiter=name).set(self.limit)
+
+    def _enqueue(self, loop, tokens: int) -> _Waiter:
+        waiter = _Waiter(loop, tokens)
+        with self._lock:
+            heapq.heappush(self._queue, (_priority.get(), next(self._seq), waiter))
+            self._dispatch()
+        return waiter
+
+    def _dispatch(self):
+        """
+        Grants slots to queued callers, best priority first, while the window,
+        the cool-down and both quotas allow; otherwise schedules itself for when
+        they will. Pacing here rather than after admission means a chat call
+        only ever waits for the next free token, not behind audits that were
+        admitted earlier. Caller holds the lock.
+        """
+        growing = self._learn_rate and self.requests.rate > 0
+        if growing:
+            self._grow_rate()
+        while self._queue and self.in_flight < int(self.limit):
+            waiter = self._queue[0][2]
+            wait = max(self.cooldown_until - time.monotonic(),
+                       self.requests.delay(1), self.tokens.delay(waiter.tokens))
+            if wait > 0:
+                self._wake_in(min(wait, RATE_GROWTH_TICK_SECONDS) if growing else wait)
+                return
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            self.in_flight += 1
+            waiter.grant()
+
+    def _wake_in(self, seconds: float):
+        due = time.monotonic() + seconds
+        if self._timer is not None and self._timer_due <= due:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(seconds, self._on_timer)
+        self._timer.daemon = True
+        self._timer_due = due
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _abandon(self, waiter: _Waiter):
+        """A queued caller gave up (cancelled): drop it, or give back the slot it was just granted."""
+        with self._lock:
+            if waiter.granted:
+                self.in_flight -= 1
+            else:
+                self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+                heapq.heapify(self._queue)
+            self._dispatch()
+
+    def _release(self, error: Optional[BaseException], admitted: float):
+        with self._lock:
+            self.in_flight -= 1
+            if error is None:
+                self._succeeded()
+            elif isinstance(error, Exception) and is_rate_limited(error):
+                self._throttled(error, admitted)
+            LIMITER_CONCURRENCY.labels(limiter=self.name).set(self.limit)
+            self._dispatch()
+
+    def _succeeded(self):
+        now = time.monotonic()
+        self._throttle_streak = 0
+        self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+        self._successes.append(now)
+        while self._successes[0] < now - RATE_WINDOW_SECONDS:
+            self._successes.popleft()
+
+    def _grow_rate(self):
+        """
+        Grows the learned rate for the time callers have been waiting on it, in
+        proportion to itself: probing back up to the quota takes as long at 60
+        requests a minute as at 6000. Nothing grows while callers are held back
+        by something else (idle, cool-down, concurrency window).
+        """
+        now = time.monotonic()
+        elapsed, self._last_growth = min(now - self._last_growth, 1.0), now
+        if not self._queue or now < self.cooldown_until or self.in_flight >= int(self.limit) \
+                or self.requests.delay(1) <= 0:
+            return
+        growth = RATE_SLOW_START_GROWTH ** elapsed if self._slow_start else 1 + RATE_GROWTH_PER_SECOND * elapsed
+        self._set_learned_rate(self.requests.rate * growth)
+
+    def _set_learned_rate(self, rate: float):
+        self.requests.rate = rate
+        self.requests.capacity = max(1.0, rate)
+
+    def _throttled(self, error: Exception, admitted: float):
+        now = time.monotonic()
+        LIMITER_THROTTLED.labels(limiter=self.name).inc()
+        self._throttle_streak += 1
+        delay = retry_after(error)
+        if delay is None:
+            delay = 2.0 ** (self._throttle_streak - 1)
+        delay = min(delay, MAX_COOLDOWN_SECONDS)
+        self.cooldown_until = max(self.cooldown_until, now + delay)
+        # Calls already in flight when the quota ran out all fail together: halve once per window
+        if now - self._last_decrease >= max(delay, 1.0):
+            self.limit = max(float(self.min_concurrency), self.limit / 2)
+            self._last_decrease = now
+        if self._learn_rate and admitted >= self._last_rate_cut:
+            self._grow_rate()
+            if self.requests.rate <= 0:
+                self._set_learned_rate(max(len(self._successes), 1) / RATE_WINDOW_SECONDS)
+            elif self._slow_start:
+                self._set_learned_rate(self.requests.rate / 2)
+                self._slow_start = False
+            else:
+                self._set_learned_rate(self.requests.rate * RATE_DECREASE)
+            self._last_rate_cut = now
+        # The server's count is what matters: stop spending the burst allowance
+        self.requests.drain()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0):
+        """Admits one async call; a 429 raised inside shrinks the window and starts a cool-down."""
+        start = time.monotonic()
+        waiter = self._enqueue(asyncio.get_running_loop(), tokens)
+        try:
+            await waiter.future
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        LIMITER_WAIT_SECONDS.labels(limiter=self.name).observe(time.monotonic() - start)
+        slot = Slot(self, tokens)
+        try:
+            yield slot
+        except BaseException as e:
+            self._release(e, slot.admitted)
+            raise
+        self._release(None, slot.admitted)
+
+    @contextmanager
+    def slot_sync(self, tokens: int = 0):
+        """Blocking form of slot(), for worker threads."""
+        start = time.monotonic()
+        waiter = self._enqueue(None, tokens)
+        waiter.event.wait()
+        LIMITER_WAIT_SECONDS.labels(limiter=self.name).observe(time.monotonic() - start)
+        slot = Slot(self, tokens)
+        try:
+            yield slot
+        except BaseException as e:
+            self._release(e, slot.admitted)
+            raise
+        self._release(None, slot.admitted)
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(kind: str, model: str) -> AdaptiveLimiter:
+    """
+    Process-wide limiter per model. Quotas come from the `kind` prefix:
+    {KIND}_REQUESTS_PER_MINUTE, {KIND}_TOKENS_PER_MINUTE (0 = unlimited),
+    {KIND}_BURST and {KIND}_MAX_CONCURRENCY, e.g. LLM_* or EMBED_*.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            prefix = kind.upper()
+            limiter = AdaptiveLimiter(
+                model,
+                requests_per_minute=float(os.getenv(f"{prefix}_REQUESTS_PER_MINUTE", "0")),
+                tokens_per_minute=float(os.getenv(f"{prefix}_TOKENS_PER_MINUTE", "0")),
+                burst=int(os.getenv(f"{prefix}_BURST", "5")),
+                max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", "8")),
+                min_concurrency=int(os.getenv(f"{prefix}_MIN_CONCURRENCY", "1")),
+            )
+            _limiters[model] = limiter
+        return limiter
+
+
+class Coalescer:
+    """
+    Identical async calls in flight at the same time share one execution: later
+    callers await the first one's result. The shared call is cancelled only
+    when every caller waiting on it has gone away.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, list] = {}  # key -> [task, waiters]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    async def run(self, key: str, factory):
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = [asyncio.ensure_future(factory()), 0]
+            call[0].add_done_callback(lambda _: self._calls.get(key) is call and self._calls.pop(key))
+        call[1] += 1
+        try:
+            return await asyncio.shield(call[0])
+        finally:
+            call[1] -= 1
+            if not call[1] and not call[0].done():
+                call[0].cancel()
@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+from schemas import AnalysisReport
+from sqlite_store import SqliteStore
+
+
+class _SqliteCache(SqliteStore):
+    """
+    Key/value table with a TTL on entries and least-recently-used eviction
+    above `max_entries`. Subclasses decide what the text payload holds.
+    """
+    table = ""
+    column = ""
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        super().__init__(path)
+
+    def _schema(self) -> List[str]:
+        return [
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                {self.column} TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """,
+            f"CREATE INDEX IF NOT EXISTS idx_{self.table}_last_used ON {self.table}(last_used)",
+        ]
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self.column}, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def _put(self, key: str, payload: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, {self.column}, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now)
+            )
+            self._conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl_seconds,))
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,)
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        return {"entries": size, "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+class ReportCache(_SqliteCache):
+    """
+    On-disk cache of finished AnalysisReports. Keys are built by the agent from
+    the document's normalized text hash, model name, category list and prompt
+    version. Entries expire after `ttl_seconds` and the least recently used
+    ones are dropped above `max_entries`.
+    """
+    table = "reports"
+    column = "report"
+
+    def __init__(self, path: str = "./report_cache.sqlite3", max_entries: int = 5000,
+                 ttl_seconds: float = 7 * 24 * 3600):
+        super().__init__(path, max_entries, ttl_seconds)
+
+    def get(self, key: str) -> Optional[AnalysisReport]:
+        payload = self._get(key)
+        return AnalysisReport.model_validate_json(payload) if payload is not None else None
+
+    def put(self, key: str, report: AnalysisReport):
+        self._put(key, report.model_dump_json())
+
+
+class FlagCache(_SqliteCache):
+    """
+    Red flags of one category (or one single-pass audit) keyed by the exact
+    chunks retrieved for it, so a new document version re-runs only the
+    categories whose context changed. Entries are JSON lists of
+    {"flag": RedFlag fields as the model returned them}; pages are placed per document.
+    """
+    table = "category_flags"
+    column = "flags"
+
+    def __init__(self, path: str = "./report_cache.sqlite3", max_entries: int = 50000,
+                 ttl_seconds: float = 7 * 24 * 3600):
+        super().__init__(path, max_entries, ttl_seconds)
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        payload = self._get(key)
+        return json.loads(payload) if payload is not None else None
+
+    def put(self, key: str, entries: List[dict]):
+        self._put(key, json.dumps(entries))
+
+
+_cache: Optional[ReportCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_report_cache() -> Optional[ReportCache]:
+    """Returns the process-wide cache, or None when disabled via REPORT_CACHE_ENABLED=0."""
+    global _cache
+    if os.getenv("REPORT_CACHE_ENABLED", "1") == "0":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ReportCache(
+                path=os.getenv("REPORT_CACHE_PATH", "./report_cache.sqlite3"),
+                max_entries=int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "5000")),
+                ttl_seconds=float(os.getenv("REPORT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+            )
+        return _cache
+
+
+_flag_cache: Optional[FlagCache] = None
+
+
+def get_flag_cache() -> Optional[FlagCache]:
+    """Returns the process-wide per-category flag cache; shares REPORT_CACHE_ENABLED and the database file."""
+    global _flag_cache
+    if os.getenv("REPORT_CACHE_ENABLED", "1") == "0":
+        return None
+    with _cache_lock:
+        if _flag_cache is None:
+            _flag_cache = FlagCache(
+                path=os.getenv("REPORT_CACHE_PATH", "./report_cache.sqlite3"),
+                max_entries=int(os.getenv("FLAG_CACHE_MAX_ENTRIES", "50000")),
+                ttl_seconds=float(os.getenv("REPORT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+            )
+        return _flag_cache
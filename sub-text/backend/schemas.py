@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 class AnalyzeRequest(BaseModel):
     file_path: str  # For local hackathon demo, we just pass the path after upload
@@ -9,13 +9,52 @@ class RedFlag(BaseModel):
     risk_level: str  # "High", "Medium", "Low"
     description: str
     quote: str
-    page_number: Optional[int] = None
+    page_number: Optional[int] = None  # Page the quote starts on, found locally from the quote text
+    page_end: Optional[int] = None  # Page the quote ends on
+    quote_start: Optional[int] = None  # Character offset of the quote in page_number's extracted text
+    quote_end: Optional[int] = None  # Offset just past the quote in page_end's extracted text
+    quote_match: Optional[str] = None  # "exact", "fuzzy" (reworded), or "none": not in the document, likely invented
+    is_new: bool = False  # Quote is in a clause added or changed since the previous version
 
 class AnalysisReport(BaseModel):
     summary: str
     red_flags: List[RedFlag]
     overall_risk_score: int  # 0-100
+    document_id: Optional[str] = None  # Pass back to /chat to talk to this document
+    cached: bool = False  # True when served from the report cache
+    failed_categories: List[str] = []  # Categories whose analysis failed (e.g. quota exhausted); not in the score
+    completeness: float = 1.0  # Share of the document's chunks indexed when analyzed; below 1 for progressive partial reports
 
 class ChatRequest(BaseModel):
     query: str
     history: List[dict] = []
+    document_id: Optional[str] = None  # Required: the id returned by /analyze (400 without it)
+    session_id: Optional[str] = None  # Returned by /chat; send back to continue the conversation
+
+class BatchRequest(BaseModel):
+    paths: List[str]  # PDF files and/or directories on the server, relative to BATCH_ROOT
+    output: Optional[str] = None  # .jsonl file under BATCH_ROOT to append results to; needed for resume
+    resume: bool = False  # Skip documents already recorded as ok in `output`
+    refresh: bool = False  # Ignore cached reports
+
+class IngestResult(BaseModel):
+    document_id: str
+    num_chunks: int
+    text_hash: Optional[str] = None  # sha256 of the normalized extracted text
+    reused: bool = False  # True when the document was already indexed
+    chunks_reused: int = 0  # Chunks whose embeddings were carried over from the previous version
+    pages_changed: Optional[int] = None  # Pages whose text differs from the previous version
+    duplicate_chunks: int = 0  # Near-duplicate chunks folded into an earlier chunk instead of being embedded
+    dedup_ratio: float = 0.0  # duplicate_chunks / chunks produced by the chunker
+    header_footer_lines: int = 0  # Running header/footer lines stripped before chunking
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str  # "queued", "running", "done", "failed"
+    filename: str
+    progress: Dict[str, Any] = {}  # Current stage plus per-stage counters
+    report: Optional[AnalysisReport] = None  # While running progressively: the latest partial report (completeness < 1)
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
\ No newline at end of file
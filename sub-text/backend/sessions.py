@@ -0,0 +1,152 @@
+import asyncio
+import math
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+from google.genai import types
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ChatSession:
+    """
+    Server-side state for one conversation about one document: prior turns
+    (including the model's own content, so thought signatures circulate),
+    which chunks the model has already been shown, recent query vectors with
+    their retrieval results, and the shared model-side cache of the document
+    it holds a reference on, if any.
+    """
+
+    def __init__(self, document_id: str, history: Optional[List[dict]] = None):
+        self.session_id = uuid.uuid4().hex
+        self.document_id = document_id
+        self.turns: List[types.Content] = []
+        self.sent_chunks: Set[str] = set()
+        self.recent_queries: List[Tuple[List[float], Tuple[List[str], List[dict]]]] = []
+        self.document_cache: Optional["DocumentCache"] = None
+        self.last_used = time.time()
+        self.lock = asyncio.Lock()
+
+        # Seed from client-side history (e.g. a conversation started before sessions existed)
+        for message in history or []:
+            text = message.get("content") or message.get("text")
+            if not text:
+                continue
+            role = "model" if message.get("role") in ("assistant", "model") else "user"
+            self.turns.append(types.Content(role=role, parts=[types.Part(text=text)]))
+
+    @property
+    def cached_content(self) -> Optional[str]:
+        """Name of the model-side cached content holding the document, while there is one."""
+        return self.document_cache.name if self.document_cache is not None else None
+
+    def find_similar(self, query_vector: List[float], threshold: float):
+        """Retrieval results of an earlier query that is (nearly) the same question."""
+        best, best_score = None, threshold
+        for vector, results in self.recent_queries:
+            score = _cosine(query_vector, vector)
+            if score >= best_score:
+                best, best_score = results, score
+        return best
+
+    def remember_query(self, query_vector: List[float], results, limit: int = 20):
+        self.recent_queries.append((query_vector, results))
+        del self.recent_queries[:-limit]
+
+    def add_turn(self, user: types.Content, model: types.Content, max_turns: int):
+        self.turns.extend([user, model])
+        if len(self.turns) > max_turns * 2:
+            self.turns = self.turns[-max_turns * 2:]
+            # Context shown in dropped turns is gone from the prompt; allow it to be sent again
+            self.sent_chunks.clear()
+
+
+class DocumentCache:
+    """
+    Model-side cached content holding one document for one model, shared by
+    every chat session on that document. `sessions` holds the ids of the
+    sessions referencing it; the last one to let go deletes it.
+    """
+
+    def __init__(self, key: Tuple[str, str]):
+        self.key = key
+        self.name: Optional[str] = None
+        self.expires_at = 0.0  # When the TTL runs out unless extended
+        self.attempted = False  # Creation was tried; an ineligible document is not retried per session
+        self.sessions: Set[str] = set()
+        self.lock = asyncio.Lock()
+
+    def invalidate(self):
+        """The cache is gone on the model side (expired or deleted); the next turn creates it again."""
+        self.name = None
+        self.attempted = False
+
+
+class DocumentCacheRegistry:
+    """Shared DocumentCaches by (document id, model), reference-counted by session."""
+
+    def __init__(self):
+        self._caches: Dict[Tuple[str, str], DocumentCache] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, document_id: str, model: str, session_id: str) -> DocumentCache:
+        with self._lock:
+            cache = self._caches.setdefault((document_id, model), DocumentCache((document_id, model)))
+            cache.sessions.add(session_id)
+            return cache
+
+    def release(self, cache: DocumentCache, session_id: str) -> bool:
+        """Drops the session's reference; True when it was the last and the cache should be deleted."""
+        with self._lock:
+            cache.sessions.discard(session_id)
+            if cache.sessions or self._caches.get(cache.key) is not cache:
+                return False
+            del self._caches[cache.key]
+            return True
+
+
+class SessionStore:
+    """In-memory sessions with idle TTL and a size cap (least recently used dropped first)."""
+
+    def __init__(self):
+        self.ttl_seconds = float(os.getenv("CHAT_SESSION_TTL_SECONDS", "3600"))
+        self.max_sessions = int(os.getenv("CHAT_MAX_SESSIONS", "500"))
+        self._sessions: Dict[str, ChatSession] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.time()
+            return session
+
+    def add(self, session: ChatSession):
+        with self._lock:
+            self._sessions[session.session_id] = session
+
+    def evict_idle(self) -> List[ChatSession]:
+        now = time.time()
+        with self._lock:
+            by_age = sorted(self._sessions.values(), key=lambda s: s.last_used)
+            expired = [s for s in by_age if now - s.last_used > self.ttl_seconds]
+            remaining = [s for s in by_age if s not in expired]
+            overflow = len(remaining) - self.max_sessions + 1  # Room for the one being created
+            if overflow > 0:
+                expired.extend(remaining[:overflow])
+            for session in expired:
+                self._sessions.pop(session.session_id, None)
+        return expired
+
+    def drain(self) -> List[ChatSession]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        return sessions
@@ -0,0 +1,34 @@
+import os
+import sqlite3
+import threading
+from typing import List
+
+
+class SqliteStore:
+    """
+    One SQLite file shared by every thread of the process: a single connection
+    (check_same_thread=False) in WAL mode, with each statement run under
+    `_lock`. Subclasses return their CREATE statements from `_schema` and may
+    add `pragmas` run before them.
+    """
+    pragmas: List[str] = []
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in self.pragmas + self._schema():
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def _schema(self) -> List[str]:
+        return []
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,218 @@
+"""
+Per-request tracing and Prometheus metrics.
+
+A trace is started for every HTTP request (and every background job) and
+carried in a context variable, so code anywhere below it can open a span()
+without passing anything around. Each span records its duration plus
+attributes such as chunk counts, tokens and retries, and feeds the
+subtext_stage_duration_seconds histogram. Traces slower than
+SLOW_REQUEST_LOG_SECONDS are appended to SLOW_REQUEST_LOG_PATH as JSON lines.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+
+REQUEST_SECONDS = Histogram(
+    "subtext_request_duration_seconds", "HTTP request latency, including streamed bodies",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "subtext_stage_duration_seconds", "Duration of one pipeline stage (span)",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+CHUNKS = Counter("subtext_chunks_total", "Chunks produced by ingest", ["stage"])
+LLM_CALLS = Counter("subtext_llm_calls_total", "Gemini generate_content calls", ["operation", "outcome"])
+LLM_RETRIES = Counter("subtext_llm_retries_total", "Retried Gemini calls", ["operation"])
+LLM_TOKENS = Counter("subtext_llm_tokens_total", "Gemini tokens by kind", ["operation", "kind"])
+LLM_COST = Counter("subtext_llm_cost_usd_total", "Estimated Gemini spend from token prices", ["operation"])
+LLM_COALESCED = Counter("subtext_llm_coalesced_total", "Gemini calls served by an identical call already in flight", ["operation"])
+CHAT_RETRIEVAL = Counter("subtext_chat_retrieval_total", "Chat turns by retrieval path", ["path"])
+LIMITER_CONCURRENCY = Gauge("subtext_rate_limiter_concurrency", "Current adaptive concurrency window", ["limiter"])
+LIMITER_THROTTLED = Counter("subtext_rate_limiter_throttled_total", "429 responses seen by a limiter", ["limiter"])
+LIMITER_WAIT_SECONDS = Histogram(
+    "subtext_rate_limiter_wait_seconds", "Time a call waited for admission (queue, cool-down and quotas)",
+    ["limiter"], buckets=LATENCY_BUCKETS
+)
+
+# USD per million tokens; thinking tokens are billed as output
+PRICE_INPUT = float(os.getenv("LLM_PRICE_INPUT_PER_MTOK", "0.50"))
+PRICE_CACHED_INPUT = float(os.getenv("LLM_PRICE_CACHED_INPUT_PER_MTOK", "0.05"))
+PRICE_OUTPUT = float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", "3.00"))
+
+SLOW_REQUEST_LOG_SECONDS = float(os.getenv("SLOW_REQUEST_LOG_SECONDS", "0"))  # 0 disables the log
+SLOW_REQUEST_LOG_PATH = os.getenv("SLOW_REQUEST_LOG_PATH", "./slow_requests.jsonl")
+_slow_log_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, name: str, attributes: dict):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.spans: List[dict] = []
+        self._lock = threading.Lock()  # Spans also close on ingest worker threads
+
+    def add(self, record: dict):
+        with self._lock:
+            self.spans.append(record)
+
+    def to_dict(self, duration: float) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["offset_ms"])
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.wall_started,
+            "duration_ms": round(duration * 1000, 1),
+            **self.attributes,
+            "spans": spans,
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """Starts a trace for one request or job; writes it to the slow log if it runs long."""
+    current = Trace(name, attributes)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        duration = time.perf_counter() - current.started
+        if SLOW_REQUEST_LOG_SECONDS and duration >= SLOW_REQUEST_LOG_SECONDS:
+            line = json.dumps(current.to_dict(duration), default=str)
+            with _slow_log_lock, open(SLOW_REQUEST_LOG_PATH, "a") as f:
+                f.write(line + "\n")
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times a block as one stage. Yields the attribute dict so the block can
+    add results (token counts, retries) before the span closes.
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        record_span(name, duration, start=start, **attributes)
+
+
+def record_span(name: str, duration: float, start: Optional[float] = None, **attributes):
+    """Records an already measured stage, e.g. time accumulated across a pipelined loop."""
+    STAGE_SECONDS.labels(stage=name).observe(duration)
+    current = _current_trace.get()
+    if current is not None:
+        start = start if start is not None else time.perf_counter() - duration
+        current.add({
+            "name": name,
+            "offset_ms": round((start - current.started) * 1000, 1),
+            "duration_ms": round(duration * 1000, 1),
+            **attributes,
+        })
+
+
+def record_llm_usage(operation: str, usage, attributes: dict):
+    """Adds token counts from a response's usage_metadata to the span attributes and counters."""
+    if usage is None:
+        return
+    tokens = {
+        "input": usage.prompt_token_count or 0,
+        "cached": usage.cached_content_token_count or 0,
+        "output": usage.candidates_token_count or 0,
+        "thinking": usage.thoughts_token_count or 0,
+    }
+    for kind, count in tokens.items():
+        if count:
+            LLM_TOKENS.labels(operation=operation, kind=kind).inc(count)
+        attributes[f"{kind}_tokens"] = attributes.get(f"{kind}_tokens", 0) + count
+
+    cost = (
+        (tokens["input"] - tokens["cached"]) * PRICE_INPUT
+        + tokens["cached"] * PRICE_CACHED_INPUT
+        + (tokens["output"] + tokens["thinking"]) * PRICE_OUTPUT
+    ) / 1_000_000
+    LLM_COST.labels(operation=operation).inc(cost)
+    attributes["cost_usd"] = round(attributes.get("cost_usd", 0) + cost, 6)
+
+
+class TimedIterator:
+    """Wraps a lazy stage so the time spent producing its items can be reported afterwards."""
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.seconds = 0.0
+        self.items = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self._iterator)
+        finally:
+            self.seconds += time.perf_counter() - start
+        self.items += 1
+        return item
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: one trace and one latency observation per HTTP request.
+    Pure ASGI rather than BaseHTTPMiddleware so streamed bodies are timed to
+    their last byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        with trace(f"{scope['method']} {scope['path']}") as current:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                current.attributes["status"] = status["code"]
+                # Route template, not the raw path, to keep label cardinality bounded
+                route = getattr(scope.get("route"), "path", "unmatched")
+                REQUEST_SECONDS.labels(
+                    method=scope["method"], route=route, status=str(status["code"])
+                ).observe(time.perf_counter() - start)
+
+
+def metrics_payload():
+    return generate_latest(), CONTENT_TYPE_LATEST
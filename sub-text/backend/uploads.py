@@ -0,0 +1,120 @@
+"""
+Receives uploaded PDFs for /analyze, /analyze/stream and /jobs.
+
+An upload up to UPLOAD_SPOOL_BYTES is read into memory and handed to
+PyMuPDF as a stream, so the request path never touches the disk. Larger
+uploads are copied to a private temporary file (unique name, removed by
+Upload.close) and parsed from there, which also lets ingest split very long
+documents across parse worker processes without sending them the bytes.
+
+Uploads above MAX_UPLOAD_BYTES or MAX_UPLOAD_PAGES, and files PyMuPDF cannot
+open, are rejected with UploadRejected before any parsing or embedding.
+Every blocking step (copying a spooled upload, opening the PDF) runs on a
+worker thread.
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+# 0 = unlimited
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+MAX_UPLOAD_PAGES = int(os.getenv("MAX_UPLOAD_PAGES", "2000"))
+# Uploads larger than this go to a temporary file instead of memory
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(16 * 1024 * 1024)))
+
+
+class UploadRejected(Exception):
+    """An upload that will not be analyzed; status_code is the HTTP status to answer with."""
+
+    def __init__(self, detail: str, status_code: int = 413):
+        super().__init__(detail)
+        self.status_code = status_code
+
+
+class Upload:
+    """A received PDF: its bytes in `data`, or, above UPLOAD_SPOOL_BYTES, a temporary file at `path`."""
+
+    def __init__(self, filename: str, data: Optional[bytes] = None, path: Optional[str] = None):
+        self.filename = filename
+        self.data = data
+        self.path = path
+        self.size = len(data) if data is not None else os.path.getsize(path)
+        self.pages = 0
+
+    def ingest_kwargs(self, source: Optional[str] = None) -> dict:
+        """
+        Arguments for ingest_document: the temporary file, or the in-memory
+        bytes named by the filename. Versioned only under an explicit source.
+        """
+        return {"file_path": self.path or self.filename, "data": self.data, "source": source}
+
+    def save(self, path: str):
+        """
+        Persists the upload at `path`, moving the temporary file rather than
+        copying it. The file at `path` then belongs to the caller; close() no
+        longer touches it.
+        """
+        if self.path is not None:
+            shutil.move(self.path, path)
+            self.path = None
+        else:
+            with open(path, "wb") as f:
+                f.write(self.data)
+
+    def close(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+        self.data = None
+
+
+def _spool(file, filename: str) -> Upload:
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(prefix="upload_", suffix=".pdf", delete=False) as f:
+        shutil.copyfileobj(file, f, 1 << 20)
+    return Upload(filename, path=f.name)
+
+
+def _inspect(upload: Upload):
+    """Opens the PDF once to reject unreadable, encrypted or overlong documents."""
+    from pdf_extract import open_pdf
+
+    try:
+        doc = open_pdf(upload.data if upload.data is not None else upload.path)
+    except Exception as e:
+        raise UploadRejected(f"{upload.filename} is not a readable PDF: {e}", status_code=400)
+    try:
+        if doc.needs_pass:
+            raise UploadRejected(f"{upload.filename} is password protected", status_code=400)
+        upload.pages = doc.page_count
+    finally:
+        doc.close()
+    if MAX_UPLOAD_PAGES and upload.pages > MAX_UPLOAD_PAGES:
+        raise UploadRejected(f"{upload.filename} has {upload.pages} pages; the limit is {MAX_UPLOAD_PAGES}")
+
+
+async def receive_upload(file) -> Upload:
+    """
+    Reads a FastAPI UploadFile into an Upload and checks its limits. The
+    caller owns the result and must close() it once ingest is done.
+    """
+    size = file.size
+    if size is None:
+        size = await asyncio.to_thread(file.file.seek, 0, os.SEEK_END)
+        await file.seek(0)
+    if MAX_UPLOAD_BYTES and size > MAX_UPLOAD_BYTES:
+        raise UploadRejected(f"{file.filename} is {size / 1e6:.1f}MB; the limit is {MAX_UPLOAD_BYTES / 1e6:.1f}MB")
+
+    filename = os.path.basename(file.filename or "upload.pdf")
+    if size > UPLOAD_SPOOL_BYTES:
+        upload = await asyncio.to_thread(_spool, file.file, filename)
+    else:
+        upload = Upload(filename, data=await file.read())
+    try:
+        await asyncio.to_thread(_inspect, upload)
+    except BaseException:
+        upload.close()
+        raise
+    return upload
@@ -16,17 +16,19 @@ def test_analyze():
             print(f"Red Flags Found: {len(data.get('red_flags', []))}")
             for flag in data.get('red_flags', []):
                 print(f" - [{flag['risk_level']}] {flag['category']}: {flag['description']}")
+            return data.get('document_id')
         else:
             print(f"FAILED: /analyze returned {response.status_code}")
             print(response.text)
     except Exception as e:
         print(f"ERROR: {e}")
 
-def test_chat():
+def test_chat(document_id):
     print("\n--- Testing /chat RAG Endpoint ---")
     payload = {
         "query": "Can I cancel my subscription without paying?",
-        "history": []
+        "history": [],
+        "document_id": document_id
     }
     try:
         response = requests.post(f"{BASE_URL}/chat", json=payload)
@@ -40,7 +42,7 @@ def test_chat():
         print(f"ERROR: {e}")
 
 if __name__ == "__main__":
-    test_analyze()
+    document_id = test_analyze()
     # Wait a bit for indexing if needed (though analyze usually waits)
     time.sleep(2) 
-    test_chat()
+    test_chat(document_id)
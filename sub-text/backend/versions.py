@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+
+from sqlite_store import SqliteStore
+
+
+class VersionRegistry(SqliteStore):
+    """
+    Which indexed document is the latest version of each source, plus that
+    version's per-page text hashes. A source is only ever named explicitly:
+    the ?source= an upload is sent with, or a file's absolute path in batch
+    runs. Uploads without one are not versioned. Ingest uses it to diff a new
+    upload against the previous version of the same source and re-embed only
+    what changed.
+    """
+
+    def __init__(self, path: str = "./versions.sqlite3"):
+        super().__init__(path)
+
+    def _schema(self) -> List[str]:
+        return [
+            """
+            CREATE TABLE IF NOT EXISTS versions (
+                source TEXT NOT NULL,
+                document_id TEXT NOT NULL,
+                previous_document_id TEXT,
+                page_hashes TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (source, document_id)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_versions_created ON versions(source, created_at)",
+        ]
+
+    def latest(self, source: str, exclude: Optional[str] = None) -> Optional[dict]:
+        """Most recently recorded version of `source` other than `exclude`."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT document_id, previous_document_id, page_hashes FROM versions "
+                "WHERE source = ? AND document_id != ? ORDER BY created_at DESC LIMIT 1",
+                (source, exclude or "")
+            ).fetchone()
+        if row is None:
+            return None
+        return {"document_id": row[0], "previous_document_id": row[1], "page_hashes": json.loads(row[2])}
+
+    def get(self, source: str, document_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT previous_document_id, page_hashes FROM versions WHERE source = ? AND document_id = ?",
+                (source, document_id)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"document_id": document_id, "previous_document_id": row[0], "page_hashes": json.loads(row[1])}
+
+    def record(self, source: str, document_id: str, page_hashes: List[str],
+               previous_document_id: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO versions (source, document_id, previous_document_id, page_hashes, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (source, document_id, previous_document_id, json.dumps(page_hashes), time.time())
+            )
+            self._conn.commit()
+
+    def touch(self, source: str, document_id: str):
+        """Marks an existing version as the latest again (e.g. an older version re-uploaded)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE versions SET created_at = ? WHERE source = ? AND document_id = ?",
+                (time.time(), source, document_id)
+            )
+            self._conn.commit()
+
+
+_registry: Optional[VersionRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_version_registry() -> Optional[VersionRegistry]:
+    """Returns the process-wide registry, or None when disabled via INCREMENTAL_INGEST=0."""
+    global _registry
+    if os.getenv("INCREMENTAL_INGEST", "1") == "0":
+        return None
+    with _registry_lock:
+        if _registry is None:
+            _registry = VersionRegistry(os.getenv("VERSIONS_DB_PATH", "./versions.sqlite3"))
+        return _registry
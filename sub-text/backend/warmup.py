@@ -0,0 +1,166 @@
+"""
+Startup work for the API, run in the background so the server listens at once.
+
+main.py imports nothing heavy at module level (chromadb, google-genai and
+PyMuPDF cost about half a second together). The FastAPI lifespan starts a
+Warmup, which runs these steps (blocking work on worker threads):
+
+- services: imports the pipeline, builds the LegalAgent and JobManager and
+  starts the job workers
+- vector_store: opens the store and registers persisted documents
+- category_embeddings: embeds the fixed audit category queries
+- connections: opens the Gemini clients' HTTPS connections, alongside the
+  two steps above
+
+GET /ready answers 503 until every step has run, then 200; point the Cloud
+Run startup probe at it. Requests that arrive earlier wait only for the
+services step. If that step fails, the next request retries it (concurrent
+requests share one attempt) and the remaining steps run once it succeeds.
+A later step that fails is reported by /ready without blocking readiness,
+since requests redo that work on demand.
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+
+class Warmup:
+    def __init__(self):
+        self.steps: Dict[str, dict] = {}
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._services: Optional[asyncio.Future] = None
+        self._retry: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._services = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def ready(self) -> bool:
+        return self.finished is not None and self.steps.get("services", {}).get("ok", False)
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "elapsed_ms": round(((self.finished or time.perf_counter()) - self.started) * 1000, 1),
+            "steps": self.steps,
+        }
+
+    async def agent(self):
+        """The LegalAgent, once the services step has built it."""
+        agent, _ = await self._get_services()
+        return agent
+
+    async def job_manager(self):
+        _, job_manager = await self._get_services()
+        return job_manager
+
+    async def _get_services(self):
+        services = self._services
+        if services.done() and not services.cancelled() and services.exception() is not None:
+            # The services step failed: retry it rather than failing every request until a restart
+            if self._retry is None or self._retry.done():
+                self._retry = asyncio.create_task(self._retry_services(services))
+            await asyncio.shield(self._retry)
+        return await asyncio.shield(self._services)
+
+    async def _retry_services(self, failed: asyncio.Future):
+        if self._services is not failed:
+            return
+        self.finished = None  # /ready waits for the steps after services again
+        try:
+            services = await self._step("services", self._start_services())
+        except Exception:
+            self._finish()
+            raise
+        self._services = asyncio.get_running_loop().create_future()
+        self._services.set_result(services)
+        self._task = asyncio.create_task(self._run_after_services(services))
+
+    async def _step(self, name: str, work):
+        start = time.perf_counter()
+        try:
+            result = await work
+        except Exception as e:
+            self.steps[name] = {"ok": False, "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                                "error": str(e)}
+            print(f"WARNING: Warmup step {name} failed: {e}")
+            raise
+        self.steps[name] = {"ok": True, "duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+        return result
+
+    async def _steps(self, *steps):
+        """Runs (name, work) steps in order, moving past failures."""
+        for name, work in steps:
+            try:
+                await self._step(name, work())
+            except Exception:
+                pass  # Logged and reported by /ready; requests redo the work on demand
+
+    async def _start_services(self):
+        agent, job_manager = await asyncio.to_thread(_create_services)
+        await job_manager.start()
+        return agent, job_manager
+
+    async def _run(self):
+        try:
+            try:
+                services = await self._step("services", self._start_services())
+            except Exception as e:
+                self._services.set_exception(e)
+                return
+            self._services.set_result(services)
+            await self._warm(services)
+        finally:
+            if not self._services.done():
+                self._services.cancel()  # Shut down mid-step: don't leave requests waiting
+            self._finish()
+
+    async def _run_after_services(self, services):
+        """The steps after a retried services step."""
+        try:
+            await self._warm(services)
+        finally:
+            self._finish()
+
+    async def _warm(self, services):
+        agent, _ = services
+        from db import get_vector_store
+
+        # Connection setup is network-bound and independent of the store, so it overlaps with it
+        await asyncio.gather(
+            self._steps(
+                ("vector_store", lambda: asyncio.to_thread(get_vector_store)),
+                ("category_embeddings", lambda: asyncio.to_thread(agent.prepare_category_embeddings)),
+            ),
+            self._steps(("connections", agent.prime_connections)),
+        )
+
+    def _finish(self):
+        self.finished = time.perf_counter()
+        print(f"Warmup finished in {(self.finished - self.started) * 1000:.0f}ms")
+
+    async def stop(self):
+        for task in (self._task, self._retry):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*[task for task in (self._task, self._retry) if task is not None], return_exceptions=True)
+        if self._services is None or self._services.cancelled() or self._services.exception() is not None:
+            return
+        from db import close_shared_clients
+
+        agent, job_manager = self._services.result()
+        await job_manager.stop()
+        await agent.close_sessions()
+        await close_shared_clients()
+
+
+def _create_services():
+    from agent import LegalAgent
+    from jobs import JobManager
+
+    agent = LegalAgent()
+    return agent, JobManager(agent)
@@ -4,13 +4,14 @@ import { motion, AnimatePresence } from 'framer-motion';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 
-export default function ChatInterface() {
+export default function ChatInterface({ documentId }) {
     const [messages, setMessages] = useState([
         { role: 'assistant', content: 'I have analyzed the document. Ask me anything about specific clauses or risks.' }
     ]);
     const [input, setInput] = useState('');
     const [loading, setLoading] = useState(false);
     const [thinking, setThinking] = useState(false);
+    const [sessionId, setSessionId] = useState(null);
     const messagesEndRef = useRef(null);
 
     const scrollToBottom = () => {
@@ -36,12 +37,19 @@ export default function ChatInterface() {
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
                     query: input,
-                    history: messages
+                    history: sessionId ? [] : messages,
+                    document_id: documentId,
+                    session_id: sessionId
                 }),
             });
 
             const data = await response.json();
             setThinking(false);
+            if (!response.ok) {
+                setMessages(prev => [...prev, { role: 'assistant', content: `Error: ${data.detail}` }]);
+                return;
+            }
+            setSessionId(data.session_id);
             setMessages(prev => [...prev, { role: 'assistant', content: data.response }]);
         } catch (error) {
             setThinking(false);
@@ -61,7 +61,7 @@ export default function Dashboard({ report, fileUrl }) {
             {/* MAIN CONTENT AREA */}
             <main className="flex-grow overflow-hidden">
                 {activeTab === "summary" && <SummaryView report={report} />}
-                {activeTab === "chat" && <div className="p-4 md:p-8 h-full"><ChatInterface /></div>}
+                {activeTab === "chat" && <div className="p-4 md:p-8 h-full"><ChatInterface documentId={report.document_id} /></div>}
                 {activeTab === "focus" && <DocumentFocusView report={report} fileUrl={fileUrl} />}
             </main>
         </div>
@@ -69,7 +69,13 @@ export default function DocumentFocusView({ report, fileUrl }) {
                     <div className="font-mono font-bold text-center">
                         <div>ISSUE {currentRiskIndex + 1} / {risks.length}</div>
                         {currentRisk.page_number && (
-                            <div className="text-xs text-gray-500">PAGE {currentRisk.page_number}</div>
+                            <div className="text-xs text-gray-500">
+                                PAGE {currentRisk.page_number}
+                                {currentRisk.page_end && currentRisk.page_end !== currentRisk.page_number && `-${currentRisk.page_end}`}
+                            </div>
+                        )}
+                        {currentRisk.quote_match === "none" && (
+                            <div className="text-xs text-red-500">QUOTE NOT FOUND IN DOCUMENT</div>
                         )}
                     </div>
 
@@ -17,6 +17,11 @@ function RedFlagItem({ flag }) {
                             {flag.risk_level} Risk
                         </span>
                         <span className="text-sm font-semibold text-slate-500">{flag.category}</span>
+                        {flag.is_new && (
+                            <span className="text-xs font-bold px-2 py-0.5 rounded uppercase bg-blue-100 text-blue-700">
+                                New clause
+                            </span>
+                        )}
                     </div>
                     <h4 className="font-bold text-lg text-slate-800">{flag.description}</h4>
                 </div>
@@ -66,7 +71,12 @@ export default function ReportCard({ report }) {
 
             <div>
                 <h3 className="text-xl font-bold text-legal-blue mb-4">Detected Red Flags</h3>
-                {report.red_flags.length === 0 ? (
+                {report.failed_categories?.length > 0 && (
+                    <div className="p-4 mb-4 bg-yellow-50 rounded-lg border border-yellow-200 text-yellow-800">
+                        Analysis incomplete: {report.failed_categories.join(", ")} could not be checked. Re-run to retry.
+                    </div>
+                )}
+                {report.red_flags.length === 0 && !report.failed_categories?.length ? (
                     <div className="text-center p-8 bg-green-50 rounded-lg border border-green-200">
                         <p className="text-green-700 font-bold">No significant red flags detected.</p>
                     </div>
@@ -5,7 +5,12 @@ import { ChevronDown, ChevronUp, AlertCircle } from "lucide-react";
 export default function RiskList({ report }) {
     return (
         <div className="space-y-4">
-            {report.red_flags.length === 0 ? (
+            {report.failed_categories?.length > 0 && (
+                <div className="border-3 border-ink p-4 font-mono text-sm bg-yellow-100 shadow-brutal">
+                    ANALYSIS_INCOMPLETE: {report.failed_categories.join(", ")} could not be checked. Re-run to retry.
+                </div>
+            )}
+            {report.red_flags.length === 0 && !report.failed_categories?.length ? (
                 <div className="border-3 border-ink p-8 text-center font-mono bg-white shadow-brutal">
                     <p>NO_RISKS_DETECTED. SYSTEM_CLEAR.</p>
                 </div>